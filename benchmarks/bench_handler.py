@@ -0,0 +1,367 @@
+# benchmarks/bench_handler.py
+"""
+Бенчмарк конвейера пересылки без Telegram: сообщения проходят через
+настоящий обработчик (forward_message, сборщик медиагрупп, объединитель
+пачек, движок доставки, deliver_job), а вместо клиента используется
+FakeClient с настраиваемой задержкой и внедрёнными ошибками.
+
+Для каждого сценария выводятся пропускная способность (доставок в секунду),
+p50/p99 задержки доставки, число вызовов API на сообщение и пиковый объём
+памяти (tracemalloc, отдельным прогоном).
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_handler [--scenarios text,albums] [--messages 2000]
+    python -m benchmarks.bench_handler --json results.json
+    python -m benchmarks.bench_handler --compare baseline.json --max-regression 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+
+from pyrogram import Client
+
+from benchmarks.fake_client import FakeClient
+from benchmarks.messages import generate_messages
+from src.accounts import SenderAccount, account_pool
+from src.batcher import message_batcher
+from src.capabilities import capability_cache
+from src.config import settings
+from src.dedup import dedup_cache
+from src.delivery import delivery_engine
+from src.logger import ROOT_LOGGER_NAME
+from src.message_handler import create_handler, deliver_job, media_group_assembler
+from src.outbox import outbox
+from src.rate_limiter import TokenBucket, rate_limiter
+from src.routing import RoutingTable, set_routing_table
+
+
+@dataclass
+class Scenario:
+    name: str
+    description: str
+    mix: dict
+    # Параметры FakeClient
+    client: dict = field(default_factory=dict)
+    # Переопределения настроек бота на время сценария
+    settings: dict = field(default_factory=dict)
+    # Доля сообщений первого исходного чата (0 — чаты равны)
+    skew: float = 0.0
+    # Все исходные чаты пересылаются в одни и те же чаты назначения
+    shared_destinations: bool = False
+
+
+SCENARIOS = [
+    Scenario("text", "Только текст", {"text": 1.0}),
+    Scenario("media", "Одиночные медиа", {"media": 1.0}),
+    Scenario("albums", "Только альбомы", {"album": 1.0}),
+    Scenario("mixed", "Текст 70%, медиа 20%, альбомы 10%", {"text": 0.7, "media": 0.2, "album": 0.1}),
+    Scenario(
+        "batched",
+        "Только текст, объединение в пачки 20 мс",
+        {"text": 1.0},
+        settings={"batch_window_ms": 20},
+    ),
+    Scenario(
+        "flood",
+        "Смешанный поток, 2% FloodWait",
+        {"text": 0.7, "media": 0.2, "album": 0.1},
+        client={"flood_wait_rate": 0.02},
+    ),
+    Scenario(
+        "fallback",
+        "Смешанный поток, 20% сбоев пересылки, 1% удалённых сообщений",
+        {"text": 0.7, "media": 0.2, "album": 0.1},
+        client={"forward_error_rate": 0.2, "message_id_invalid_rate": 0.01},
+    ),
+    Scenario(
+        "protected",
+        "Смешанный поток, половина исходных чатов защищена от пересылки",
+        {"text": 0.7, "media": 0.2, "album": 0.1},
+        client={"protected_share": 0.5},
+    ),
+    Scenario(
+        "heavy",
+        "Текст 60%, медиа 20%, альбомы 20%; пересылка медиа занимает 0.5 с",
+        {"text": 0.6, "media": 0.2, "album": 0.2},
+        client={"media_latency": "const:0.5"},
+    ),
+    Scenario(
+        "noisy",
+        "Только текст, 90% из одного чата, общие чаты назначения, 30 сообщ./с на чат",
+        {"text": 1.0},
+        settings={"rate_limit_destination": 30, "rate_limit_destination_burst": 5},
+        skew=0.9,
+        shared_destinations=True,
+    ),
+]
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(q * (len(values) - 1))))
+    return values[index]
+
+
+def prepare_environment(scenario, args):
+    """
+    Сбрасывает глобальное состояние бота перед сценарием и снимает
+    ограничения скорости (измеряется сам конвейер, а не лимиты Telegram).
+    """
+    settings.batch_window_ms = 0
+    settings.flood_retry_base_delay = 0.01
+    if not args.rate_limits:
+        settings.rate_limit_destination = 1e9
+        settings.rate_limit_destination_burst = 1e9
+        rate_limiter.account = TokenBucket(1e9, 1e9)
+    rate_limiter.destinations.clear()
+    for key, value in scenario.settings.items():
+        setattr(settings, key, value)
+    dedup_cache.entries.clear()
+    capability_cache.routes.clear()
+
+
+async def wait_until_idle(poll=0.005):
+    """
+    Ждёт, пока в сборщике, объединителе и движке доставки не останется заданий.
+    """
+    idle_checks = 0
+    while idle_checks < 3:
+        await asyncio.sleep(poll)
+        busy = (
+            media_group_assembler.in_flight
+            or media_group_assembler.tasks
+            or message_batcher.pending
+            or message_batcher.tasks
+            or any(message_batcher.ready.values())
+            or delivery_engine.pending()
+        )
+        idle_checks = 0 if busy else idle_checks + 1
+
+
+async def run_scenario(scenario, args, outbox_file):
+    prepare_environment(scenario, args)
+    client_options = dict(scenario.client)
+    protected_share = client_options.pop("protected_share", 0)
+    client_options["protected_sources"] = [
+        -1001000000000 - i for i in range(round(args.sources * protected_share))
+    ]
+    client = FakeClient(latency=args.latency, seed=args.seed, **client_options)
+    messages = generate_messages(
+        args.messages, args.sources, scenario.mix, seed=args.seed, skew=scenario.skew
+    )
+    forwarding_config = {
+        -1001000000000 - i: [
+            -1002000000000 - (0 if scenario.shared_destinations else i * args.destinations) - d
+            for d in range(args.destinations)
+        ]
+        for i in range(args.sources)
+    }
+    set_routing_table(RoutingTable(forwarding_config, {}))
+    account_pool.accounts.clear()
+    account_pool.add(SenderAccount("main", client, rate_limiter, owns_client=False))
+
+    client.media_ids = {(m.chat.id, m.id) for m in messages if m.media}
+
+    submitted = {}  # {(chat_id, message_id): время постановки}
+    latencies = []
+    text_latencies = []  # Задержки заданий полосы text
+    quiet_latencies = []  # Задержки сообщений всех чатов, кроме первого
+
+    async def sender(job, account):
+        await deliver_job(account.client, job, account)
+        now = time.perf_counter()
+        for message in job.messages or ():
+            latency = now - submitted[(message.chat.id, message.id)]
+            latencies.append(latency)
+            if job.lane == "text":
+                text_latencies.append(latency)
+            if message.chat.id != -1001000000000:
+                quiet_latencies.append(latency)
+
+    outbox.db_file = outbox_file
+    await outbox.start()
+    delivery_engine.set_sender(sender)
+    handler = create_handler()
+
+    # Как диспетчер Pyrogram: обновления из общей очереди разбирают
+    # args.workers задач-обработчиков
+    updates = asyncio.Queue()
+
+    async def dispatcher_worker():
+        while True:
+            message = await updates.get()
+            try:
+                await handler(client, message)
+            finally:
+                updates.task_done()
+
+    dispatchers = [asyncio.create_task(dispatcher_worker()) for _ in range(args.workers)]
+
+    started = time.perf_counter()
+    for i, message in enumerate(messages):
+        message.publish()
+        submitted[(message.chat.id, message.id)] = time.perf_counter()
+        updates.put_nowait(message)
+        if args.rate:
+            await asyncio.sleep(1 / args.rate)
+        elif i % 50 == 0:
+            # Даём поработать обработчикам, как при живом потоке обновлений
+            await asyncio.sleep(0)
+    await updates.join()
+    await wait_until_idle()
+    elapsed = time.perf_counter() - started
+
+    for task in dispatchers:
+        task.cancel()
+    await asyncio.gather(*dispatchers, return_exceptions=True)
+
+    await delivery_engine.stop()
+    await outbox.stop()
+
+    return {
+        "scenario": scenario.name,
+        "messages": len(messages),
+        "deliveries": len(latencies),
+        "seconds": round(elapsed, 3),
+        "throughput": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "p99_text_ms": round(percentile(text_latencies, 0.99) * 1000, 2),
+        "p99_quiet_ms": round(percentile(quiet_latencies, 0.99) * 1000, 2),
+        "calls_per_message": round(client.total_calls / len(messages), 3),
+        "calls": dict(client.calls),
+        "errors": dict(client.errors),
+    }
+
+
+def measure_peak_memory(scenario, args, outbox_file):
+    tracemalloc.start()
+    try:
+        asyncio.run(run_scenario(scenario, args, outbox_file))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / 2**20, 2)
+
+
+def compare(results, baseline_file, max_regression):
+    """
+    Сравнивает результаты с сохранёнными ранее. Возвращает список регрессий.
+    """
+    with open(baseline_file, "r", encoding="utf-8") as f:
+        baseline = {r["scenario"]: r for r in json.load(f)}
+
+    regressions = []
+    for result in results:
+        base = baseline.get(result["scenario"])
+        if base is None:
+            continue
+        if result["throughput"] < base["throughput"] * (1 - max_regression):
+            regressions.append(
+                f"{result['scenario']}: пропускная способность {result['throughput']} < {base['throughput']}"
+            )
+        if result.get("p99_text_ms", 0) > base.get("p99_text_ms", float("inf")) * (
+            1 + max_regression
+        ):
+            regressions.append(
+                f"{result['scenario']}: p99 текста {result['p99_text_ms']} мс > {base['p99_text_ms']} мс"
+            )
+        if result["p99_ms"] > base["p99_ms"] * (1 + max_regression):
+            regressions.append(
+                f"{result['scenario']}: p99 {result['p99_ms']} мс > {base['p99_ms']} мс"
+            )
+        if result["calls_per_message"] > base["calls_per_message"] * (1 + max_regression):
+            regressions.append(
+                f"{result['scenario']}: вызовов API на сообщение {result['calls_per_message']} > {base['calls_per_message']}"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--scenarios",
+        default=",".join(s.name for s in SCENARIOS),
+        help="сценарии через запятую",
+    )
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--sources", type=int, default=10)
+    parser.add_argument("--destinations", type=int, default=3)
+    parser.add_argument(
+        "--latency",
+        default="lognormal:0.002:0.5",
+        help="распределение задержки API (const:X, uniform:A:B, exp:M, lognormal:MED:SIGMA)",
+    )
+    parser.add_argument(
+        "--rate", type=float, default=0, help="сообщений в секунду (0 — без пауз)"
+    )
+    parser.add_argument(
+        "--rate-limits",
+        action="store_true",
+        help="не отключать ограничитель скорости бота",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=Client.WORKERS,
+        help="обработчиков обновлений (как workers у pyrogram.Client)",
+    )
+    parser.add_argument("--no-memory", action="store_true", help="не измерять память")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="сохранить результаты в файл")
+    parser.add_argument("--compare", help="сравнить с результатами из файла")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    # Логи бота в бенчмарке не нужны
+    logging.getLogger(ROOT_LOGGER_NAME).setLevel(logging.CRITICAL)
+
+    by_name = {s.name: s for s in SCENARIOS}
+    scenarios = [by_name[name] for name in args.scenarios.split(",")]
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        outbox_file = os.path.join(tmp_dir, "outbox.db")
+        print(
+            f"{'сценарий':<10} {'сообщ.':>7} {'доставок':>9} {'дост./с':>9} "
+            f"{'p50 мс':>8} {'p99 мс':>8} {'p99 текст':>10} {'p99 тихих':>10} "
+            f"{'вызовов/сообщ.':>15} {'пик МиБ':>8}"
+        )
+        for scenario in scenarios:
+            result = asyncio.run(run_scenario(scenario, args, outbox_file))
+            result["peak_mib"] = (
+                None if args.no_memory else measure_peak_memory(scenario, args, outbox_file)
+            )
+            results.append(result)
+            peak = "-" if result["peak_mib"] is None else f"{result['peak_mib']:.2f}"
+            print(
+                f"{result['scenario']:<10} {result['messages']:>7} {result['deliveries']:>9} "
+                f"{result['throughput']:>9.1f} {result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f} "
+                f"{result['p99_text_ms']:>10.2f} {result['p99_quiet_ms']:>10.2f} "
+                f"{result['calls_per_message']:>15.3f} {peak:>8}"
+            )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.max_regression)
+        for line in regressions:
+            print(f"РЕГРЕССИЯ {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
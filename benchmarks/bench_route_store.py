@@ -0,0 +1,131 @@
+# benchmarks/bench_route_store.py
+"""
+Бенчмарк хранения маршрутов: JSON-файл, который разбирается и целиком
+перезаписывается при каждом запуске, против базы маршрутов RouteStore.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_route_store [--sources 5000] [--destinations 20]
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from src.route_store import RouteStore
+
+
+def build_config(sources, destinations, dest_pool):
+    rng = random.Random(0)
+    source_ids = [-1000000000000 - i for i in range(sources)]
+    dest_ids = [-2000000000000 - i for i in range(dest_pool)]
+    forwarding_config = {s: rng.sample(dest_ids, destinations) for s in source_ids}
+    chat_info = {
+        chat_id: {"username": f"chat_{-chat_id}", "type": "ChatType.CHANNEL"}
+        for chat_id in source_ids + dest_ids
+    }
+    return source_ids, forwarding_config, chat_info
+
+
+def legacy_start(path, source_ids, forwarding_config, chat_info):
+    """
+    Запуск в прежнем виде: разбор файла и его полная перезапись save_config.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    forwarding_config = {int(k): v for k, v in config["FORWARDING_CONFIG"].items()}
+    chat_info = {int(k): v for k, v in config.get("CHAT_INFO", {}).items()}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "SOURCE_CHAT_IDS": config["SOURCE_CHAT_IDS"],
+                "FORWARDING_CONFIG": forwarding_config,
+                "CHAT_INFO": chat_info,
+            },
+            f,
+            indent=4,
+            ensure_ascii=False,
+        )
+
+
+def store_start(store, path):
+    """
+    Запуск с базой маршрутов: проверка хеша файла, загрузка и запись
+    результатов проверки чатов (все доступны, информация о чатах не
+    изменилась — ни одна строка не меняется, файл не перезаписывается).
+    """
+    store.sync_from_json(path)
+    _, _, chat_info = store.load()
+    if store.remove_chats((), chat_info):
+        store.export_json(path)
+
+
+def timed(func, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sources", type=int, default=5000)
+    parser.add_argument("--destinations", type=int, default=20)
+    parser.add_argument("--dest-pool", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    source_ids, forwarding_config, chat_info = build_config(
+        args.sources, args.destinations, args.dest_pool
+    )
+    routes = args.sources * args.destinations
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, "legacy.json")
+        with open(legacy_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "SOURCE_CHAT_IDS": source_ids,
+                    "FORWARDING_CONFIG": forwarding_config,
+                    "CHAT_INFO": chat_info,
+                },
+                f,
+                indent=4,
+            )
+        legacy_time = timed(
+            lambda: legacy_start(legacy_path, source_ids, forwarding_config, chat_info),
+            args.repeat,
+        )
+
+        path = os.path.join(tmp, "forward_config.json")
+        store = RouteStore(os.path.join(tmp, "forward_routes.db"))
+        store.replace(source_ids, forwarding_config, chat_info)
+        export_time = timed(lambda: store.export_json(path), 1)
+        store_time = timed(lambda: store_start(store, path), args.repeat)
+
+        # Точечное изменение: убрать один недоступный чат назначения
+        dest_id = forwarding_config[source_ids[0]][0]
+        started = time.perf_counter()
+        store.remove_chats([dest_id])
+        remove_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        sources = store.sources_of(forwarding_config[source_ids[1]][0])
+        lookup_time = time.perf_counter() - started
+        store.close()
+
+    print(f"Маршрутов: {routes} ({args.sources} источников x {args.destinations})")
+    print(f"До (разбор и перезапись JSON):     {legacy_time * 1000:.0f} мс на запуск")
+    print(f"После (RouteStore, без изменений): {store_time * 1000:.0f} мс на запуск")
+    print(f"Экспорт в JSON:                     {export_time * 1000:.0f} мс")
+    print(f"Удаление чата назначения:           {remove_time * 1000:.1f} мс")
+    print(
+        f"Источники чата назначения:          {lookup_time * 1e6:.0f} мкс "
+        f"({len(sources)} шт., по индексу)"
+    )
+
+
+if __name__ == "__main__":
+    main()
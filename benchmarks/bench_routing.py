@@ -0,0 +1,95 @@
+# benchmarks/bench_routing.py
+"""
+Микро-бенчмарк маршрутизации одного обновления: старый способ
+(поиск в FORWARDING_CONFIG, сборка set и префикса на каждое сообщение)
+против заранее собранной RoutingTable.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_routing [--sources 1000] [--destinations 50]
+"""
+
+import argparse
+import random
+import timeit
+
+from src.routing import RoutingTable
+
+
+def legacy_route(forwarding_config, chat_info, source_chat_id):
+    """
+    Маршрутизация в том виде, в каком она выполнялась в forward_message.
+    """
+    if source_chat_id not in forwarding_config:
+        return None
+
+    source_chat_info = ""
+    if chat_info and source_chat_id in chat_info:
+        if "username" in chat_info[source_chat_id]:
+            source_chat_info = f"@{chat_info[source_chat_id]['username']}"
+        elif "type" in chat_info[source_chat_id]:
+            source_chat_info = f"{chat_info[source_chat_id]['type']} {source_chat_id}"
+    if not source_chat_info:
+        source_chat_info = f"Чат {source_chat_id}"
+    prefix = f"📨 Переслано из: {source_chat_info}\n\n"
+
+    dest_chat_ids = set(forwarding_config[source_chat_id])
+    return dest_chat_ids, prefix
+
+
+def table_route(table, source_chat_id):
+    route = table.get(source_chat_id)
+    if route is None:
+        return None
+    return route.dest_chat_ids, route.prefix
+
+
+def build_config(sources, destinations):
+    forwarding_config = {}
+    chat_info = {}
+    for i in range(sources):
+        source_chat_id = -1000000000000 - i
+        forwarding_config[source_chat_id] = [
+            -2000000000000 - random.randrange(sources * 10) for _ in range(destinations)
+        ]
+        if i % 2:
+            chat_info[source_chat_id] = {"username": f"channel_{i}", "type": "CHANNEL"}
+        else:
+            chat_info[source_chat_id] = {"type": "SUPERGROUP"}
+    return forwarding_config, chat_info
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sources", type=int, default=1000)
+    parser.add_argument("--destinations", type=int, default=50)
+    parser.add_argument("--updates", type=int, default=200_000)
+    args = parser.parse_args()
+
+    random.seed(0)
+    forwarding_config, chat_info = build_config(args.sources, args.destinations)
+    updates = [random.choice(list(forwarding_config)) for _ in range(args.updates)]
+
+    build_time = timeit.timeit(
+        lambda: RoutingTable(forwarding_config, chat_info), number=1
+    )
+    table = RoutingTable(forwarding_config, chat_info)
+
+    legacy_time = timeit.timeit(
+        lambda: [legacy_route(forwarding_config, chat_info, s) for s in updates],
+        number=1,
+    )
+    table_time = timeit.timeit(
+        lambda: [table_route(table, s) for s in updates], number=1
+    )
+
+    print(
+        f"Маршрутов: {args.sources} x {args.destinations}, обновлений: {args.updates}"
+    )
+    print(f"Сборка RoutingTable: {build_time * 1000:.1f} мс")
+    print(f"До (FORWARDING_CONFIG): {legacy_time / args.updates * 1e9:.0f} нс/обновление")
+    print(f"После (RoutingTable):   {table_time / args.updates * 1e9:.0f} нс/обновление")
+    print(f"Ускорение: x{legacy_time / table_time:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# benchmarks/bench_rules.py
+"""
+Микро-бенчмарк правил маршрутов: проверка каждого правила по отдельности
+(отдельное регулярное выражение на ключевое слово) против правил,
+скомпилированных в SourceRules (одно выражение-префиксное дерево на источник).
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_rules [--rules 10000] [--destinations 50]
+"""
+
+import argparse
+import random
+import re
+import string
+import timeit
+
+from benchmarks.messages import FakeChat, FakeMessage
+from src.rules import SourceRules, normalize_rule
+
+
+SOURCE_CHAT_ID = -1000000000000
+
+
+def random_word(rng):
+    return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10)))
+
+
+def build_rules(rng, rules, destinations, regexes):
+    """
+    rules ключевых слов и хэштегов (около 5% — фразы из двух слов, ещё 5% —
+    слова через дефис, начинающиеся ключевым словом другого маршрута,
+    10% — исключающие), разложенные по destinations маршрутам, плюс regexes
+    регулярных выражений.
+    """
+    raw = {
+        -2000000000000 - d: {"keywords": [], "exclude_keywords": [], "hashtags": []}
+        for d in range(destinations)
+    }
+    dests = list(raw)
+    vocabulary = []
+    for i in range(rules):
+        word = random_word(rng)
+        if i % 20 == 0:
+            word = f"{word} {random_word(rng)}"
+        elif i % 20 == 7:
+            # Перекрытие через знак препинания: "foo" у одного маршрута,
+            # "foo-bar" у другого
+            word = f"{vocabulary[-1]}-{word}"
+        vocabulary.append(word)
+        rule = raw[dests[i % destinations]]
+        if i % 10 == 0:
+            rule["exclude_keywords"].append(word)
+        elif i % 10 == 1:
+            rule["hashtags"].append(word.replace(" ", "_"))
+        else:
+            rule["keywords"].append(word)
+    for i in range(regexes):
+        raw[dests[i % destinations]].setdefault("regex", []).append(rf"order\s*#{i}\d+")
+    return {dest: normalize_rule(rule) for dest, rule in raw.items()}, vocabulary
+
+
+def build_messages(rng, count, vocabulary, length, hit_rate):
+    chat = FakeChat(SOURCE_CHAT_ID)
+    messages = []
+    for i in range(count):
+        words = [random_word(rng) for _ in range(length)]
+        if rng.random() < hit_rate:
+            words[rng.randrange(length)] = rng.choice(vocabulary)
+        text = " ".join(words).capitalize()
+        if i % 3:
+            messages.append(FakeMessage(chat, i, text=text))
+        else:
+            messages.append(FakeMessage(chat, i, caption=text, media="photo"))
+    return messages
+
+
+class NaiveRules:
+    """
+    Проверка правил по одной: отдельное выражение на каждое слово.
+    """
+
+    def __init__(self, rules):
+        self.checks = []
+        for dest_chat_id, rule in rules.items():
+            checks = []
+            for field in ("keywords", "exclude_keywords", "hashtags"):
+                for word in rule.get(field, ()):
+                    pattern = r"\s+".join(re.escape(part) for part in word.split(" "))
+                    checks.append(
+                        (field, re.compile(rf"(?<!\w){pattern}(?!\w)", re.IGNORECASE))
+                    )
+            for pattern in rule.get("regex", ()):
+                checks.append(("regex", re.compile(pattern)))
+            self.checks.append((dest_chat_id, checks))
+
+    def blocked(self, messages):
+        text = "\n".join(m.text or m.caption or "" for m in messages)
+        blocked = set()
+        for dest_chat_id, checks in self.checks:
+            included = False
+            for field, regex in checks:
+                if regex.search(text):
+                    if field == "exclude_keywords":
+                        blocked.add(dest_chat_id)
+                        break
+                    included = True
+            else:
+                has_include = any(field != "exclude_keywords" for field, _ in checks)
+                if has_include and not included:
+                    blocked.add(dest_chat_id)
+        return blocked
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rules", type=int, default=10_000)
+    parser.add_argument("--destinations", type=int, default=50)
+    parser.add_argument("--regexes", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--words", type=int, default=60, help="слов в тексте сообщения")
+    parser.add_argument("--hit-rate", type=float, default=0.3)
+    parser.add_argument("--naive-messages", type=int, default=100)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    rules, vocabulary = build_rules(rng, args.rules, args.destinations, args.regexes)
+    messages = build_messages(rng, args.messages, vocabulary, args.words, args.hit_rate)
+
+    compile_time = timeit.timeit(lambda: SourceRules(SOURCE_CHAT_ID, rules), number=1)
+    compiled = SourceRules(SOURCE_CHAT_ID, rules)
+    compiled_time = timeit.timeit(
+        lambda: [compiled.blocked([m]) for m in messages], number=1
+    )
+
+    naive = NaiveRules(rules)
+    sample = messages[: args.naive_messages]
+    naive_time = timeit.timeit(lambda: [naive.blocked([m]) for m in sample], number=1)
+
+    # Результаты обоих способов должны совпадать
+    mismatches = sum(compiled.blocked([m]) != naive.blocked([m]) for m in sample)
+
+    compiled_us = compiled_time / len(messages) * 1e6
+    naive_us = naive_time / len(sample) * 1e6
+    print(
+        f"Правил: {args.rules} (+{args.regexes} regex) на {args.destinations} маршрутов, "
+        f"сообщений: {len(messages)} по {args.words} слов"
+    )
+    print(f"Компиляция SourceRules: {compile_time * 1000:.1f} мс")
+    print(f"До (по одному правилу):   {naive_us:.0f} мкс/сообщение")
+    print(f"После (SourceRules):      {compiled_us:.1f} мкс/сообщение")
+    print(f"Ускорение: x{naive_us / compiled_us:.0f}, расхождений: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# benchmarks/fake_client.py
+"""
+Заглушка pyrogram.Client для бенчмарков: реализует методы отправки,
+которые использует бот, с настраиваемой задержкой ответа и внедрением
+ошибок (FloodWait, MessageIdInvalid, сбои пересылки, защищённые чаты).
+"""
+
+import asyncio
+import math
+import random
+import types
+from collections import Counter
+
+from pyrogram.errors import (
+    ChatForwardsRestricted,
+    FloodWait,
+    InternalServerError,
+    MessageIdInvalid,
+)
+
+
+def parse_latency(spec: str):
+    """
+    Разбирает описание распределения задержки API (секунды):
+        const:0.01            — постоянная
+        uniform:0.005:0.02    — равномерная
+        exp:0.01              — экспоненциальная со средним 0.01
+        lognormal:0.01:0.5    — логнормальная с медианой 0.01 и sigma 0.5
+    """
+    kind, *params = spec.split(":")
+    params = [float(p) for p in params]
+    if kind == "const":
+        (value,) = params
+        return lambda rng: value
+    if kind == "uniform":
+        low, high = params
+        return lambda rng: rng.uniform(low, high)
+    if kind == "exp":
+        (mean,) = params
+        return lambda rng: rng.expovariate(1 / mean) if mean > 0 else 0.0
+    if kind == "lognormal":
+        median, sigma = params
+        mu = math.log(median)
+        return lambda rng: rng.lognormvariate(mu, sigma)
+    raise ValueError(f"Неизвестное распределение задержки: {spec}")
+
+
+class FakeClient:
+    """
+    Имитация клиента Telegram. Каждый вызов «спит» задержку из распределения
+    и с заданной вероятностью завершается ошибкой:
+    - flood_wait_rate — FloodWait на flood_wait_seconds секунд,
+    - message_id_invalid_rate — MessageIdInvalid,
+    - forward_error_rate — разовый сбой сервера в forward_messages
+      (запускает резервное копирование),
+    - protected_sources — исходные чаты, защищённые от пересылки: из них
+      forward_messages и copy_* всегда завершаются ChatForwardsRestricted.
+    Пересылка медиа (сообщения из media_ids) дополнительно «спит»
+    media_latency — как передача крупных файлов.
+    """
+
+    def __init__(
+        self,
+        latency="const:0.002",
+        flood_wait_rate=0.0,
+        flood_wait_seconds=0,
+        message_id_invalid_rate=0.0,
+        forward_error_rate=0.0,
+        protected_sources=(),
+        media_latency=None,
+        seed=0,
+    ):
+        self.latency = parse_latency(latency)
+        self.flood_wait_rate = flood_wait_rate
+        self.flood_wait_seconds = flood_wait_seconds
+        self.message_id_invalid_rate = message_id_invalid_rate
+        self.forward_error_rate = forward_error_rate
+        self.protected_sources = set(protected_sources)
+        self.media_latency = parse_latency(media_latency) if media_latency else None
+        self.media_ids = set()  # {(chat_id, message_id)} сообщения с медиа
+        self.rng = random.Random(seed)
+        self.me = types.SimpleNamespace(id=1)
+        self.calls = Counter()  # {метод: количество вызовов}
+        self.errors = Counter()  # {ошибка: количество}
+
+    async def _call(self, method, forward=False, from_chat_id=None):
+        self.calls[method] += 1
+        await asyncio.sleep(self.latency(self.rng))
+        if from_chat_id in self.protected_sources:
+            self.errors["ChatForwardsRestricted"] += 1
+            raise ChatForwardsRestricted()
+        roll = self.rng.random()
+        if roll < self.flood_wait_rate:
+            self.errors["FloodWait"] += 1
+            raise FloodWait(value=self.flood_wait_seconds)
+        roll -= self.flood_wait_rate
+        if roll < self.message_id_invalid_rate:
+            self.errors["MessageIdInvalid"] += 1
+            raise MessageIdInvalid()
+        roll -= self.message_id_invalid_rate
+        if forward and roll < self.forward_error_rate:
+            self.errors["InternalServerError"] += 1
+            raise InternalServerError()
+
+    async def forward_messages(self, chat_id, from_chat_id, message_ids, **kwargs):
+        await self._call("forward_messages", forward=True, from_chat_id=from_chat_id)
+        if self.media_latency is not None and any(
+            (from_chat_id, message_id) in self.media_ids for message_id in message_ids
+        ):
+            await asyncio.sleep(self.media_latency(self.rng))
+
+    async def copy_message(self, chat_id, from_chat_id, message_id, **kwargs):
+        await self._call("copy_message", from_chat_id=from_chat_id)
+
+    async def copy_media_group(self, chat_id, from_chat_id, message_id, **kwargs):
+        await self._call("copy_media_group", from_chat_id=from_chat_id)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await self._call("send_message")
+
+    @property
+    def total_calls(self):
+        return sum(self.calls.values())
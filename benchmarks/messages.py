@@ -0,0 +1,104 @@
+# benchmarks/messages.py
+"""
+Генераторы синтетических сообщений: текст, одиночные медиа и альбомы.
+Объекты содержат только те поля pyrogram.types.Message, которые читает бот.
+"""
+
+import datetime
+import random
+
+
+class FakeChat:
+    __slots__ = ("id", "type", "username", "title")
+
+    def __init__(self, chat_id):
+        self.id = chat_id
+        self.type = None
+        self.username = None
+        self.title = f"Чат {chat_id}"
+
+
+class FakeMessage:
+    __slots__ = (
+        "id",
+        "chat",
+        "date",
+        "edit_date",
+        "text",
+        "caption",
+        "media",
+        "media_group_id",
+        "from_user",
+        "empty",
+        "service",
+    )
+
+    def __init__(self, chat, message_id, text=None, caption=None, media=None, media_group_id=None):
+        self.id = message_id
+        self.chat = chat
+        self.date = None  # Проставляется в момент «публикации»
+        self.edit_date = None
+        self.text = text
+        self.caption = caption
+        self.media = media
+        self.media_group_id = media_group_id
+        self.from_user = None
+        self.empty = False
+        self.service = None
+
+    def publish(self):
+        self.date = datetime.datetime.now()
+        return self
+
+
+def generate_messages(count, sources, mix, album_size=(2, 10), seed=0, skew=0.0):
+    """
+    Генерирует поток из count сообщений, распределённых по sources исходным
+    чатам. mix — доли видов сообщений {"text": 0.7, "media": 0.2, "album": 0.1};
+    альбом считается одним событием, но даёт album_size сообщений подряд.
+    skew — доля событий первого («шумного») чата, остальные делят поровну
+    (0 — все чаты равны).
+
+    Returns:
+        list[FakeMessage]: сообщения в порядке поступления
+    """
+    rng = random.Random(seed)
+    chats = [FakeChat(-1001000000000 - i) for i in range(sources)]
+    next_ids = {chat.id: 1 for chat in chats}
+    kinds = list(mix)
+    weights = [mix[k] for k in kinds]
+    chat_weights = None
+    if skew and sources > 1:
+        chat_weights = [skew] + [(1 - skew) / (sources - 1)] * (sources - 1)
+    media_group_seq = 0
+    messages = []
+
+    while len(messages) < count:
+        chat = rng.choices(chats, chat_weights)[0]
+        kind = rng.choices(kinds, weights)[0]
+        if kind == "text":
+            parts = [(f"Сообщение {next_ids[chat.id]} " + "x" * rng.randint(10, 400), None, None)]
+            media_group_id = None
+        elif kind == "media":
+            parts = [(None, "Подпись", "photo")]
+            media_group_id = None
+        else:
+            media_group_seq += 1
+            media_group_id = str(media_group_seq)
+            size = min(rng.randint(*album_size), count - len(messages))
+            parts = [(None, "Альбом" if i == 0 else None, "photo") for i in range(size)]
+
+        for text, caption, media in parts:
+            messages.append(
+                FakeMessage(
+                    chat,
+                    next_ids[chat.id],
+                    text=text,
+                    caption=caption,
+                    media=media,
+                    media_group_id=media_group_id,
+                )
+            )
+            next_ids[chat.id] += 1
+
+    return messages
@@ -1,16 +1,19 @@
 # main.py
 
-import asyncio
-
 from src import main as app
+from src import settings
+from src.runtime import run
+from src.supervisor import run_supervisor
 
 
 # Запускаем основную функцию
 if __name__ == "__main__":
-    # Устанавливаем обработчик событий цикла для корректного завершения
-    loop = asyncio.get_event_loop()
     try:
-        loop.run_until_complete(app())
+        # При WORKER_PROCESSES > 1 этот процесс только управляет рабочими процессами
+        if settings.worker_processes > 1:
+            run(run_supervisor)
+        else:
+            run(app)
     except KeyboardInterrupt:
         print("Бот остановлен.")
     except Exception as e:
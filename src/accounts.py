@@ -0,0 +1,220 @@
+# src/accounts.py
+
+import bisect
+import hashlib
+import os
+import time
+
+from .config import settings
+from .dialog_cache import has_peer
+from .logger import get_logger
+from .metrics import registry
+from .rate_limiter import RATE_LIMITS_FILE, RateLimiter
+
+
+logger = get_logger("accounts")
+
+# Виртуальных узлов на аккаунт в кольце: чем больше, тем ровнее распределение
+RING_VNODES = 128
+
+
+def _ring_hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+def rate_limits_file(account_name: str) -> str:
+    """
+    Файл выученных скоростей для отправляющего аккаунта
+    (rate_limits_<имя>.json рядом с rate_limits.json).
+    """
+    base, ext = os.path.splitext(RATE_LIMITS_FILE)
+    return f"{base}_{account_name}{ext}"
+
+
+class SwitchAccount(Exception):
+    """
+    Отправка с этого аккаунта в чат назначения невозможна, но есть другой
+    аккаунт — задание нужно повторить сразу, без парковки.
+    """
+
+
+class SenderAccount:
+    """
+    Отправляющий аккаунт: клиент Pyrogram и собственный ограничитель
+    скорости (лимиты Telegram действуют на каждый аккаунт отдельно).
+    """
+
+    def __init__(self, name: str, client, rate_limiter: RateLimiter, owns_client=True):
+        self.name = name
+        self.client = client
+        self.rate_limiter = rate_limiter
+        # Клиент запускается и останавливается пулом (кроме слушающего аккаунта)
+        self.owns_client = owns_client
+        # До этого момента аккаунт в долгом FloodWait (time.monotonic)
+        self.flood_until = 0.0
+
+    def available(self, now: float) -> bool:
+        return self.flood_until <= now
+
+
+class AccountPool:
+    """
+    Пул отправляющих аккаунтов. Чаты назначения распределяются между
+    аккаунтами по кольцу согласованного хеширования: у каждого чата есть
+    «свой» аккаунт, а при добавлении или удалении аккаунта переезжает
+    лишь малая часть чатов. Аккаунт в долгом FloodWait временно
+    пропускается — его чаты обслуживает следующий по кольцу.
+    """
+
+    def __init__(self):
+        self.accounts = []
+        self.ring = []  # Отсортированные хеши виртуальных узлов
+        self.ring_accounts = []  # Аккаунт для каждого узла кольца
+        self.preferences = {}  # {dest_chat_id: [аккаунты по кольцу]}
+        # Аккаунты, которым недоступен чат назначения:
+        # {dest_chat_id: {имя аккаунта: до какого момента (time.monotonic)}}
+        self.excluded = {}
+
+    def add(self, account: SenderAccount):
+        self.accounts.append(account)
+        nodes = sorted(
+            (_ring_hash(f"{a.name}#{i}"), a)
+            for a in self.accounts
+            for i in range(RING_VNODES)
+        )
+        self.ring = [h for h, _ in nodes]
+        self.ring_accounts = [a for _, a in nodes]
+        self.preferences.clear()
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def preference(self, dest_chat_id):
+        """
+        Аккаунты в порядке обхода кольца от хеша чата назначения
+        (первый — «свой» аккаунт чата).
+        """
+        seen = self.preferences.get(dest_chat_id)
+        if seen is not None:
+            return seen
+
+        start = bisect.bisect(self.ring, _ring_hash(str(dest_chat_id)))
+        seen = []
+        for i in range(len(self.ring_accounts)):
+            account = self.ring_accounts[(start + i) % len(self.ring_accounts)]
+            if account not in seen:
+                seen.append(account)
+                if len(seen) == len(self.accounts):
+                    break
+        self.preferences[dest_chat_id] = seen
+        return seen
+
+    def _excluded(self, dest_chat_id, now: float) -> dict:
+        """
+        Действующие исключения аккаунтов для чата; истёкшие забываются.
+        """
+        excluded = self.excluded.get(dest_chat_id)
+        if not excluded:
+            return {}
+        for name, expires_at in list(excluded.items()):
+            if expires_at <= now:
+                del excluded[name]
+        if not excluded:
+            del self.excluded[dest_chat_id]
+        return excluded
+
+    def pick(self, dest_chat_id) -> SenderAccount:
+        """
+        Выбирает аккаунт для отправки в чат назначения: первый по кольцу,
+        который не в долгом FloodWait и которому доступен чат. Если все
+        в FloodWait — тот, что освободится раньше.
+        """
+        if len(self.accounts) == 1:
+            return self.accounts[0]
+
+        now = time.monotonic()
+        excluded = self._excluded(dest_chat_id, now)
+        candidates = [a for a in self.preference(dest_chat_id) if a.name not in excluded]
+        if not candidates:
+            # Чат недоступен ни одному аккаунту — пусть решает deliver_job
+            candidates = self.preference(dest_chat_id)
+        for account in candidates:
+            if account.available(now):
+                return account
+        return min(candidates, key=lambda a: a.flood_until)
+
+    def on_flood_wait(self, account: SenderAccount, seconds: float) -> bool:
+        """
+        Учитывает FloodWait аккаунта. Возвращает True, если ожидание долгое
+        и задание можно сразу отправить с другого аккаунта.
+        """
+        if len(self.accounts) == 1 or seconds < settings.account_failover_flood_wait:
+            return False
+        now = time.monotonic()
+        account.flood_until = max(account.flood_until, now + seconds)
+        logger.warning(
+            "Аккаунт в долгом FloodWait, отправка переключена на другие аккаунты",
+            account=account.name,
+            wait=seconds,
+        )
+        return any(a.available(now) for a in self.accounts)
+
+    def exclude(self, account: SenderAccount, dest_chat_id) -> bool:
+        """
+        Запоминает на account_exclude_ttl, что аккаунту недоступен чат
+        назначения. Возвращает True, если остались аккаунты, с которых можно
+        попробовать ещё раз.
+        """
+        if len(self.accounts) == 1:
+            return False
+        now = time.monotonic()
+        excluded = self._excluded(dest_chat_id, now)
+        excluded[account.name] = now + settings.account_exclude_ttl
+        self.excluded[dest_chat_id] = excluded
+        logger.warning(
+            "Чат назначения недоступен аккаунту",
+            account=account.name,
+            dest=dest_chat_id,
+        )
+        return len(excluded) < len(self.accounts)
+
+    async def start(self, chat_ids):
+        """
+        Запускает клиенты и ограничители скорости. Если сессии аккаунта
+        неизвестны нужные чаты, один раз перечитывает его диалоги.
+        """
+        for account in self.accounts:
+            account.rate_limiter.start()
+            if not account.owns_client:
+                continue
+            await account.client.start()
+            missing = [c for c in chat_ids if not await has_peer(account.client, c)]
+            if missing:
+                async for _ in account.client.get_dialogs():
+                    pass
+            logger.info(
+                "Отправляющий аккаунт запущен",
+                account=account.name,
+                unknown_chats=len(missing),
+            )
+
+    async def stop(self):
+        for account in self.accounts:
+            await account.rate_limiter.stop()
+            if account.owns_client and account.client.is_connected:
+                await account.client.stop()
+
+    def availability(self):
+        now = time.monotonic()
+        return {(a.name,): int(a.available(now)) for a in self.accounts}
+
+
+# Глобальный пул отправляющих аккаунтов
+account_pool = AccountPool()
+
+registry.gauge(
+    "forwarder_account_available",
+    "Отправляющий аккаунт не в долгом FloodWait (1/0)",
+    account_pool.availability,
+    ("account",),
+)
@@ -1,17 +1,53 @@
 # src/app.py
 
 import asyncio
+import signal
+import time
+from functools import partial
 
 from pyrogram import filters
 from pyrogram.handlers import MessageHandler
 
-from .client import app
-from .config import settings
+from .client import app, bind_to_running_loop, client_concurrency, create_client
+from .config import settings, shard_file_name
 from .check_folder import check_folder_existence
-from .config_manager import load_saved_config
-from .chat_manager import validate_chats, print_current_config
+from .config_manager import load_route_rules, load_route_weights, load_saved_config
+from .chat_manager import (
+    drop_problematic_chats,
+    print_current_config,
+    validate_added_chats,
+    validate_chats,
+)
 from .setup_manager import interactive_setup
-from .message_handler import create_handler
+from .message_handler import (
+    create_handler,
+    create_sender,
+    enqueue_history,
+    forward_message,
+    media_group_assembler,
+)
+from .batcher import message_batcher
+from .delivery import delivery_engine
+from .retry_queue import retry_scheduler
+from .rate_limiter import RateLimiter, rate_limiter
+from .accounts import SenderAccount, account_pool, rate_limits_file
+from .outbox import outbox
+from .dedup import dedup_cache
+from .media_relay import media_relay
+from .catch_up import catch_up_gate, run_catch_up
+from .routing import (
+    RoutingTable,
+    get_routing_table,
+    quarantined_destinations,
+    release_quarantine,
+    report_cycles,
+    set_routing_table,
+)
+from .config_watcher import ConfigWatcher
+from .supervisor import shard_sources
+from .logger import get_logger, setup_logging, stop_logging
+from .metrics import MetricsServer, loop_lag_monitor
+from .runtime import is_performance_profile, uses_uvloop
 
 
 # Файл с конфигурацией пересылки бота
@@ -20,6 +56,9 @@ CONFIG_FILE = settings.bot_chats_config_file
 # Глобальные переменные для хранения настроек пересылки
 SOURCE_CHAT_IDS = []
 FORWARDING_CONFIG = {}
+CHAT_INFO = {}
+
+logger = get_logger("app")
 
 
 async def main():
@@ -27,10 +66,27 @@ async def main():
     Основная функция для запуска бота.
     Настраивает обработчики и запускает клиент.
     """
-    global SOURCE_CHAT_IDS, FORWARDING_CONFIG
+    global SOURCE_CHAT_IDS, FORWARDING_CONFIG, CHAT_INFO
+    # Логи пишутся в stdout из отдельного потока, не блокируя цикл событий
+    setup_logging()
+    started_at = time.monotonic()
     print("Запуск бота для пересылки сообщений...")
+    workers, transmissions = client_concurrency()
+    logger.info(
+        "Профиль выполнения",
+        profile=settings.runtime_profile,
+        event_loop=type(asyncio.get_running_loop()).__module__,
+        workers=workers,
+        max_concurrent_transmissions=transmissions,
+    )
+    if is_performance_profile() and not uses_uvloop():
+        logger.warning(
+            "Профиль performance без uvloop: используется стандартный цикл событий",
+            key="runtime.no_uvloop",
+        )
 
     # Запускаем клиент для настройки
+    bind_to_running_loop(app)
     await app.start()
 
     # Проверяем наличие папки и настраиваем пересылку на её основе
@@ -46,9 +102,15 @@ async def main():
     )
 
     if has_config:
-        SOURCE_CHAT_IDS = saved_source_ids
-        FORWARDING_CONFIG = saved_forwarding_config
+        # Рабочий процесс супервизора обслуживает только исходные чаты своей шарды
+        SOURCE_CHAT_IDS, FORWARDING_CONFIG = shard_sources(
+            saved_source_ids, saved_forwarding_config
+        )
         chat_info = saved_chat_info
+    elif settings.shard_count > 1:
+        print("Рабочему процессу нужна готовая конфигурация пересылки. Завершение работы.")
+        await app.stop()
+        return
     elif use_folder and settings.interactive_folder_setup:
         # Проверяем папку и настраиваем пересылку только если нет сохранённой конфигурации
         folder_exists, folder_config, folder_chat_info = await check_folder_existence()
@@ -69,54 +131,352 @@ async def main():
         # Если конфигурация не найдена и не используем папку - проводим интерактивную настройку
         SOURCE_CHAT_IDS, FORWARDING_CONFIG = await interactive_setup(app)
 
-    # Проверяем и обновляем доступ к чатам перед запуском
-    # Это обновит SOURCE_CHAT_IDS и FORWARDING_CONFIG на основе доступности чатов
-    SOURCE_CHAT_IDS, FORWARDING_CONFIG, chat_info = await validate_chats(
-        app, SOURCE_CHAT_IDS, FORWARDING_CONFIG
-    )
+    # Петли маршрутов ищутся по полной конфигурации (в режиме супервизора — им самим)
+    if settings.shard_count <= 1:
+        report_cycles(FORWARDING_CONFIG)
+
+    # В режиме быстрого старта сохранённая конфигурация используется сразу,
+    # а доступ к чатам проверяется в фоне уже после регистрации обработчика
+    fast_start = settings.fast_start and has_config
+    if fast_start:
+        print("Быстрый старт: проверка доступа к чатам будет выполнена в фоне")
+    else:
+        # Проверяем и обновляем доступ к чатам перед запуском
+        # Это обновит SOURCE_CHAT_IDS и FORWARDING_CONFIG на основе доступности чатов
+        SOURCE_CHAT_IDS, FORWARDING_CONFIG, chat_info = await validate_chats(
+            app, SOURCE_CHAT_IDS, FORWARDING_CONFIG
+        )
 
-    # Если нет настроенных чатов, завершаем работу
-    if not SOURCE_CHAT_IDS or not FORWARDING_CONFIG:
+    # Если нет настроенных чатов, завершаем работу. Рабочий процесс с пустой
+    # шардой продолжает работать: чаты могут появиться при перезагрузке конфигурации
+    if (not SOURCE_CHAT_IDS or not FORWARDING_CONFIG) and settings.shard_count <= 1:
         print("Не настроено ни одной пересылки. Завершение работы.")
         await app.stop()
         return
 
+    CHAT_INFO = chat_info
+
+    # Собираем таблицу маршрутизации один раз (префиксы и чаты назначения готовы заранее)
+    # (правила маршрутов компилируются здесь же)
+    set_routing_table(
+        RoutingTable(
+            FORWARDING_CONFIG,
+            chat_info,
+            load_route_weights(FORWARDING_CONFIG),
+            load_route_rules(FORWARDING_CONFIG),
+        )
+    )
+
+    # Подключаем движок доставки: обработчик только ставит задания в очереди,
+    # а отправку в каждый чат назначения выполняет отдельный воркер
+    delivery_engine.set_sender(create_sender())
+    # Запускаем отправляющие аккаунты; выученные скорости отправки каждого
+    # загружаются и периодически сохраняются
+    setup_accounts()
+    chat_ids = set(SOURCE_CHAT_IDS)
+    for dest_ids in FORWARDING_CONFIG.values():
+        chat_ids.update(dest_ids)
+    await account_pool.start(chat_ids)
+    # Открываем outbox и повторяем доставки, не завершённые до перезапуска
+    await delivery_engine.replay(await outbox.start())
+    # Загружаем кэш уже обработанных обновлений
+    dedup_cache.start()
+    # Индекс кэша ретрансляции медиа (если она включена)
+    if settings.media_relay_enabled:
+        media_relay.load()
+
+    # Метрики: задержка цикла событий измеряется всегда, HTTP-эндпоинт — если задан порт
+    loop_lag_monitor.start()
+    metrics_server = None
+    if settings.metrics_port:
+        metrics_server = MetricsServer(settings.metrics_host, settings.metrics_port)
+        try:
+            await metrics_server.start()
+        except OSError as e:
+            logger.error(
+                "Не удалось запустить сервер метрик",
+                port=settings.metrics_port,
+                error=repr(e),
+            )
+            metrics_server = None
+
+    # Чаты, для которых известно последнее пересланное сообщение, сначала догоняют
+    # пропущенное, а их новые сообщения откладываются до конца догонялки
+    catch_up_ids = {}
+    if settings.catch_up_enabled:
+        last_message_ids = await outbox.last_message_ids()
+        catch_up_ids = {
+            source_id: last_message_ids[source_id]
+            for source_id in SOURCE_CHAT_IDS
+            if source_id in last_message_ids
+        }
+        catch_up_gate.close(catch_up_ids)
+
     # Создаем фильтр для отслеживания сообщений только из указанных чатов
     source_chats_filter = filters.chat(SOURCE_CHAT_IDS)
     print("Фильтр для отслеживания сообщений:", SOURCE_CHAT_IDS)
 
     # Регистрируем обработчик для всех входящих сообщений из указанных чатов
     print("Регистрируем обработчик для всех входящих сообщений из указанных чатов")
-    app.add_handler(
-        MessageHandler(
-            create_handler(chat_info),
-            filters=source_chats_filter,
+    message_handler = MessageHandler(create_handler(), filters=source_chats_filter)
+    app.add_handler(message_handler)
+
+    # Проверяем доступ к чатам в фоне (режим быстрого старта)
+    validation_task = None
+    if fast_start:
+        validation_task = asyncio.create_task(
+            validate_in_background(source_chats_filter)
+        )
+
+    # Следим за файлом конфигурации (и сигналом SIGHUP), чтобы менять маршруты без перезапуска
+    # Рабочие процессы супервизора не следят за файлом сами, а получают SIGHUP от него
+    config_watcher = None
+    sharded = settings.shard_count > 1
+    if settings.config_watch_enabled or sharded:
+        config_watcher = ConfigWatcher(
+            CONFIG_FILE,
+            partial(reload_config, source_chats_filter),
+            watch_file=settings.config_watch_enabled and not sharded,
+        )
+        config_watcher.start()
+
+    # Запускаем догонялку в фоне: обработчик уже зарегистрирован, поэтому
+    # всё, что придёт во время чтения истории, будет отложено, а не потеряно
+    catch_up_task = None
+    if catch_up_ids:
+        catch_up_task = asyncio.create_task(
+            run_catch_up(
+                app,
+                catch_up_ids,
+                enqueue_batch=partial(enqueue_history, app),
+                forward_live=forward_message,
+            )
         )
-    )
 
     print("Бот запущен и готов к работе!")
+    logger.info("Бот запущен", startup_seconds=round(time.monotonic() - started_at, 3))
     print(f"Отслеживаются сообщения из {len(SOURCE_CHAT_IDS)} чатов")
     print("Нажмите Ctrl+C для завершения работы")
 
     # Выводим текущую конфигурацию пересылки с дополнительной информацией
     print_current_config(FORWARDING_CONFIG, chat_info)
 
-    # Держим бота запущенным до принудительного завершения
+    # Держим бота запущенным до SIGTERM/SIGINT
     await idle()
+    stopping_at = time.monotonic()
+
+    # Прекращаем приём: новые сообщения, догонялка, проверка и перезагрузка конфигурации
+    app.remove_handler(message_handler)
+    if catch_up_task is not None:
+        catch_up_task.cancel()
+    if validation_task is not None:
+        validation_task.cancel()
+    if config_watcher is not None:
+        await config_watcher.stop()
+
+    # Досылаем уже принятое: собранные альбомы и пачки уходят в очереди доставки
+    # (и в outbox), затем ждём доставки не дольше shutdown_drain_timeout
+    remaining = await drain(settings.shutdown_drain_timeout)
+    drained_at = time.monotonic()
+
+    # Останавливаем воркеры доставки; недоставленное остаётся в outbox
+    await delivery_engine.stop()
+    await account_pool.stop()
+    await outbox.stop()
+    await dedup_cache.stop()
+    if metrics_server is not None:
+        await metrics_server.stop()
+    await loop_lag_monitor.stop()
 
     # Корректно останавливаем клиент при завершении работы
     await app.stop()
+    logger.info(
+        "Бот остановлен",
+        drain_seconds=round(drained_at - stopping_at, 3),
+        shutdown_seconds=round(time.monotonic() - stopping_at, 3),
+        left_in_outbox=remaining,
+    )
+    stop_logging()
+
+
+def setup_accounts():
+    """
+    Заполняет пул отправляющих аккаунтов: слушающий аккаунт (если он
+    отправляет сам или других нет) и дополнительные сессии из SENDER_SESSIONS.
+    """
+    if settings.listener_sends or not settings.sender_sessions:
+        account_pool.add(SenderAccount("main", app, rate_limiter, owns_client=False))
+    for name in settings.sender_sessions:
+        account_pool.add(
+            SenderAccount(
+                name,
+                create_client(shard_file_name(name)),
+                RateLimiter(rate_limits_file(name)),
+            )
+        )
+    logger.info(
+        "Отправляющие аккаунты",
+        accounts=[account.name for account in account_pool.accounts],
+    )
+
+
+def apply_config(
+    source_ids,
+    forwarding_config,
+    chat_info,
+    source_chats_filter,
+    route_weights=None,
+    route_rules=None,
+):
+    """
+    Атомарно применяет новую конфигурацию: заменяет таблицу маршрутизации
+    и фильтр обработчика. Уже поставленные в очереди доставки не теряются.
+    Если веса или правила маршрутов не переданы, остаются текущие.
+    """
+    global SOURCE_CHAT_IDS, FORWARDING_CONFIG, CHAT_INFO
+
+    if route_weights is None:
+        route_weights = get_routing_table().weights
+    if route_rules is None:
+        route_rules = get_routing_table().rules
+    # Сначала новая таблица маршрутизации, затем фильтр: удалённые чаты
+    # убираются, добавленные — дописываются (общие чаты не пропадают ни на миг)
+    set_routing_table(RoutingTable(forwarding_config, chat_info, route_weights, route_rules))
+    source_chats_filter.intersection_update(source_ids)
+    source_chats_filter.update(source_ids)
+
+    SOURCE_CHAT_IDS, FORWARDING_CONFIG, CHAT_INFO = source_ids, forwarding_config, chat_info
+
+
+async def validate_in_background(source_chats_filter):
+    """
+    Фоновая проверка доступа к чатам (режим быстрого старта):
+    недоступные чаты убираются из маршрутизации после проверки.
+    """
+    started = time.monotonic()
+    source_ids, forwarding_config, chat_info = await validate_chats(
+        app,
+        list(SOURCE_CHAT_IDS),
+        {source_id: list(dest_ids) for source_id, dest_ids in FORWARDING_CONFIG.items()},
+    )
+    if not source_ids:
+        logger.warning("Фоновая проверка: ни одна пересылка не доступна")
+    apply_config(
+        source_ids, forwarding_config, {**CHAT_INFO, **chat_info}, source_chats_filter
+    )
+    logger.info(
+        "Фоновая проверка чатов завершена",
+        seconds=round(time.monotonic() - started, 1),
+        sources=len(SOURCE_CHAT_IDS),
+    )
+
+
+async def reload_config(source_chats_filter):
+    """
+    Перечитывает файл конфигурации без перезапуска клиента:
+    проверяет только добавленные чаты, затем атомарно заменяет таблицу
+    маршрутизации и фильтр обработчика. Уже поставленные в очереди
+    доставки не теряются.
+    """
+    has_config, source_ids, forwarding_config, saved_chat_info = load_saved_config()
+    if not has_config:
+        logger.warning("Перезагрузка конфигурации пропущена: файл не найден или повреждён")
+        return
+
+    if settings.shard_count <= 1:
+        report_cycles(forwarding_config)
+    source_ids, forwarding_config = shard_sources(source_ids, forwarding_config)
+    source_ids = [s for s in dict.fromkeys(source_ids) if forwarding_config.get(s)]
+    forwarding_config = {s: list(forwarding_config[s]) for s in source_ids}
+    route_weights = load_route_weights(forwarding_config)
+    route_rules = load_route_rules(forwarding_config)
+    if (
+        source_ids == SOURCE_CHAT_IDS
+        and forwarding_config == FORWARDING_CONFIG
+        and route_weights == get_routing_table().weights
+        and route_rules == get_routing_table().rules
+    ):
+        logger.info("Конфигурация не изменилась")
+        return
+
+    # Проверяем доступ только к чатам, которых не было в текущей конфигурации
+    known_chat_ids = set(SOURCE_CHAT_IDS)
+    for dest_ids in FORWARDING_CONFIG.values():
+        known_chat_ids.update(dest_ids)
+    new_chat_ids = set(source_ids)
+    for dest_ids in forwarding_config.values():
+        new_chat_ids.update(dest_ids)
+    # Чаты из карантина проверяем заново
+    added_chat_ids = new_chat_ids - (known_chat_ids - quarantined_destinations())
+
+    added_chat_info, problematic_chats = await validate_added_chats(app, added_chat_ids)
+    drop_problematic_chats(source_ids, forwarding_config, problematic_chats)
+    # Шарда рабочего процесса может законно остаться пустой
+    if not source_ids and settings.shard_count <= 1:
+        logger.warning("В новой конфигурации нет доступных пересылок, оставляем текущую")
+        return
+
+    # Чаты из карантина, снова прошедшие проверку, возвращаем в маршрутизацию
+    release_quarantine(added_chat_ids - problematic_chats)
+
+    apply_config(
+        source_ids,
+        forwarding_config,
+        {**CHAT_INFO, **saved_chat_info, **added_chat_info},
+        source_chats_filter,
+        route_weights,
+        route_rules,
+    )
+    logger.info(
+        "Конфигурация перезагружена",
+        sources=len(SOURCE_CHAT_IDS),
+        validated=len(added_chat_ids),
+    )
+    print_current_config(FORWARDING_CONFIG, CHAT_INFO)
 
 
 # Функция для поддержания работы бота
 async def idle():
     """
-    Функция для поддержания работы бота до принудительного завершения.
+    Ждёт SIGTERM (docker stop) или SIGINT (Ctrl+C), после чего бот
+    завершает работу без потери принятых сообщений.
     """
+    loop = asyncio.get_running_loop()
+    stop_event = asyncio.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop_event.set)
     try:
-        # Ждем до бесконечности или до прерывания
-        while True:
-            await asyncio.sleep(3600)  # Проверка каждый час
-    except KeyboardInterrupt:
-        # Обработка нажатия Ctrl+C
-        print("Завершение работы бота...")
+        await stop_event.wait()
+    finally:
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.remove_signal_handler(signum)
+    print("Завершение работы бота...")
+
+
+async def drain(timeout: float):
+    """
+    Отправляет в очереди доставки всё накопленное в сборщике альбомов
+    и объединителе пачек и ждёт доставки не дольше timeout секунд.
+    Задания, отложенные из-за FloodWait, не ждём — они сохранены в outbox.
+
+    Returns:
+        int: сколько заданий осталось недоставленными
+    """
+    media_group_assembler.flush_all()
+    await asyncio.gather(*media_group_assembler.tasks, return_exceptions=True)
+    await message_batcher.flush_all()
+
+    deadline = time.monotonic() + timeout
+    while (
+        delivery_engine.pending() > len(retry_scheduler)
+        and time.monotonic() < deadline
+    ):
+        await asyncio.sleep(0.1)
+    remaining = delivery_engine.pending()
+    if remaining:
+        logger.warning(
+            "Не все задания доставлены до остановки, они останутся в outbox",
+            pending=remaining,
+            parked=len(retry_scheduler),
+        )
+    return remaining
@@ -0,0 +1,130 @@
+# src/batcher.py
+
+import asyncio
+from collections import deque
+
+from .catch_up import FORWARD_BATCH_LIMIT, catch_up_position
+from .config import settings
+from .delivery import DeliveryJob, delivery_engine
+
+
+class MessageBatcher:
+    """
+    Объединение одиночных сообщений в пачки (включается настройкой batch_window_ms).
+
+    Одиночные сообщения для пары (источник, назначение), пришедшие в течение
+    окна batch_window_ms, отправляются одним вызовом forward_messages
+    (не более 100 ID), что кратно сокращает число запросов к API.
+    Альбомы и готовые пачки не объединяются, но перед ними отправляется
+    уже накопленная пачка, чтобы сохранить порядок.
+
+    Пока сообщение копится в пачке, его ещё нет в outbox, поэтому оно
+    удерживается в позиции догонялки (CatchUpPosition): сбой внутри окна
+    не теряет накопленное.
+    """
+
+    def __init__(self):
+        self.pending = {}  # {(source, dest): DeliveryJob} копящаяся пачка
+        self.timers = {}  # {(source, dest): TimerHandle}
+        self.ready = {}  # {(source, dest): deque[DeliveryJob]} готово к постановке
+        self.locks = {}  # {(source, dest): asyncio.Lock}
+        self.tasks = set()
+
+    @property
+    def enabled(self):
+        return settings.batch_window_ms > 0
+
+    async def submit(self, job: DeliveryJob):
+        """
+        Принимает задание на доставку: одиночное сообщение копится в пачке,
+        остальные задания ставятся в очередь сразу после накопленной пачки.
+        """
+        await self.submit_many([job])
+
+    async def submit_many(self, jobs):
+        """
+        Принимает задания одного обновления (по одному на чат назначения).
+        Всё, что нужно поставить в очереди сейчас, записывается в outbox
+        общей фиксацией, а не по одной на каждый чат назначения.
+        """
+        if not self.enabled:
+            await delivery_engine.enqueue_many(jobs)
+            return
+
+        keys = [key for key in map(self._accept, jobs) if key is not None]
+        if keys:
+            await asyncio.gather(*(self._drain(key) for key in keys))
+
+    def _accept(self, job: DeliveryJob):
+        """
+        Добавляет задание в копящуюся пачку или в готовые к постановке.
+        Возвращает ключ маршрута, если готовые задания нужно поставить сейчас.
+        """
+        key = (job.source_chat_id, job.dest_chat_id)
+        catch_up_position.hold(job.source_chat_id, job.message_ids)
+        if job.media_group_id or len(job.message_ids) > 1:
+            self._seal(key)
+            self._ready(key).append(job)
+            return key
+
+        batch = self.pending.get(key)
+        if batch is None:
+            self.pending[key] = job
+            self.timers[key] = asyncio.get_running_loop().call_later(
+                settings.batch_window_ms / 1000, self._on_timer, key
+            )
+            return None
+
+        batch.message_ids = batch.message_ids + job.message_ids
+        batch.messages = batch.messages + job.messages
+        if len(batch.message_ids) >= FORWARD_BATCH_LIMIT:
+            self._seal(key)
+            return key
+        return None
+
+    def _ready(self, key):
+        return self.ready.setdefault(key, deque())
+
+    def _seal(self, key):
+        """
+        Закрывает копящуюся пачку и переводит её в готовые к постановке.
+        """
+        timer = self.timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self.pending.pop(key, None)
+        if batch is not None:
+            self._ready(key).append(batch)
+
+    def _on_timer(self, key):
+        self.timers.pop(key, None)
+        self._seal(key)
+        task = asyncio.create_task(self._drain(key))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _drain(self, key):
+        """
+        Ставит готовые задания в очередь доставки строго в порядке поступления.
+        """
+        lock = self.locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            ready = self._ready(key)
+            while ready:
+                # Задание остаётся в готовых, пока не записано в outbox
+                job = ready[0]
+                await delivery_engine.enqueue(job)
+                ready.popleft()
+                catch_up_position.release(job.source_chat_id, job.message_ids)
+
+    async def flush_all(self):
+        """
+        Немедленно ставит в очереди все накопленные пачки (например, при остановке).
+        """
+        for key in list(self.pending):
+            self._seal(key)
+        await asyncio.gather(*(self._drain(key) for key in list(self.ready)))
+
+
+# Глобальный объединитель одиночных сообщений
+message_batcher = MessageBatcher()
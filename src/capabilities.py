@@ -0,0 +1,155 @@
+# src/capabilities.py
+
+import time
+from collections import OrderedDict
+
+from pyrogram.errors import (
+    ChatForwardsRestricted,
+    ChatSendGifsForbidden,
+    ChatSendMediaForbidden,
+    ChatSendPollForbidden,
+    ChatSendStickersForbidden,
+)
+
+from .config import settings
+from .logger import get_logger
+from .metrics import registry
+
+
+logger = get_logger("capabilities")
+
+# Ошибки, которые зависят от пары чатов, а не от конкретного сообщения:
+# если метод отказал с такой ошибкой, он откажет и для следующих сообщений
+ROUTE_ERRORS = (
+    ChatForwardsRestricted,
+    ChatSendGifsForbidden,
+    ChatSendMediaForbidden,
+    ChatSendPollForbidden,
+    ChatSendStickersForbidden,
+)
+
+capability_lookups_total = registry.counter(
+    "forwarder_capability_lookups_total",
+    "Проверки кэша возможностей маршрутов (skip — метод пропущен, try — вызывается)",
+    ("result",),
+)
+capability_calls_saved_total = registry.counter(
+    "forwarder_capability_calls_saved_total",
+    "Вызовы API, пропущенные благодаря кэшу возможностей маршрутов",
+    ("method",),
+)
+
+
+class RouteCapabilities:
+    __slots__ = ("worked", "failed")
+
+    def __init__(self):
+        # Метод, который сработал последним
+        self.worked = None
+        # {метод: (имя ошибки, до какого момента не пробовать)}
+        self.failed = {}
+
+
+class CapabilityCache:
+    """
+    Кэш возможностей маршрута (исходный чат, чат назначения): какой метод
+    отправки сработал последним и какие методы отказали и почему.
+
+    Если исходный чат защищён от пересылки или чат назначения запрещает
+    медиа, каждое сообщение иначе проходило бы всю цепочку forward ->
+    copy_media_group -> copy_message -> send_message. Отказ метода
+    помнится ttl секунд, потом метод снова пробуется (ограничения чатов
+    могут снять). Число маршрутов ограничено (LRU).
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.routes = OrderedDict()  # {(source_chat_id, dest_chat_id): RouteCapabilities}
+        self.skips = 0
+        self.tries = 0
+
+    def _entry(self, route):
+        entry = self.routes.get(route)
+        if entry is None:
+            entry = self.routes[route] = RouteCapabilities()
+            if len(self.routes) > self.max_entries:
+                self.routes.popitem(last=False)
+        else:
+            self.routes.move_to_end(route)
+        return entry
+
+    def is_doomed(self, route, method: str) -> bool:
+        """
+        True, если метод недавно отказал на этом маршруте с ошибкой
+        маршрута — вызывать его не нужно.
+        """
+        entry = self.routes.get(route)
+        failure = entry.failed.get(method) if entry is not None else None
+        if failure is not None:
+            if failure[1] > time.monotonic():
+                self.skips += 1
+                capability_lookups_total.inc(("skip",))
+                capability_calls_saved_total.inc((method,))
+                return True
+            # Срок истёк — пробуем метод заново
+            del entry.failed[method]
+        self.tries += 1
+        capability_lookups_total.inc(("try",))
+        return False
+
+    def record_success(self, route, method: str):
+        entry = self.routes.get(route)
+        if entry is None and method == "forward":
+            # Обычный случай — пересылка работает; запись не нужна
+            return
+        entry = self._entry(route)
+        entry.worked = method
+        entry.failed.pop(method, None)
+
+    def record_failure(self, route, method: str, error: Exception) -> bool:
+        """
+        Запоминает отказ метода, если ошибка относится к маршруту целиком.
+        Возвращает True, если отказ запомнен.
+        """
+        if not isinstance(error, ROUTE_ERRORS):
+            return False
+        entry = self._entry(route)
+        entry.failed[method] = (type(error).__name__, time.monotonic() + self.ttl)
+        if entry.worked == method:
+            entry.worked = None
+        logger.info(
+            "Метод отправки недоступен для маршрута, пропускается",
+            key="capability.failed",
+            source=route[0],
+            dest=route[1],
+            method=method,
+            error=type(error).__name__,
+            ttl=self.ttl,
+        )
+        return True
+
+    def describe(self, route):
+        """
+        Сведения о маршруте для логов: последний сработавший метод
+        и причины отказов остальных.
+        """
+        entry = self.routes.get(route)
+        if entry is None:
+            return {}
+        return {
+            "worked": entry.worked,
+            "failed": {method: error for method, (error, _) in entry.failed.items()},
+        }
+
+
+# Глобальный кэш возможностей маршрутов
+capability_cache = CapabilityCache(
+    settings.capability_cache_ttl, settings.capability_cache_max_entries
+)
+
+registry.gauge(
+    "forwarder_capability_cache_routes",
+    "Маршруты в кэше возможностей",
+    lambda: len(capability_cache.routes),
+)
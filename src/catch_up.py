@@ -0,0 +1,222 @@
+# src/catch_up.py
+
+import asyncio
+from collections import Counter
+
+from .config import settings
+from .logger import get_logger
+from .outbox import outbox
+
+
+logger = get_logger("catch_up")
+
+
+# Максимальное количество ID в одном вызове forward_messages
+FORWARD_BATCH_LIMIT = 100
+
+
+class CatchUpGate:
+    """
+    «Шлюз» между догонялкой и живым обработчиком.
+    Пока исходный чат догоняет пропущенные сообщения, новые сообщения
+    из него не обрабатываются сразу, а откладываются и передаются живому
+    обработчику после догонялки — без пропусков и без повторов.
+    """
+
+    def __init__(self):
+        self.held = {}  # {source_chat_id: [messages]}
+
+    def close(self, source_chat_ids):
+        for source_chat_id in source_chat_ids:
+            self.held.setdefault(source_chat_id, [])
+
+    def hold(self, message) -> bool:
+        """
+        Откладывает сообщение, если его чат ещё догоняет историю.
+        """
+        held = self.held.get(message.chat.id)
+        if held is None:
+            return False
+        held.append(message)
+        return True
+
+    def take(self, source_chat_id):
+        held = self.held.get(source_chat_id, [])
+        self.held[source_chat_id] = []
+        return held
+
+    def open(self, source_chat_id):
+        self.held.pop(source_chat_id, None)
+
+
+# Глобальный шлюз догонялки
+catch_up_gate = CatchUpGate()
+
+
+class CatchUpPosition:
+    """
+    Последнее сообщение каждого исходного чата, поставленное на доставку:
+    с него после перезапуска начинает догонялка (хранится в outbox).
+
+    Сообщения, которые уже приняты, но ещё не записаны в outbox (части
+    альбома в сборщике медиагрупп, одиночные сообщения в пачке объединителя),
+    удерживаются: пока они есть, сохраняется ID перед самым ранним из них.
+    Иначе сбой до их записи терял бы их — догонялка начала бы после них,
+    а в outbox их нет.
+    """
+
+    def __init__(self):
+        self.held = {}  # {source_chat_id: Counter{message_id: сколько раз удержан}}
+        self.last_ids = {}  # {source_chat_id: последний ID, ждущий снятия удержания}
+
+    def hold(self, source_chat_id, message_ids):
+        """
+        Удерживает сообщения, ещё не записанные в outbox.
+        """
+        self.held.setdefault(source_chat_id, Counter()).update(message_ids)
+
+    def release(self, source_chat_id, message_ids):
+        """
+        Снимает удержание (сообщения записаны в outbox или отброшены).
+        """
+        held = self.held.get(source_chat_id)
+        if held is None:
+            return
+        held.subtract(message_ids)
+        for message_id in message_ids:
+            if held[message_id] <= 0:
+                del held[message_id]
+        if not held:
+            del self.held[source_chat_id]
+        self._commit(source_chat_id)
+
+    def record(self, source_chat_id, message_id):
+        """
+        Запоминает последнее сообщение исходного чата, поставленное на доставку.
+        """
+        if message_id > self.last_ids.get(source_chat_id, 0):
+            self.last_ids[source_chat_id] = message_id
+        self._commit(source_chat_id)
+
+    def _commit(self, source_chat_id):
+        last_id = self.last_ids.get(source_chat_id)
+        if last_id is None:
+            return
+        held = self.held.get(source_chat_id)
+        if held:
+            last_id = min(last_id, min(held) - 1)
+        else:
+            del self.last_ids[source_chat_id]
+        if last_id > 0:
+            outbox.record_last_message_id(source_chat_id, last_id)
+
+
+# Глобальная позиция догонялки
+catch_up_position = CatchUpPosition()
+
+
+def split_into_batches(messages):
+    """
+    Делит сообщения (по возрастанию ID) на пачки до 100 штук,
+    не разрывая медиагруппы между пачками.
+    """
+    batches = []
+    batch = []
+    i = 0
+    while i < len(messages):
+        # Берём альбом целиком (или одно сообщение)
+        j = i + 1
+        mg_id = messages[i].media_group_id
+        if mg_id:
+            while j < len(messages) and messages[j].media_group_id == mg_id:
+                j += 1
+        block = messages[i:j]
+
+        if batch and len(batch) + len(block) > FORWARD_BATCH_LIMIT:
+            batches.append(batch)
+            batch = []
+        batch.extend(block)
+        i = j
+
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+async def fetch_missed_messages(client, source_chat_id, last_message_id):
+    """
+    Постранично читает историю чата от новых к старым до last_message_id
+    и возвращает пропущенные сообщения по возрастанию ID.
+    """
+    missed = []
+    async for message in client.get_chat_history(source_chat_id):
+        if message.id <= last_message_id:
+            break
+        missed.append(message)
+        if len(missed) >= settings.catch_up_limit:
+            logger.warning(
+                "Достигнут лимит догонялки",
+                source=source_chat_id,
+                limit=settings.catch_up_limit,
+            )
+            break
+    missed.reverse()
+    return missed
+
+
+async def catch_up_source(
+    client, source_chat_id, last_message_id, enqueue_batch, forward_live
+):
+    """
+    Догоняет один исходный чат и передаёт его живому обработчику.
+    """
+    max_history_id = last_message_id
+    try:
+        missed = await fetch_missed_messages(client, source_chat_id, last_message_id)
+        if missed:
+            max_history_id = missed[-1].id
+            batches = split_into_batches(missed)
+            for batch in batches:
+                await enqueue_batch(source_chat_id, batch)
+            logger.info(
+                "Пропущенные сообщения поставлены на доставку",
+                source=source_chat_id,
+                messages=len(missed),
+                batches=len(batches),
+            )
+    except Exception as e:
+        logger.error("Ошибка догонялки", source=source_chat_id, error=repr(e))
+
+    # Передаём отложенные живые сообщения, пропуская уже прочитанные из истории.
+    # Шлюз открывается только когда отложенных не осталось, чтобы не нарушить порядок.
+    while True:
+        held = catch_up_gate.take(source_chat_id)
+        if not held:
+            catch_up_gate.open(source_chat_id)
+            break
+        for message in sorted(held, key=lambda m: m.id):
+            if message.id > max_history_id:
+                await forward_live(client, message)
+
+
+async def run_catch_up(client, last_message_ids, enqueue_batch, forward_live):
+    """
+    Догоняет сообщения, опубликованные в исходных чатах, пока бот был выключен.
+    Чаты обрабатываются параллельно, но не более catch_up_concurrency одновременно.
+
+    enqueue_batch(source_chat_id, messages) ставит пачку пропущенных сообщений
+    на доставку, forward_live(client, message) — живой обработчик.
+    """
+    semaphore = asyncio.Semaphore(settings.catch_up_concurrency)
+
+    async def limited(source_chat_id, last_message_id):
+        async with semaphore:
+            await catch_up_source(
+                client, source_chat_id, last_message_id, enqueue_batch, forward_live
+            )
+
+    logger.info("Догоняем пропущенные сообщения", chats=len(last_message_ids))
+    await asyncio.gather(
+        *(limited(source_chat_id, last_id) for source_chat_id, last_id in last_message_ids.items())
+    )
+    logger.info("Догонялка завершена")
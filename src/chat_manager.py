@@ -1,7 +1,8 @@
 # src/chat_manager.py
 
 from .config import settings
-from .config_manager import save_config
+from .config_manager import has_saved_config, remove_saved_chats, save_config
+from .dialog_cache import dialog_cache
 
 
 # Файл с конфигурацией пересылки бота
@@ -10,64 +11,55 @@ CONFIG_FILE = settings.bot_chats_config_file
 
 async def validate_chats(app, SOURCE_CHAT_IDS, FORWARDING_CONFIG):
     """
-    Проверяет и восстанавливает доступность всех чатов в конфигурации,
-    предварительно загружая список диалогов для более надежного доступа.
+    Проверяет и восстанавливает доступность всех чатов в конфигурации.
+    Проверяются только чаты из конфигурации: свежие данные берутся из
+    постоянного кэша диалогов, остальные запрашиваются точечно.
     """
     print("Проверка доступа к чатам...")
 
-    # Словарь для хранения информации о чатах
-    chat_info = {}
-
-    # Сначала загружаем все диалоги для кэширования
-    print("Предварительная загрузка всех доступных диалогов...")
-    cached_dialogs = {}
-    async for dialog in app.get_dialogs():
-        cached_dialogs[dialog.chat.id] = dialog.chat
-        # Сохраняем информацию о чате
-        if hasattr(dialog.chat, "username") and dialog.chat.username:
-            chat_info[dialog.chat.id] = {
-                "username": dialog.chat.username,
-                "type": str(dialog.chat.type.name),
-            }
-        else:
-            chat_info[dialog.chat.id] = {"type": str(dialog.chat.type.name)}
-
-    print(f"Загружено {len(cached_dialogs)} диалогов")
-
     # Собираем все уникальные ID чатов, которые нужно проверить
     all_chat_ids = set(SOURCE_CHAT_IDS)
     for dest_ids in FORWARDING_CONFIG.values():
         all_chat_ids.update(dest_ids)
 
-    # Отслеживаем проблемные чаты
-    problematic_chats = set()
-
-    # Проверяем все чаты за один проход
-    for chat_id in all_chat_ids:
-        if chat_id in cached_dialogs:
-            print(f"Доступ к чату {chat_id} подтвержден (из кэша диалогов)")
-        else:
-            try:
-                # Попытка получить информацию о чате напрямую, если его нет в диалогах
-                chat = await app.get_chat(chat_id)
-                print(f"Доступ к чату {chat_id} подтвержден (прямой запрос)")
-
-                # Сохраняем информацию о чате
-                if hasattr(chat, "username") and chat.username:
-                    chat_info[chat_id] = {
-                        "username": chat.username,
-                        "type": str(chat.type.name),
-                    }
-                else:
-                    chat_info[chat_id] = {"type": str(chat.type.name)}
-            except Exception as e:
-                print(f"Ошибка доступа к чату {chat_id}: {e}")
-                problematic_chats.add(chat_id)
+    # Словарь для хранения информации о чатах и проблемные чаты
+    chat_info, problematic_chats = await validate_added_chats(app, all_chat_ids)
 
     if problematic_chats:
         print(f"Найдено недоступных чатов: {len(problematic_chats)}")
 
     # Теперь обновляем конфигурацию на основе результатов
+    source_ids_before = set(SOURCE_CHAT_IDS) | set(FORWARDING_CONFIG)
+    drop_problematic_chats(SOURCE_CHAT_IDS, FORWARDING_CONFIG, problematic_chats)
+
+    # Рабочий процесс супервизора знает только маршруты своей шарды, поэтому
+    # никогда не сохраняет конфигурацию целиком
+    if has_saved_config() or settings.shard_count > 1:
+        # Из сохранённой конфигурации удаляем только недоступные чаты (и оставшиеся
+        # без назначений источники), остальные маршруты не перезаписываются
+        dropped_sources = source_ids_before - set(SOURCE_CHAT_IDS) - set(FORWARDING_CONFIG)
+        if remove_saved_chats(set(problematic_chats) | dropped_sources, chat_info):
+            print("Конфигурация обновлена после проверки доступа к чатам")
+    else:
+        # Новая конфигурация (папка или интерактивная настройка) сохраняется целиком
+        save_config(SOURCE_CHAT_IDS, FORWARDING_CONFIG, chat_info)
+
+    return SOURCE_CHAT_IDS, FORWARDING_CONFIG, chat_info
+
+
+def chat_info_entry(entry):
+    """
+    Формирует запись chat_info из записи кэша диалогов
+    """
+    if entry.get("username"):
+        return {"username": entry["username"], "type": entry["type"]}
+    return {"type": entry["type"]}
+
+
+def drop_problematic_chats(SOURCE_CHAT_IDS, FORWARDING_CONFIG, problematic_chats):
+    """
+    Удаляет недоступные чаты из конфигурации (изменяет её на месте)
+    """
     # Удаляем недоступные исходные чаты
     for source_id in list(SOURCE_CHAT_IDS):
         if source_id in problematic_chats:
@@ -93,11 +85,18 @@ async def validate_chats(app, SOURCE_CHAT_IDS, FORWARDING_CONFIG):
                 f"Исходный чат {source_id} удален из конфигурации (нет доступных чатов назначения)"
             )
 
-    # Сохраняем обновленную конфигурацию с информацией о чатах
-    save_config(SOURCE_CHAT_IDS, FORWARDING_CONFIG, chat_info)
-    print("Конфигурация обновлена после проверки доступа к чатам")
 
-    return SOURCE_CHAT_IDS, FORWARDING_CONFIG, chat_info
+async def validate_added_chats(app, chat_ids):
+    """
+    Проверяет доступ только к указанным чатам без перебора всех диалогов
+    (через постоянный кэш диалогов).
+
+    Returns:
+        tuple: (информация_о_чатах, недоступные_чаты)
+    """
+    entries, problematic_chats = await dialog_cache.resolve(app, chat_ids)
+    chat_info = {chat_id: chat_info_entry(entry) for chat_id, entry in entries.items()}
+    return chat_info, problematic_chats
 
 
 def print_current_config(FORWARDING_CONFIG, chat_info):
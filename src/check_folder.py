@@ -1,12 +1,11 @@
 # src/check_folder.py
 
-import json
-import os
-
 from pyrogram.raw import functions
 
 from .client import app
 from .config import settings
+from .config_manager import load_saved_config, save_config
+from .dialog_cache import dialog_cache
 
 
 # Имя папки с чатами для пересылки
@@ -19,41 +18,20 @@ async def check_folder_existence():
     """
     Проверяет существование папки с названием DIR_NAME в Telegram
     и извлекает из неё информацию о чатах для пересылки.
-    Если конфигурационный файл существует, использует его без запроса ввода.
+    Если сохранённая конфигурация существует, использует её без запроса ввода.
 
     Returns:
         tuple: (существует_ли_папка, конфигурация_чатов, информация_о_чатах)
     """
-    # Проверяем наличие файла конфигурации
-    if os.path.exists(CONFIG_FILE):
-        try:
-            print(f"\n=== Найден файл конфигурации {CONFIG_FILE} ===")
-            with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-                config = json.load(f)
-
-            source_chat_ids = config.get("SOURCE_CHAT_IDS", [])
-            forwarding_config = config.get("FORWARDING_CONFIG", {})
-            chat_info = config.get("CHAT_INFO", {})
-
-            # Выводим загруженную конфигурацию
-            print("Загруженная конфигурация пересылки:")
-            for source_id, dest_ids in forwarding_config.items():
-                print(
-                    f"Из: Чат {source_id} -> В: {', '.join([f'Чат {dest_id}' for dest_id in dest_ids])}"
-                )
-
-            print(f"✅ Конфигурация загружена из файла {CONFIG_FILE}")
-            print(
-                f"Для изменения конфигурации удалите файл {settings.bot_chats_config_file} и запустите бота снова."
-            )
-
-            return True, forwarding_config, chat_info
-        except Exception as e:
-            print(f"⚠️ Ошибка при чтении файла конфигурации: {str(e)}")
-            print("Продолжаем с настройкой через папку...")
-    else:
-        print(f"\n=== Файл конфигурации {CONFIG_FILE} не найден ===")
-        print("Продолжаем с настройкой через папку...")
+    # Проверяем наличие сохранённой конфигурации
+    has_config, _, forwarding_config, chat_info = load_saved_config()
+    if has_config:
+        print(f"✅ Конфигурация загружена из базы маршрутов ({CONFIG_FILE})")
+        print(
+            "Для изменения конфигурации очистите базу маршрутов (python -m src.route_store clear) и запустите бота снова."
+        )
+        return True, forwarding_config, chat_info
+    print("Продолжаем с настройкой через папку...")
 
     try:
         print("\n=== Проверка папки для пересылки сообщений ===")
@@ -79,12 +57,6 @@ async def check_folder_existence():
         # Словарь для хранения информации о чатах по номеру в списке
         dialog_dict = {}
 
-        # Сначала собираем все диалоги для быстрого поиска
-        all_dialogs = {}
-        print("Загрузка всех доступных диалогов...")
-        async for dialog in app.get_dialogs():
-            all_dialogs[dialog.chat.id] = dialog.chat
-
         # Собираем все чаты из папки
         print(f"Получение чатов из папки '{DIR_NAME}'...")
         for peer in target_folder.include_peers:
@@ -107,25 +79,23 @@ async def check_folder_existence():
 
         print(f"Найдено {len(folder_chats)} чатов в папке '{DIR_NAME}'")
 
+        # Получаем данные только о чатах из папки (через постоянный кэш диалогов)
+        folder_entries, _ = await dialog_cache.resolve(app, folder_chats)
+
         # Получаем дополнительную информацию о чатах для отображения в интерактивном меню
         chat_index = 1  # Начинаем нумерацию с 1
 
         for chat_id in folder_chats:
-            # Проверяем, есть ли чат в уже загруженных диалогах
-            if chat_id in all_dialogs:
-                chat = all_dialogs[chat_id]
+            # Проверяем, удалось ли получить данные о чате
+            if chat_id in folder_entries:
+                entry = folder_entries[chat_id]
 
                 # Определяем имя чата
-                if hasattr(chat, "title") and chat.title:
-                    chat_name = chat.title
-                elif hasattr(chat, "first_name"):
-                    chat_name = f"{chat.first_name} {chat.last_name or ''}".strip()
-                else:
-                    chat_name = f"Чат {chat_id}"
+                chat_name = entry["title"] or f"Чат {chat_id}"
 
                 # Сохраняем username, если есть
-                if hasattr(chat, "username") and chat.username:
-                    chat_info[chat_id]["username"] = chat.username
+                if entry["username"]:
+                    chat_info[chat_id]["username"] = entry["username"]
 
                 dialog_dict[chat_index] = {
                     "id": chat_id,
@@ -136,7 +106,7 @@ async def check_folder_existence():
                 print(f"- [{chat_index}] {chat_name} (ID: {chat_id})")
                 chat_index += 1
             else:
-                # Если чата нет в диалогах, мы всё равно добавляем его, но с пометкой
+                # Если чат недоступен, мы всё равно добавляем его, но с пометкой
                 chat_name = f"Чат {chat_id}"
                 dialog_dict[chat_index] = {
                     "id": chat_id,
@@ -243,17 +213,8 @@ async def check_folder_existence():
 
             print(f"Из: {source_name} -> В: {', '.join(dest_names)}")
 
-        # Сохраняем конфигурацию в файл
-        config = {
-            "SOURCE_CHAT_IDS": source_chat_ids,
-            "FORWARDING_CONFIG": forwarding_config,
-            "CHAT_INFO": chat_info,
-        }
-
-        with open(CONFIG_FILE, "w", encoding="utf-8") as f:
-            json.dump(config, f, indent=4, ensure_ascii=False)
-
-        print(f"✅ Конфигурация сохранена в файл {CONFIG_FILE}")
+        # Сохраняем конфигурацию (база маршрутов и файл)
+        save_config(source_chat_ids, forwarding_config, chat_info)
 
         return True, forwarding_config, chat_info
 
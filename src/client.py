@@ -1,14 +1,51 @@
 # src/client.py
 
+import asyncio
+
 from pyrogram import Client
 
 from .config import settings
+from .runtime import is_performance_profile
+
+
+def client_concurrency():
+    """
+    Число обработчиков обновлений и одновременных передач файлов
+    для клиентов Pyrogram: из настроек или по профилю выполнения.
+    """
+    performance = is_performance_profile()
+    workers = settings.client_workers or (
+        Client.WORKERS * 2 if performance else Client.WORKERS
+    )
+    transmissions = settings.max_concurrent_transmissions or (4 if performance else 1)
+    return workers, transmissions
+
+
+def create_client(session_name: str) -> Client:
+    """
+    Создает клиент Pyrogram для аккаунта с указанным файлом сессии
+    """
+    workers, transmissions = client_concurrency()
+    return Client(
+        session_name,
+        api_id=settings.api_id,
+        api_hash=settings.api_hash,
+        bot_token=None,  # Не используем токен бота для логина по номеру телефона
+        workers=workers,
+        max_concurrent_transmissions=transmissions,
+    )
+
+
+def bind_to_running_loop(client: Client):
+    """
+    Pyrogram запоминает цикл событий при создании клиента, а слушающий
+    клиент создаётся при импорте — до asyncio.run(). Перепривязываем его
+    к работающему циклу перед запуском.
+    """
+    loop = asyncio.get_running_loop()
+    client.loop = loop
+    client.dispatcher.loop = loop
 
 
-# Создаем экземпляр клиента Pyrogram
-app = Client(
-    "message_forwarder_bot",
-    api_id=settings.api_id,
-    api_hash=settings.api_hash,
-    bot_token=None,  # Не используем токен бота для логина по номеру телефона
-)
+# Создаем экземпляр клиента Pyrogram (слушающий аккаунт)
+app = create_client(settings.session_name)
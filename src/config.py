@@ -1,7 +1,7 @@
 # src/config.py
 
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from dotenv import load_dotenv
 
 load_dotenv(".env")
@@ -11,6 +11,40 @@ API_ID = int(os.getenv("API_ID", "12345"))
 API_HASH = os.getenv("API_HASH", "0123456789abcdef0123456789abcdef")
 CHATS_FLODER_NAME = "Forward Bot"
 BOT_CHATS_CONFIG_FILE = "forward_config.json"
+DELIVERY_QUEUE_SIZE = int(os.getenv("DELIVERY_QUEUE_SIZE", "1000"))
+RATE_LIMIT_DESTINATION = float(os.getenv("RATE_LIMIT_DESTINATION", "0.5"))
+RATE_LIMIT_ACCOUNT = float(os.getenv("RATE_LIMIT_ACCOUNT", "5"))
+BATCH_WINDOW_MS = int(os.getenv("BATCH_WINDOW_MS", "0"))
+FAST_START = os.getenv("FAST_START", "false").lower() in ("1", "true", "yes")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+SENDER_SESSIONS = [
+    name.strip() for name in os.getenv("SENDER_SESSIONS", "").split(",") if name.strip()
+]
+LISTENER_SENDS = os.getenv("LISTENER_SENDS", "true").lower() in ("1", "true", "yes")
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "0"))
+# Номер шарды и их количество (задаются супервизором для рабочих процессов)
+SHARD_INDEX = int(os.getenv("SHARD_INDEX", "0"))
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "1"))
+MEDIA_RELAY = os.getenv("MEDIA_RELAY", "false").lower() in ("1", "true", "yes")
+RUNTIME_PROFILE = os.getenv("RUNTIME_PROFILE", "default").lower()
+CLIENT_WORKERS = int(os.getenv("CLIENT_WORKERS", "0"))
+MAX_CONCURRENT_TRANSMISSIONS = int(os.getenv("MAX_CONCURRENT_TRANSMISSIONS", "0"))
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "20"))
+
+
+def shard_file_name(name: str) -> str:
+    """
+    Добавляет номер шарды к имени файла состояния или сессии
+    (forward_outbox.db -> forward_outbox_shard1.db), чтобы рабочие
+    процессы не делили между собой файлы.
+    """
+    if SHARD_COUNT <= 1:
+        return name
+    base, ext = os.path.splitext(name)
+    return f"{base}_shard{SHARD_INDEX}{ext}"
 
 
 @dataclass
@@ -18,12 +52,147 @@ class Config:
     # Telegram API sensitive data
     api_id: int = API_ID
     api_hash: str = API_HASH
+    # Имя файла сессии слушающего аккаунта
+    session_name: str = shard_file_name("message_forwarder_bot")
     # Имя файла для хранения конфигурации пересылки
     bot_chats_config_file: str = BOT_CHATS_CONFIG_FILE
+    # База маршрутов (SQLite); forward_config.json импортируется в неё и выгружается
+    # из неё. Общая для всех рабочих процессов супервизора
+    route_store_file: str = "forward_routes.db"
     # Имя папки для хранения чатов для пересылки
     chats_folder_name: str = CHATS_FLODER_NAME
     # Использовать интерактивный режим выбора чатов из папки
     interactive_folder_setup: bool = True
+    # Максимальный размер очереди доставки для одного чата назначения
+    delivery_queue_size: int = DELIVERY_QUEUE_SIZE
+    # Ограничение скорости: сообщений в секунду и размер «пачки» для одного чата назначения
+    rate_limit_destination: float = RATE_LIMIT_DESTINATION
+    rate_limit_destination_burst: float = 3
+    # Ограничение скорости для всего аккаунта
+    rate_limit_account: float = RATE_LIMIT_ACCOUNT
+    rate_limit_account_burst: float = 10
+    # Во сколько раз снижать скорость при FloodWait (для чата и для аккаунта)
+    rate_limit_decrease: float = 0.5
+    rate_limit_account_decrease: float = 0.9
+    # Доля базовой скорости, восстанавливаемая после каждой успешной отправки
+    rate_limit_recovery: float = 0.02
+    # Минимальная скорость (сообщений в секунду)
+    rate_limit_min_rate: float = 0.02
+    # Файл с выученными скоростями и интервал его сохранения (секунды)
+    rate_limits_file: str = shard_file_name("rate_limits.json")
+    rate_limit_save_interval: float = 30
+    # Сколько раз откладывать отправку из-за FloodWait, прежде чем отказаться от неё
+    flood_retry_budget: int = 5
+    # Базовая задержка экспоненциального повтора после FloodWait (секунды)
+    flood_retry_base_delay: float = 1.0
+    # Полосы доставки: сколько заданий каждой полосы отправляется одновременно
+    # (по всем чатам назначения). text — текст и пачки, media — фото и небольшие
+    # файлы, heavy — альбомы и крупные видео/документы
+    lane_concurrency: dict = field(
+        default_factory=lambda: {"text": 32, "media": 16, "heavy": 8}
+    )
+    # Начиная с какого размера файл считается крупным (байты)
+    lane_heavy_media_bytes: int = 10 * 2**20
+    # Честная очередь чата назначения: сколько сообщений источник с весом 1
+    # отправляет за свой ход (веса маршрутов — ROUTE_WEIGHTS в forward_config.json)
+    fair_queue_quantum: int = 10
+    # Файл базы исходящих доставок (outbox)
+    outbox_file: str = shard_file_name("forward_outbox.db")
+    # Максимальный размер пачки и интервал фиксации записей outbox (секунды)
+    outbox_batch_size: int = 500
+    outbox_flush_interval: float = 0.01
+    # Сборка медиагрупп: начальная оценка интервала между частями альбома,
+    # множитель и границы паузы ожидания, коэффициент сглаживания (секунды)
+    media_group_initial_gap: float = 0.15
+    media_group_gap_factor: float = 3.0
+    media_group_min_gap: float = 0.2
+    media_group_max_gap: float = 1.0
+    media_group_gap_alpha: float = 0.2
+    # Максимальное количество одновременно собираемых медиагрупп
+    media_group_buffer_limit: int = 1000
+    # Кэш обработанных обновлений (защита от дубликатов): размер, время жизни записи
+    # (секунды), файл снимка и интервал его сохранения (секунды)
+    dedup_max_entries: int = 100_000
+    dedup_ttl: float = 24 * 3600
+    dedup_snapshot_file: str = shard_file_name("dedup_cache.bin")
+    dedup_save_interval: float = 60
+    # Защита от петель маршрутов: сколько оригиналов ретранслированных сообщений
+    # помнить и как долго (секунды)
+    provenance_max_entries: int = 100_000
+    provenance_ttl: float = 6 * 3600
+    # Догонять при запуске сообщения, пропущенные пока бот был выключен
+    catch_up_enabled: bool = True
+    # Сколько исходных чатов догонять одновременно и максимум сообщений на чат
+    catch_up_concurrency: int = 4
+    catch_up_limit: int = 1000
+    # Окно объединения одиночных сообщений в одну пересылку (миллисекунды, 0 — выключено)
+    batch_window_ms: int = BATCH_WINDOW_MS
+    # Перечитывать forward_config.json при изменении (inotify или опрос) и по SIGHUP
+    config_watch_enabled: bool = True
+    # Интервал опроса файла, если inotify недоступен, и пауза перед перечитыванием (секунды)
+    config_poll_interval: float = 5
+    config_reload_debounce: float = 0.5
+    # Кэш метаданных диалогов: файл и время жизни записи (секунды)
+    dialog_cache_file: str = shard_file_name("dialog_cache.json")
+    dialog_cache_ttl: float = 24 * 3600
+    # Быстрый старт: регистрировать обработчик сразу после загрузки конфигурации,
+    # а доступ к чатам проверять в фоне
+    fast_start: bool = FAST_START
+    # Сколько чатов проверять одновременно
+    validation_concurrency: int = 8
+    # Логирование: уровень (DEBUG включает запись о каждом сообщении) и формат (json/text)
+    log_level: str = LOG_LEVEL
+    log_format: str = LOG_FORMAT
+    # Не более log_sample_burst записей одного вида за log_sample_interval секунд
+    log_sample_burst: int = 20
+    log_sample_interval: float = 1.0
+    # HTTP-эндпоинт метрик Prometheus (порт 0 — выключен)
+    metrics_port: int = METRICS_PORT
+    metrics_host: str = METRICS_HOST
+    # Период измерения задержки цикла событий (секунды)
+    metrics_lag_interval: float = 0.5
+    # Дополнительные отправляющие аккаунты (имена файлов сессий)
+    sender_sessions: list = field(default_factory=lambda: list(SENDER_SESSIONS))
+    # Отправляет ли сообщения слушающий аккаунт (если есть другие отправляющие)
+    listener_sends: bool = LISTENER_SENDS
+    # FloodWait (секунды), начиная с которого отправка переключается на другой аккаунт
+    account_failover_flood_wait: float = 60
+    # Сколько помнить, что аккаунту недоступен чат назначения (секунды):
+    # аккаунт могут вернуть в чат или снять с него бан
+    account_exclude_ttl: float = 3600
+    # Режим супервизора: число рабочих процессов, между которыми делятся
+    # исходные чаты (0 или 1 — всё в одном процессе)
+    worker_processes: int = WORKER_PROCESSES
+    shard_index: int = SHARD_INDEX
+    shard_count: int = SHARD_COUNT
+    # Пауза перед перезапуском упавшего рабочего процесса (удваивается до максимума)
+    worker_restart_delay: float = 1.0
+    worker_restart_max_delay: float = 60
+    # Сколько ждать завершения рабочих процессов при остановке (секунды)
+    worker_stop_timeout: float = 30
+    # Кэш возможностей маршрутов: сколько помнить, что метод отправки не работает
+    # для пары чатов (секунды), и максимум пар в кэше
+    capability_cache_ttl: float = 3600
+    capability_cache_max_entries: int = 10_000
+    # Ретрансляция медиа из защищённых чатов: скачать один раз в локальный кэш
+    # (по file_unique_id), загрузить один раз и дальше отправлять по file_id
+    media_relay_enabled: bool = MEDIA_RELAY
+    media_relay_dir: str = shard_file_name("media_cache")
+    # Предельный объём кэша на диске и размер одного файла (байты)
+    media_relay_max_bytes: int = 1024 * 2**20
+    media_relay_max_file_size: int = 50 * 2**20
+    # Сколько file_id загруженных файлов помнить
+    media_relay_max_file_ids: int = 10_000
+    # Профиль выполнения: default — как раньше, performance — uvloop (если
+    # установлен) и больше параллелизма в клиенте Pyrogram
+    runtime_profile: str = RUNTIME_PROFILE
+    # Обработчики обновлений и одновременные загрузки/скачивания файлов
+    # у клиентов Pyrogram (0 — по профилю)
+    client_workers: int = CLIENT_WORKERS
+    max_concurrent_transmissions: int = MAX_CONCURRENT_TRANSMISSIONS
+    # Сколько при остановке ждать доставки уже принятых сообщений (секунды);
+    # недоставленное остаётся в outbox и будет отправлено после запуска
+    shutdown_drain_timeout: float = SHUTDOWN_DRAIN_TIMEOUT
 
 
 # Глобальное объявление настроек
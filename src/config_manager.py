@@ -1,53 +1,136 @@
 # src/config_manager.py
 
-import json
+import os
 
 from .config import settings
+from .route_store import route_store
+from .rules import normalize_rule
 
 
-# Файл с конфигурацией пересылки бота
+# Файл с конфигурацией пересылки бота (формат импорта и экспорта базы маршрутов)
 CONFIG_FILE = settings.bot_chats_config_file
 
 
 def load_saved_config():
     """
-    Загружает сохраненную конфигурацию из файла, включая информацию о чатах
+    Загружает сохраненную конфигурацию из базы маршрутов, включая информацию
+    о чатах. Ручные изменения forward_config.json сначала импортируются в базу.
     """
     try:
-        with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-            config = json.load(f)
-            SOURCE_CHAT_IDS = config.get("SOURCE_CHAT_IDS", [])
-            FORWARDING_CONFIG = config.get("FORWARDING_CONFIG", {})
-
-            # Конвертируем строковые ключи обратно в int, так как JSON сохраняет все ключи как строки
-            FORWARDING_CONFIG = {int(k): v for k, v in FORWARDING_CONFIG.items()}
-
-            # Загружаем информацию о чатах, если она есть
-            chat_info = config.get("CHAT_INFO", {})
-            # Конвертируем строковые ключи обратно в int
-            chat_info = {int(k): v for k, v in chat_info.items()} if chat_info else {}
-
-        print("Загружена сохраненная конфигурация:")
-        for source_id in FORWARDING_CONFIG:
-            print(f"Из чата {source_id} в чаты: {FORWARDING_CONFIG[source_id]}")
-        return True, SOURCE_CHAT_IDS, FORWARDING_CONFIG, chat_info
-    except (FileNotFoundError, json.JSONDecodeError):
+        if route_store.sync_from_json(CONFIG_FILE):
+            print(f"База маршрутов обновлена по файлу {CONFIG_FILE}")
+    except (ValueError, TypeError, AttributeError) as e:
+        print(f"Файл {CONFIG_FILE} повреждён ({e}), используется база маршрутов")
+
+    if route_store.is_empty():
         print("Сохраненная конфигурация не найдена или повреждена")
         return False, [], {}, {}
 
+    SOURCE_CHAT_IDS, FORWARDING_CONFIG, chat_info = route_store.load()
+    print("Загружена сохраненная конфигурация:")
+    for source_id in FORWARDING_CONFIG:
+        print(f"Из чата {source_id} в чаты: {FORWARDING_CONFIG[source_id]}")
+    return True, SOURCE_CHAT_IDS, FORWARDING_CONFIG, chat_info
+
+
+def load_route_weights(forwarding_config):
+    """
+    Загружает веса маршрутов из ROUTE_WEIGHTS файла конфигурации:
+    {"<источник>": вес} — для всех чатов назначения источника,
+    {"<источник>": {"<назначение>": вес}} — для отдельных маршрутов.
+
+    Returns:
+        dict: {(source_chat_id, dest_chat_id): вес} для маршрутов из forwarding_config
+    """
+    weights = {}
+    for source_id, value in route_store.section("ROUTE_WEIGHTS").items():
+        per_dest = value if isinstance(value, dict) else {None: value}
+        for dest_id, weight in per_dest.items():
+            try:
+                key = (int(source_id), int(dest_id) if dest_id is not None else None)
+                weight = float(weight)
+            except (TypeError, ValueError):
+                weight = 0
+            if weight <= 0:
+                print(f"Некорректный вес маршрута {source_id} -> {dest_id}: {weight}, пропущен")
+                continue
+            weights[key] = weight
+
+    # Вес отдельного маршрута важнее веса источника
+    route_weights = {}
+    for source_id, dest_ids in forwarding_config.items():
+        for dest_id in dest_ids:
+            weight = weights.get((source_id, dest_id), weights.get((source_id, None)))
+            if weight is not None:
+                route_weights[(source_id, dest_id)] = weight
+    return route_weights
+
+
+def load_route_rules(forwarding_config):
+    """
+    Загружает правила маршрутов из ROUTE_RULES файла конфигурации:
+    {"<источник>": правило} — для всех чатов назначения источника,
+    {"<источник>": {"<назначение>": правило}} — для отдельных маршрутов.
+    Правило — объект с полями keywords, exclude_keywords, regex,
+    exclude_regex, hashtags, exclude_hashtags, media, exclude_media
+    и forwarded (см. README).
+
+    Returns:
+        dict: {(source_chat_id, dest_chat_id): нормализованное правило}
+    """
+    rules = {}
+    for source_id, value in route_store.section("ROUTE_RULES").items():
+        # Правило для отдельных маршрутов — объект, ключи которого являются ID чатов
+        per_dest = {None: value}
+        if isinstance(value, dict) and value and all(
+            k.lstrip("-").isdigit() for k in value
+        ):
+            per_dest = value
+        for dest_id, raw_rule in per_dest.items():
+            try:
+                key = (int(source_id), int(dest_id) if dest_id is not None else None)
+                rule = normalize_rule(raw_rule)
+            except ValueError as e:
+                print(f"Некорректное правило маршрута {source_id} -> {dest_id}: {e}, пропущено")
+                continue
+            rules[key] = rule
+
+    # Правило отдельного маршрута заменяет правило источника
+    route_rules = {}
+    for source_id, dest_ids in forwarding_config.items():
+        for dest_id in dest_ids:
+            rule = rules.get((source_id, dest_id), rules.get((source_id, None)))
+            if rule:
+                route_rules[(source_id, dest_id)] = rule
+    return route_rules
+
 
 def save_config(SOURCE_CHAT_IDS, FORWARDING_CONFIG, chat_info=None):
     """
-    Сохраняет конфигурацию в файл
+    Сохраняет конфигурацию в базу маршрутов (одной транзакцией, меняя только
+    отличающиеся строки) и, если она изменилась, выгружает её в файл.
+    Веса и правила маршрутов задаются вручную и не затрагиваются.
     """
-    config = {
-        "SOURCE_CHAT_IDS": SOURCE_CHAT_IDS,
-        "FORWARDING_CONFIG": FORWARDING_CONFIG,
-    }
+    changes = route_store.replace(SOURCE_CHAT_IDS, FORWARDING_CONFIG, chat_info)
+    if changes or not os.path.exists(CONFIG_FILE):
+        route_store.export_json(CONFIG_FILE)
+        print(f"Конфигурация сохранена в файл {CONFIG_FILE}")
+
 
-    if chat_info:
-        config["CHAT_INFO"] = chat_info
+def has_saved_config() -> bool:
+    return not route_store.is_empty()
 
-    with open(CONFIG_FILE, "w", encoding="utf-8") as f:
-        json.dump(config, f, indent=4, ensure_ascii=False)
-    print(f"Конфигурация сохранена в файл {CONFIG_FILE}")
+
+def remove_saved_chats(chat_ids, chat_info=None):
+    """
+    Убирает из сохранённой конфигурации недоступные чаты и обновляет
+    информацию о чатах. Остальные маршруты не перезаписываются, поэтому
+    рабочие процессы супервизора не затирают маршруты чужих шард.
+
+    Returns:
+        bool: изменилась ли конфигурация
+    """
+    if not route_store.remove_chats(chat_ids, chat_info):
+        return False
+    route_store.export_json(CONFIG_FILE)
+    return True
@@ -0,0 +1,173 @@
+# src/config_watcher.py
+
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import signal
+import struct
+
+from .config import settings
+from .logger import get_logger
+
+
+logger = get_logger("config_watcher")
+
+
+# Флаги inotify (см. <sys/inotify.h>)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+def _open_inotify(directory):
+    """
+    Открывает inotify-дескриптор, следящий за каталогом.
+    Возвращает None, если inotify недоступен (не Linux, нет libc и т.п.).
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+
+    wd = libc.inotify_add_watch(
+        fd,
+        os.fsencode(directory),
+        IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE,
+    )
+    if wd < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
+class ConfigWatcher:
+    """
+    Следит за файлом конфигурации и вызывает on_change() при его изменении.
+    Использует inotify (Linux), а если он недоступен — периодически
+    проверяет время изменения файла. Перечитать конфигурацию можно
+    и вручную, отправив процессу сигнал SIGHUP.
+    При watch_file=False реагирует только на SIGHUP (рабочие процессы
+    супервизора получают изменения конфигурации от него).
+    """
+
+    def __init__(self, path: str, on_change, watch_file: bool = True):
+        self.path = os.path.abspath(path)
+        # on_change() — корутина, перечитывающая конфигурацию
+        self.on_change = on_change
+        self.watch_file = watch_file
+        self.fd = None
+        self.poll_task = None
+        self.reload_task = None
+        self.reload_pending = False
+        self.debounce = None
+        self.mtime = self._mtime()
+
+    def _mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+
+        if self.watch_file:
+            self.fd = _open_inotify(os.path.dirname(self.path))
+            if self.fd is not None:
+                loop.add_reader(self.fd, self._on_inotify)
+                logger.info("Слежение за файлом конфигурации через inotify", file=self.path)
+            else:
+                self.poll_task = asyncio.create_task(self._poll())
+                logger.info(
+                    "Слежение за файлом конфигурации опросом",
+                    file=self.path,
+                    interval=settings.config_poll_interval,
+                )
+
+        try:
+            loop.add_signal_handler(signal.SIGHUP, self.request_reload)
+        except (NotImplementedError, AttributeError, RuntimeError):
+            # SIGHUP недоступен (например, в Windows)
+            pass
+
+    def _on_inotify(self):
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+
+        name = os.path.basename(self.path)
+        offset = 0
+        changed = False
+        while offset + INOTIFY_EVENT.size <= len(data):
+            _, _, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            event_name = data[offset : offset + length].rstrip(b"\0").decode(
+                errors="replace"
+            )
+            offset += length
+            if event_name == name:
+                changed = True
+
+        if changed:
+            self._schedule_reload()
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(settings.config_poll_interval)
+            mtime = self._mtime()
+            if mtime != self.mtime:
+                self.mtime = mtime
+                self._schedule_reload()
+
+    def _schedule_reload(self):
+        # Файл обычно пишется несколькими операциями — ждём, пока запись закончится
+        if self.debounce is not None:
+            self.debounce.cancel()
+        self.debounce = asyncio.get_running_loop().call_later(
+            settings.config_reload_debounce, self.request_reload
+        )
+
+    def request_reload(self):
+        """
+        Запускает перечитывание конфигурации (не более одного одновременно).
+        """
+        self.debounce = None
+        if self.reload_task is not None and not self.reload_task.done():
+            # Перечитаем ещё раз после текущей перезагрузки
+            self.reload_pending = True
+            return
+        self.reload_task = asyncio.create_task(self._reload())
+
+    async def _reload(self):
+        while True:
+            self.reload_pending = False
+            try:
+                await self.on_change()
+            except Exception:
+                logger.exception("Ошибка при перезагрузке конфигурации")
+            if not self.reload_pending:
+                break
+
+    async def stop(self):
+        loop = asyncio.get_running_loop()
+        if self.fd is not None:
+            loop.remove_reader(self.fd)
+            os.close(self.fd)
+            self.fd = None
+        if self.poll_task is not None:
+            self.poll_task.cancel()
+            await asyncio.gather(self.poll_task, return_exceptions=True)
+            self.poll_task = None
+        if self.debounce is not None:
+            self.debounce.cancel()
+        try:
+            loop.remove_signal_handler(signal.SIGHUP)
+        except (NotImplementedError, AttributeError, RuntimeError):
+            pass
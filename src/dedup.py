@@ -0,0 +1,157 @@
+# src/dedup.py
+
+import asyncio
+import os
+import struct
+import time
+from collections import OrderedDict
+
+from .config import settings
+from .logger import get_logger
+from .metrics import registry
+
+
+logger = get_logger("dedup")
+
+
+# Файл снимка кэша (лежит рядом с forward_config.json)
+DEDUP_SNAPSHOT_FILE = os.path.join(
+    os.path.dirname(settings.bot_chats_config_file), settings.dedup_snapshot_file
+)
+
+# Запись снимка: chat_id, message_id, edit_date (unix-время или 0), время добавления
+SNAPSHOT_RECORD = struct.Struct("<qqqd")
+
+duplicates_total = registry.counter(
+    "forwarder_duplicates_total",
+    "Повторно доставленные обновления, пропущенные кэшем дубликатов",
+    ("source",),
+)
+
+
+class DedupCache:
+    """
+    Кэш уже обработанных обновлений для защиты от повторной пересылки
+    (например, после переподключения Pyrogram может прислать их снова).
+
+    LRU с TTL поверх OrderedDict: проверка и добавление за O(1), число
+    записей ограничено, поэтому объём памяти не зависит от трафика.
+    Содержимое периодически сохраняется в компактный бинарный снимок,
+    чтобы кэш переживал перезапуски.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, snapshot_file: str):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.snapshot_file = snapshot_file
+        self.entries = OrderedDict()  # {(chat_id, message_id, edit_date): seen_at}
+        self.dirty = False
+        self.save_task = None
+
+    @staticmethod
+    def message_key(message):
+        edit_date = int(message.edit_date.timestamp()) if message.edit_date else 0
+        return (message.chat.id, message.id, edit_date)
+
+    def _expire(self, now: float):
+        # Самые старые записи всегда в начале словаря
+        while self.entries:
+            key, seen_at = next(iter(self.entries.items()))
+            if now - seen_at < self.ttl:
+                break
+            del self.entries[key]
+
+    def check_and_add(self, key) -> bool:
+        """
+        Возвращает True, если обновление уже встречалось (дубликат),
+        иначе запоминает его и возвращает False.
+        """
+        now = time.time()
+        self._expire(now)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.entries[key] = now
+            duplicates_total.inc((key[0],))
+            return True
+
+        self.entries[key] = now
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self.dirty = True
+        return False
+
+    def load(self):
+        """
+        Загружает снимок кэша с диска, пропуская устаревшие записи.
+        """
+        try:
+            with open(self.snapshot_file, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+
+        now = time.time()
+        usable = len(data) - len(data) % SNAPSHOT_RECORD.size
+        for chat_id, message_id, edit_date, seen_at in SNAPSHOT_RECORD.iter_unpack(
+            data[:usable]
+        ):
+            if now - seen_at < self.ttl:
+                self.entries[(chat_id, message_id, edit_date)] = seen_at
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        logger.info(
+            "Загружен кэш дубликатов", entries=len(self.entries), file=self.snapshot_file
+        )
+
+    def save(self):
+        """
+        Атомарно сохраняет снимок кэша на диск.
+        """
+        self._expire(time.time())
+        data = b"".join(
+            SNAPSHOT_RECORD.pack(chat_id, message_id, edit_date, seen_at)
+            for (chat_id, message_id, edit_date), seen_at in self.entries.items()
+        )
+        tmp_file = self.snapshot_file + ".tmp"
+        with open(tmp_file, "wb") as f:
+            f.write(data)
+        os.replace(tmp_file, self.snapshot_file)
+        self.dirty = False
+
+    async def _save_periodically(self):
+        while True:
+            await asyncio.sleep(settings.dedup_save_interval)
+            if self.dirty:
+                try:
+                    self.save()
+                except OSError as e:
+                    logger.error(
+                        "Не удалось сохранить кэш дубликатов",
+                        file=self.snapshot_file,
+                        error=repr(e),
+                    )
+
+    def start(self):
+        self.load()
+        if self.save_task is None:
+            self.save_task = asyncio.create_task(self._save_periodically())
+
+    async def stop(self):
+        if self.save_task is not None:
+            self.save_task.cancel()
+            await asyncio.gather(self.save_task, return_exceptions=True)
+            self.save_task = None
+        if self.dirty:
+            self.save()
+
+
+# Глобальный кэш обработанных обновлений
+dedup_cache = DedupCache(
+    settings.dedup_max_entries, settings.dedup_ttl, DEDUP_SNAPSHOT_FILE
+)
+
+registry.gauge(
+    "forwarder_dedup_cache_entries",
+    "Обновления в кэше дубликатов",
+    lambda: len(dedup_cache.entries),
+)
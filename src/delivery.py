@@ -0,0 +1,338 @@
+# src/delivery.py
+
+import asyncio
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+
+from pyrogram.errors import FloodWait
+
+from .accounts import SwitchAccount, account_pool
+from .config import settings
+from .fair_queue import FairQueue
+from .logger import get_logger
+from .metrics import registry
+from .outbox import outbox
+from .retry_queue import retry_scheduler
+
+
+logger = get_logger("delivery")
+
+# Полосы доставки в порядке приоритета
+LANES = ("text", "media", "heavy")
+
+# Виды медиа, которые бывают крупными (фото всегда небольшие)
+HEAVY_MEDIA_KINDS = ("video", "document", "animation", "audio")
+
+
+@dataclass
+class DeliveryJob:
+    """
+    Задание на доставку сообщения (или альбома) из одного исходного чата
+    в один чат назначения.
+    """
+
+    source_chat_id: int
+    dest_chat_id: int
+    message_ids: list
+    prefix: str
+    media_group_id: str = None
+    # Объекты сообщений (нет у заданий, восстановленных из outbox)
+    messages: list = None
+    created_at: float = field(default_factory=time.monotonic)
+    # Сколько раз задание уже откладывалось из-за FloodWait
+    attempts: int = 0
+    # ID записи в outbox
+    outbox_id: int = None
+    # Полоса доставки (определяется при постановке в очередь)
+    lane: str = None
+
+
+def job_lane(job: DeliveryJob) -> str:
+    """
+    Полоса доставки задания: альбомы и крупные файлы — heavy, остальные
+    медиа — media, текст и пачки текста — text. Полоса сохраняется в outbox,
+    поэтому восстановленные задания возвращаются в свою полосу; в среднюю
+    идут только задания из outbox прежних версий.
+    """
+    if job.media_group_id:
+        return "heavy"
+    if not job.messages:
+        return "media"
+    lane = "text"
+    for message in job.messages:
+        if not message.media:
+            continue
+        lane = "media"
+        kind = getattr(message.media, "value", message.media)
+        if kind in HEAVY_MEDIA_KINDS:
+            size = getattr(getattr(message, kind, None), "file_size", None)
+            if size is None or size >= settings.lane_heavy_media_bytes:
+                return "heavy"
+    return lane
+
+
+class DeliveryEngine:
+    """
+    Движок доставки: для каждого чата назначения и полосы (text, media,
+    heavy) держит собственную ограниченную очередь и воркер. Очередь честно
+    делит чат назначения между исходными чатами (FairQueue). Обработчик
+    входящих сообщений только кладёт задания в очереди и сразу возвращается,
+    а разные чаты назначения обслуживаются параллельно. Порядок доставки
+    внутри пары (источник, назначение) сохраняется в пределах полосы, т.к.
+    очередь разбирает ровно один воркер; между полосами текст может обогнать
+    более раннее медиа того же маршрута (так задумано, см. README).
+
+    Полосы нужны, чтобы короткий текст не ждал за альбомами и крупными
+    видео: у каждой полосы свой лимит одновременных отправок по всем чатам,
+    поэтому тяжёлые загрузки не занимают всё соединение.
+
+    Если отправка упирается в FloodWait, задание паркуется в RetryScheduler,
+    а все полосы этого чата приостанавливаются (чтобы не нарушить порядок);
+    остальные чаты продолжают работу. Полоса снова работает, когда
+    вернулись с парковки все её задания, а полосы без отложенных заданий —
+    с возвратом первого задания чата (к этому моменту FloodWait истёк).
+    """
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self.queues = {}  # {(dest_chat_id, lane): FairQueue}
+        self.workers = {}  # {(dest_chat_id, lane): asyncio.Task}
+        # {(dest_chat_id, lane): deque} задания, вернувшиеся с парковки
+        self.retries = {}
+        self.resumed = {}  # {(dest_chat_id, lane): asyncio.Event} полоса не на паузе
+        self.parked = Counter()  # {(dest_chat_id, lane): отложенные задания}
+        self.lane_slots = {}  # {lane: asyncio.Semaphore} лимит одновременных отправок
+        self.lane_busy = Counter()  # {lane: отправки, идущие прямо сейчас}
+        self.active = 0  # Задания, которые воркеры доставляют прямо сейчас
+        self.sender = None
+
+    def set_sender(self, sender):
+        """
+        Устанавливает корутину-отправителя: sender(job, account) доставляет
+        одно задание с указанного отправляющего аккаунта.
+        """
+        self.sender = sender
+
+    def _get_queue(self, dest_chat_id, lane):
+        key = (dest_chat_id, lane)
+        queue = self.queues.get(key)
+        if queue is None:
+            queue = FairQueue(dest_chat_id, self.queue_size)
+            self.queues[key] = queue
+            self.retries[key] = deque()
+            self.resumed[key] = asyncio.Event()
+            if not self._dest_parked(dest_chat_id):
+                self.resumed[key].set()
+            if lane not in self.lane_slots:
+                self.lane_slots[lane] = asyncio.Semaphore(settings.lane_concurrency[lane])
+            self.workers[key] = asyncio.create_task(
+                self._worker(dest_chat_id, lane, queue)
+            )
+        return queue
+
+    async def enqueue(self, job: DeliveryJob):
+        """
+        Записывает задание в outbox и ставит в очередь его полосы чата
+        назначения. Если очередь заполнена, ожидает освобождения места
+        (backpressure).
+        """
+        await self.enqueue_many([job])
+
+    async def enqueue_many(self, jobs):
+        """
+        Как enqueue, но для нескольких заданий (одно сообщение во все чаты
+        назначения): все они записываются в outbox одной фиксацией, поэтому
+        постановка не ждёт отдельного сброса на диск для каждого чата.
+        """
+        for job in jobs:
+            if job.lane is None:
+                job.lane = job_lane(job)
+        new_jobs = [job for job in jobs if job.outbox_id is None]
+        if new_jobs:
+            for job, outbox_id in zip(new_jobs, await outbox.add_many(new_jobs)):
+                job.outbox_id = outbox_id
+        for job in jobs:
+            await self._get_queue(job.dest_chat_id, job.lane).put(job)
+
+    async def _worker(self, dest_chat_id, lane, queue: FairQueue):
+        """
+        Последовательно доставляет задания из очереди одной полосы чата
+        назначения. Задания, вернувшиеся с парковки, доставляются раньше новых.
+        """
+        retries = self.retries[(dest_chat_id, lane)]
+        resumed = self.resumed[(dest_chat_id, lane)]
+        slots = self.lane_slots[lane]
+        while True:
+            await resumed.wait()
+            if retries:
+                job = retries.popleft()
+            else:
+                job = await queue.get()
+                if not resumed.is_set():
+                    # Полоса встала на паузу (FloodWait в другой полосе чата),
+                    # пока воркер ждал задания: отправим его после паузы
+                    retries.appendleft(job)
+                    continue
+            self.active += 1
+            # Аккаунт, отвечающий за чат назначения (или замена, если он в FloodWait)
+            account = account_pool.pick(dest_chat_id)
+            try:
+                # Сначала ждём разрешения ограничителя скорости (чат назначения
+                # + аккаунт), и только потом занимаем место в полосе: места общие
+                # для всех чатов, и ожидание одного чата не должно их занимать
+                await account.rate_limiter.acquire(dest_chat_id)
+                if not resumed.is_set():
+                    # Пауза началась, пока задание ждало ограничителя
+                    retries.appendleft(job)
+                    continue
+                async with slots:
+                    self.lane_busy[lane] += 1
+                    try:
+                        await self.sender(job, account)
+                    finally:
+                        self.lane_busy[lane] -= 1
+            except asyncio.CancelledError:
+                raise
+            except SwitchAccount:
+                # Сразу повторяем с другого аккаунта, сохраняя порядок
+                retries.appendleft(job)
+                continue
+            except FloodWait as fw:
+                if account_pool.on_flood_wait(account, fw.value):
+                    retries.appendleft(job)
+                else:
+                    self._park(job, fw.value)
+                continue
+            except Exception as e:
+                logger.error(
+                    "Ошибка доставки",
+                    key="delivery.error",
+                    source=job.source_chat_id,
+                    dest=dest_chat_id,
+                    message_ids=job.message_ids,
+                    error=repr(e),
+                )
+            finally:
+                self.active -= 1
+            outbox.done(job.outbox_id)
+
+    def _park(self, job: DeliveryJob, flood_wait: float):
+        """
+        Откладывает задание после FloodWait с экспоненциальной задержкой,
+        пока не исчерпан бюджет повторов.
+        """
+        job.attempts += 1
+        if job.attempts > settings.flood_retry_budget:
+            logger.error(
+                "Исчерпан бюджет повторов, задание отброшено",
+                source=job.source_chat_id,
+                dest=job.dest_chat_id,
+                message_ids=job.message_ids,
+                budget=settings.flood_retry_budget,
+            )
+            outbox.done(job.outbox_id)
+            return
+
+        delay = max(
+            flood_wait, settings.flood_retry_base_delay * 2 ** (job.attempts - 1)
+        )
+        logger.info(
+            "Задание отложено после FloodWait",
+            key="delivery.park",
+            dest=job.dest_chat_id,
+            attempt=job.attempts,
+            delay=delay,
+        )
+        self.parked[(job.dest_chat_id, job.lane)] += 1
+        for lane in LANES:
+            event = self.resumed.get((job.dest_chat_id, lane))
+            if event is not None:
+                event.clear()
+        retry_scheduler.park(job, delay, self._resume)
+
+    def _dest_parked(self, dest_chat_id) -> bool:
+        return any(self.parked[(dest_chat_id, lane)] for lane in LANES)
+
+    def _resume(self, job: DeliveryJob):
+        """
+        Возвращает задание с парковки в начало очереди его полосы.
+        Снимаются с паузы только полосы чата, у которых не осталось
+        отложенных заданий: иначе новые задания обогнали бы отложенное
+        и упёрлись бы в тот же FloodWait.
+        """
+        key = (job.dest_chat_id, job.lane)
+        self.retries[key].append(job)
+        self.parked[key] -= 1
+        if not self.parked[key]:
+            del self.parked[key]
+        for lane in LANES:
+            lane_key = (job.dest_chat_id, lane)
+            event = self.resumed.get(lane_key)
+            if event is not None and not self.parked[lane_key]:
+                event.set()
+
+    async def replay(self, rows):
+        """
+        Повторно ставит в очереди доставки, незавершённые до перезапуска.
+        """
+        await self.enqueue_many([DeliveryJob(**row) for row in rows])
+        if rows:
+            logger.info("Восстановлены незавершённые доставки из outbox", jobs=len(rows))
+
+    def pending(self):
+        """
+        Возвращает общее количество заданий, ожидающих доставки
+        (включая доставляемые в данный момент).
+        """
+        return sum(queue.qsize() for queue in self.queues.values()) + sum(
+            len(retries) for retries in self.retries.values()
+        ) + len(retry_scheduler) + self.active
+
+    def queue_depths(self):
+        """
+        Возвращает количество заданий в очереди каждой полосы чата назначения
+        (включая вернувшиеся с парковки).
+        """
+        return {
+            key: queue.qsize() + len(self.retries[key])
+            for key, queue in self.queues.items()
+        }
+
+    async def stop(self):
+        """
+        Останавливает все воркеры доставки.
+        """
+        for task in self.workers.values():
+            task.cancel()
+        await asyncio.gather(*self.workers.values(), return_exceptions=True)
+        self.workers.clear()
+        self.queues.clear()
+        self.retries.clear()
+        self.resumed.clear()
+        self.parked.clear()
+        self.lane_slots.clear()
+        self.active = 0
+        await retry_scheduler.stop()
+
+
+# Глобальный движок доставки
+delivery_engine = DeliveryEngine(settings.delivery_queue_size)
+
+registry.gauge(
+    "forwarder_delivery_queue_depth",
+    "Задания в очереди доставки чата назначения по полосам",
+    delivery_engine.queue_depths,
+    ("dest", "lane"),
+)
+registry.gauge(
+    "forwarder_delivery_lane_busy",
+    "Отправки, выполняемые сейчас в полосе доставки",
+    lambda: {(lane,): busy for lane, busy in delivery_engine.lane_busy.items()},
+    ("lane",),
+)
+registry.gauge(
+    "forwarder_delivery_parked",
+    "Задания, отложенные после FloodWait",
+    lambda: len(retry_scheduler),
+)
@@ -0,0 +1,233 @@
+# src/dialog_cache.py
+
+import asyncio
+import json
+import os
+import time
+
+from .config import settings
+from .logger import get_logger
+
+
+logger = get_logger("dialog_cache")
+
+
+# Файл кэша диалогов (лежит рядом с forward_config.json)
+DIALOG_CACHE_FILE = os.path.join(
+    os.path.dirname(settings.bot_chats_config_file), settings.dialog_cache_file
+)
+
+
+def chat_title(chat):
+    """
+    Возвращает отображаемое имя чата
+    """
+    if getattr(chat, "title", None):
+        return chat.title
+    if getattr(chat, "first_name", None):
+        return f"{chat.first_name} {chat.last_name or ''}".strip()
+    return None
+
+
+async def has_peer(app, chat_id):
+    """
+    Проверяет, известен ли peer (с access hash) хранилищу сессии Pyrogram.
+    """
+    try:
+        await app.storage.get_peer_by_id(chat_id)
+        return True
+    except KeyError:
+        return False
+
+
+class DialogCache:
+    """
+    Постоянный кэш метаданных диалогов (id, тип, username, название,
+    наличие access hash в сессии), чтобы не перебирать все get_dialogs()
+    при каждом запуске.
+
+    При запуске проверяются только чаты из конфигурации: свежие записи
+    берутся из кэша, устаревшие и отсутствующие запрашиваются по одной.
+    Если чат не удаётся получить напрямую (в сессии нет его access hash),
+    диалоги перечитываются инкрементально — только изменившиеся с прошлой
+    синхронизации.
+    """
+
+    def __init__(self, cache_file: str):
+        self.cache_file = cache_file
+        self.entries = {}  # {chat_id: {...}}
+        # Дата самого свежего сообщения среди уже прочитанных диалогов (unix-время)
+        self.last_sync = 0
+        self.loaded = False
+        self.dirty = False
+
+    def load(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        try:
+            with open(self.cache_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        self.last_sync = data.get("last_sync", 0)
+        self.entries = {int(k): v for k, v in data.get("entries", {}).items()}
+
+    def save(self):
+        if not self.dirty:
+            return
+        data = {
+            "last_sync": self.last_sync,
+            "entries": {str(k): v for k, v in self.entries.items()},
+        }
+        tmp_file = self.cache_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_file, self.cache_file)
+        self.dirty = False
+
+    def update(self, chat, has_access_hash=True):
+        """
+        Сохраняет метаданные чата в кэш и возвращает запись.
+        """
+        entry = {
+            "id": chat.id,
+            "type": str(chat.type.name),
+            "username": getattr(chat, "username", None),
+            "title": chat_title(chat),
+            "has_access_hash": has_access_hash,
+            "updated_at": time.time(),
+        }
+        self.entries[chat.id] = entry
+        self.dirty = True
+        return entry
+
+    def get_fresh(self, chat_id):
+        """
+        Возвращает запись, если она есть, не устарела и peer известен сессии.
+        """
+        entry = self.entries.get(chat_id)
+        if (
+            entry
+            and entry.get("has_access_hash")
+            and time.time() - entry["updated_at"] < settings.dialog_cache_ttl
+        ):
+            return entry
+        return None
+
+    async def refresh_incremental(self, app, full=False):
+        """
+        Перечитывает только диалоги, в которых были сообщения после
+        последней синхронизации (get_dialogs отдаёт их от новых к старым).
+        При full=True перечитывает все диалоги.
+        """
+        last_sync = 0 if full else self.last_sync
+        newest = self.last_sync
+        refreshed = 0
+        async for dialog in app.get_dialogs():
+            top_date = dialog.top_message.date.timestamp() if dialog.top_message else 0
+            # Закреплённые диалоги идут первыми вне зависимости от даты
+            if last_sync and not dialog.is_pinned and top_date <= last_sync:
+                break
+            self.update(dialog.chat)
+            refreshed += 1
+            newest = max(newest, top_date)
+        self.last_sync = newest
+        self.dirty = True
+        logger.info("Обновлены диалоги", refreshed=refreshed, full=full)
+        return refreshed
+
+    async def _fetch(self, app, chat_id):
+        chat = await app.get_chat(chat_id)
+        # get_chat сохраняет peer в сессии, значит access hash теперь известен
+        return self.update(chat, has_access_hash=True)
+
+    async def resolve(self, app, chat_ids):
+        """
+        Получает метаданные указанных чатов.
+
+        Returns:
+            tuple: (записи {chat_id: entry}, недоступные_чаты)
+        """
+        self.load()
+        entries = {}
+        missing = []
+        from_cache = 0
+        fetched = 0
+
+        to_fetch = []
+        for chat_id in chat_ids:
+            entry = self.get_fresh(chat_id)
+            if entry is not None and not await has_peer(app, chat_id):
+                # Файл сессии сменился: кэш помнит чат, но access hash потерян
+                entry["has_access_hash"] = False
+                self.dirty = True
+                entry = None
+            if entry is not None:
+                entries[chat_id] = entry
+                from_cache += 1
+            else:
+                to_fetch.append(chat_id)
+
+        # Запрашиваем остальные чаты параллельно, но с ограничением
+        semaphore = asyncio.Semaphore(settings.validation_concurrency)
+
+        async def fetch(chat_id):
+            async with semaphore:
+                try:
+                    return chat_id, await self._fetch(app, chat_id)
+                except Exception:
+                    return chat_id, None
+
+        for chat_id, entry in await asyncio.gather(*(fetch(c) for c in to_fetch)):
+            if entry is None:
+                missing.append(chat_id)
+            else:
+                entries[chat_id] = entry
+                fetched += 1
+
+        # Peer не известен сессии — подтягиваем изменившиеся диалоги и пробуем снова,
+        # а если не помогло, перечитываем все диалоги
+        errors = {}
+        if missing:
+            passes = (True,) if not self.last_sync else (False, True)
+            for full in passes:
+                await self.refresh_incremental(app, full=full)
+                errors = {}
+                for chat_id in missing:
+                    # Чат мог прийти вместе с обновлёнными диалогами
+                    entry = self.get_fresh(chat_id)
+                    if entry is not None:
+                        entries[chat_id] = entry
+                        from_cache += 1
+                        continue
+                    try:
+                        entries[chat_id] = await self._fetch(app, chat_id)
+                        fetched += 1
+                    except Exception as e:
+                        errors[chat_id] = e
+                missing = list(errors)
+                if not missing:
+                    break
+
+        for chat_id, e in errors.items():
+            logger.warning("Ошибка доступа к чату", chat=chat_id, error=repr(e))
+        problematic_chats = set(errors)
+
+        logger.info(
+            "Метаданные чатов получены",
+            from_cache=from_cache,
+            fetched=fetched,
+            unavailable=len(problematic_chats),
+        )
+        try:
+            self.save()
+        except OSError as e:
+            logger.error(
+                "Не удалось сохранить кэш диалогов", file=self.cache_file, error=repr(e)
+            )
+        return entries, problematic_chats
+
+
+# Глобальный кэш диалогов
+dialog_cache = DialogCache(DIALOG_CACHE_FILE)
@@ -0,0 +1,101 @@
+# src/fair_queue.py
+
+import asyncio
+from collections import deque
+
+from .config import settings
+from .routing import get_routing_table
+
+
+class FairQueue:
+    """
+    Очередь заданий одного чата назначения с честным разделением между
+    исходными чатами (deficit round robin).
+
+    У каждого источника своя подочередь. Источники обслуживаются по кругу:
+    в начале своего хода источник получает квант (fair_queue_quantum
+    сообщений, умноженный на вес маршрута из ROUTE_WEIGHTS) и отправляет
+    задания, пока хватает накопленного кредита. Поэтому поток из одного
+    источника не отодвигает сообщения других источников: их задания
+    ждут не больше одного круга.
+
+    Заменяет asyncio.Queue в движке доставки: put() с ограничением размера
+    подочереди каждого источника (backpressure), get() и qsize().
+    """
+
+    def __init__(self, dest_chat_id, maxsize: int):
+        self.dest_chat_id = dest_chat_id
+        self.maxsize = maxsize
+        self.subqueues = {}  # {source_chat_id: deque[DeliveryJob]}
+        self.active = deque()  # Источники с непустыми подочередями, по кругу
+        self.deficit = {}  # {source_chat_id: накопленный кредит (сообщений)}
+        self.granted = False  # Источник в начале круга уже получил квант
+        self.size = 0
+        self.changed = asyncio.Condition()
+
+    def qsize(self):
+        return self.size
+
+    def empty(self):
+        return self.size == 0
+
+    def _has_space(self, source_chat_id):
+        queue = self.subqueues.get(source_chat_id)
+        return queue is None or len(queue) < self.maxsize
+
+    async def put(self, job):
+        """
+        Добавляет задание в подочередь его источника. Если она заполнена,
+        ждёт освобождения места (остальные источники не блокируются).
+        """
+        source_chat_id = job.source_chat_id
+        async with self.changed:
+            await self.changed.wait_for(lambda: self._has_space(source_chat_id))
+            queue = self.subqueues.get(source_chat_id)
+            if queue is None:
+                queue = self.subqueues[source_chat_id] = deque()
+                self.active.append(source_chat_id)
+                self.deficit[source_chat_id] = 0
+            queue.append(job)
+            self.size += 1
+            self.changed.notify_all()
+
+    async def get(self):
+        """
+        Забирает следующее задание в порядке deficit round robin.
+        """
+        async with self.changed:
+            await self.changed.wait_for(lambda: self.size > 0)
+            job = self._pop()
+            self.changed.notify_all()
+            return job
+
+    def _quantum(self, source_chat_id):
+        weight = get_routing_table().weight(source_chat_id, self.dest_chat_id)
+        return settings.fair_queue_quantum * weight
+
+    def _pop(self):
+        while True:
+            source_chat_id = self.active[0]
+            if not self.granted:
+                self.deficit[source_chat_id] += self._quantum(source_chat_id)
+                self.granted = True
+
+            queue = self.subqueues[source_chat_id]
+            # Стоимость задания — число сообщений (альбом или пачка дороже текста)
+            cost = len(queue[0].message_ids)
+            if self.deficit[source_chat_id] >= cost:
+                self.deficit[source_chat_id] -= cost
+                job = queue.popleft()
+                self.size -= 1
+                if not queue:
+                    # Источник без заданий выбывает из круга и теряет кредит
+                    del self.subqueues[source_chat_id]
+                    del self.deficit[source_chat_id]
+                    self.active.popleft()
+                    self.granted = False
+                return job
+
+            # Кредита не хватает — ход переходит к следующему источнику
+            self.active.rotate(-1)
+            self.granted = False
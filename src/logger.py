@@ -0,0 +1,195 @@
+# src/logger.py
+
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+
+from .config import settings
+
+
+# Корневой логгер бота: все модули пишут в его потомков ("forwarder.<модуль>")
+ROOT_LOGGER_NAME = "forwarder"
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Форматирует запись одной строкой JSON: время, уровень, модуль,
+    сообщение и структурированные поля (маршрут, ID сообщения, задержка...).
+    """
+
+    def format(self, record):
+        data = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            data.update(fields)
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            data["suppressed"] = suppressed
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """
+    Человекочитаемый формат: «время уровень [модуль] сообщение ключ=значение».
+    """
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s [%(name)s] %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            line += f" suppressed={suppressed}"
+        return line
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Ограничивает частоту записей с одинаковым ключом (sample_key):
+    не более log_sample_burst записей за log_sample_interval секунд.
+    Отброшенные записи подсчитываются, и их число добавляется
+    к следующей пропущенной записи (поле suppressed).
+    Записи без ключа не ограничиваются.
+    """
+
+    # Не даём словарю ключей расти бесконечно
+    MAX_KEYS = 10_000
+
+    def __init__(self, burst: int, interval: float):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.windows = {}  # {key: [начало окна, записей в окне, отброшено]}
+
+    def filter(self, record):
+        key = getattr(record, "sample_key", None)
+        if key is None or self.burst <= 0:
+            return True
+
+        now = time.monotonic()
+        window = self.windows.get(key)
+        if window is None:
+            if len(self.windows) >= self.MAX_KEYS:
+                self.windows.clear()
+            self.windows[key] = [now, 1, 0]
+            return True
+
+        if now - window[0] >= self.interval:
+            record.suppressed = window[2]
+            window[0], window[1], window[2] = now, 1, 0
+            return True
+
+        if window[1] < self.burst:
+            window[1] += 1
+            record.suppressed = window[2]
+            window[2] = 0
+            return True
+
+        window[2] += 1
+        return False
+
+
+class StructLogger:
+    """
+    Обёртка над logging.Logger для структурированных записей:
+        logger.info("Сообщение переслано", key="forward.sent", dest=..., message_id=...)
+    Отключённые уровни отбрасываются до создания записи, поэтому
+    отладочные записи на горячем пути почти ничего не стоят.
+    """
+
+    __slots__ = ("logger",)
+
+    def __init__(self, name: str):
+        self.logger = logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}")
+
+    def is_enabled(self, level):
+        return self.logger.isEnabledFor(level)
+
+    def log(self, level, msg, key=None, exc_info=None, **fields):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(
+                level,
+                msg,
+                exc_info=exc_info,
+                extra={"fields": fields, "sample_key": key},
+            )
+
+    def debug(self, msg, key=None, **fields):
+        self.log(logging.DEBUG, msg, key, **fields)
+
+    def info(self, msg, key=None, **fields):
+        self.log(logging.INFO, msg, key, **fields)
+
+    def warning(self, msg, key=None, **fields):
+        self.log(logging.WARNING, msg, key, **fields)
+
+    def error(self, msg, key=None, **fields):
+        self.log(logging.ERROR, msg, key, **fields)
+
+    def exception(self, msg, key=None, **fields):
+        self.log(logging.ERROR, msg, key, exc_info=True, **fields)
+
+
+def get_logger(name: str) -> StructLogger:
+    return StructLogger(name)
+
+
+# Фоновый поток, который пишет записи в stdout
+_listener = None
+
+
+def setup_logging():
+    """
+    Настраивает логирование: записи из цикла событий только кладутся
+    в очередь (QueueHandler), а форматирование и запись в stdout
+    выполняет отдельный поток (QueueListener), поэтому медленный
+    stdout (например, в Docker) не блокирует цикл событий.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if settings.log_format == "text":
+        stream_handler.setFormatter(TextFormatter())
+    else:
+        stream_handler.setFormatter(JsonFormatter())
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    # Сэмплирование выполняется до постановки в очередь
+    queue_handler.addFilter(
+        SamplingFilter(settings.log_sample_burst, settings.log_sample_interval)
+    )
+
+    root = logging.getLogger(ROOT_LOGGER_NAME)
+    root.setLevel(settings.log_level.upper())
+    root.handlers[:] = [queue_handler]
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    _listener.start()
+
+
+def stop_logging():
+    """
+    Дописывает оставшиеся записи и останавливает фоновый поток.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
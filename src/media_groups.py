@@ -0,0 +1,144 @@
+# src/media_groups.py
+
+import asyncio
+import time
+from collections import OrderedDict
+
+from .catch_up import catch_up_position
+from .config import settings
+from .metrics import registry
+
+
+# Максимальное количество сообщений в альбоме Telegram
+MEDIA_GROUP_MAX_PARTS = 10
+
+# Корзины времени сборки альбома (секунды)
+MEDIA_GROUP_WAIT_BUCKETS = (0.25, 0.5, 1, 1.5, 2, 3, 5, 10)
+
+flushed_total = registry.counter(
+    "forwarder_media_groups_flushed_total",
+    "Собранные медиагруппы по причине отправки (full, idle, evicted, shutdown)",
+    ("reason",),
+)
+wait_seconds = registry.histogram(
+    "forwarder_media_group_wait_seconds",
+    "Время от первой части медиагруппы до её отправки (секунды)",
+    buckets=MEDIA_GROUP_WAIT_BUCKETS,
+)
+
+
+class MediaGroupAssembler:
+    """
+    Сборщик медиагрупп по ключу (исходный чат, media_group_id).
+
+    Группа отправляется, когда:
+    - пришли все 10 частей (максимум альбома),
+    - после последней части прошла пауза, подстраиваемая под наблюдаемые
+      интервалы между частями (EWMA, ограничена min/max),
+    - или группа оказалась самой старой при превышении лимита буфера.
+
+    Пока части альбома в буфере, их нет в outbox, поэтому они удерживаются
+    в позиции догонялки до конца on_flush: одиночное сообщение, пришедшее
+    во время сборки, не сдвигает её за альбом.
+    """
+
+    def __init__(self, on_flush):
+        # on_flush(source_chat_id, messages, media_group_id) — корутина
+        self.on_flush = on_flush
+        self.groups = OrderedDict()  # {(chat_id, mg_id): {...}}
+        self.tasks = set()  # Запущенные задачи отправки
+        # Сглаженный интервал между частями одного альбома (секунды)
+        self.avg_gap = settings.media_group_initial_gap
+
+    @property
+    def in_flight(self):
+        """
+        Количество групп, ожидающих отправки.
+        """
+        return len(self.groups)
+
+    def idle_gap(self):
+        """
+        Пауза после последней части, по истечении которой группа считается полной.
+        """
+        return min(
+            settings.media_group_max_gap,
+            max(
+                settings.media_group_min_gap,
+                self.avg_gap * settings.media_group_gap_factor,
+            ),
+        )
+
+    def add(self, message):
+        """
+        Добавляет часть альбома в буфер и (пере)запускает таймер отправки.
+        """
+        key = (message.chat.id, message.media_group_id)
+        now = time.monotonic()
+        group = self.groups.get(key)
+
+        if group is None:
+            group = {
+                "messages": [],
+                "first_at": now,
+                "last_at": now,
+                "timer": None,
+            }
+            self.groups[key] = group
+        else:
+            # Обновляем сглаженный интервал между частями
+            gap = now - group["last_at"]
+            self.avg_gap += settings.media_group_gap_alpha * (gap - self.avg_gap)
+            group["last_at"] = now
+
+        group["messages"].append(message)
+        catch_up_position.hold(message.chat.id, (message.id,))
+
+        if len(group["messages"]) >= MEDIA_GROUP_MAX_PARTS:
+            self.flush(key, "full")
+            return
+
+        if group["timer"] is not None:
+            group["timer"].cancel()
+        group["timer"] = asyncio.get_running_loop().call_later(
+            self.idle_gap(), self.flush, key
+        )
+
+        # Ограничиваем память: отправляем самые старые группы досрочно
+        while len(self.groups) > settings.media_group_buffer_limit:
+            oldest_key = next(iter(self.groups))
+            self.flush(oldest_key, "evicted")
+
+    def flush(self, key, reason="idle"):
+        """
+        Забирает группу из буфера и передаёт её на отправку.
+        """
+        group = self.groups.pop(key, None)
+        if group is None:
+            return  # Кто-то уже забрал
+
+        if group["timer"] is not None:
+            group["timer"].cancel()
+
+        flushed_total.inc((reason,))
+        wait_seconds.observe((), time.monotonic() - group["first_at"])
+
+        # Сортируем по ID, чтобы сохранить исходный порядок
+        messages = sorted(group["messages"], key=lambda m: m.id)
+        source_chat_id, mg_id = key
+        task = asyncio.create_task(self._deliver(source_chat_id, messages, mg_id))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _deliver(self, source_chat_id, messages, mg_id):
+        try:
+            await self.on_flush(source_chat_id, messages, mg_id)
+        finally:
+            catch_up_position.release(source_chat_id, [m.id for m in messages])
+
+    def flush_all(self):
+        """
+        Немедленно отправляет все накопленные группы (например, при остановке).
+        """
+        for key in list(self.groups):
+            self.flush(key, "shutdown")
@@ -0,0 +1,343 @@
+# src/media_relay.py
+
+import asyncio
+import os
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from pyrogram.errors import BadRequest
+from pyrogram.types import (
+    InputMediaAudio,
+    InputMediaDocument,
+    InputMediaPhoto,
+    InputMediaVideo,
+)
+
+from .config import settings
+from .logger import get_logger
+from .metrics import registry
+
+
+logger = get_logger("media_relay")
+
+# Каталог кэша (лежит рядом с forward_config.json)
+MEDIA_RELAY_DIR = os.path.join(
+    os.path.dirname(settings.bot_chats_config_file), settings.media_relay_dir
+)
+
+# Виды медиа, которые можно отправить заново, и принимают ли они подпись
+SEND_KINDS = {
+    "photo": True,
+    "video": True,
+    "document": True,
+    "audio": True,
+    "animation": True,
+    "voice": True,
+    "video_note": False,
+    "sticker": False,
+}
+
+# Виды медиа, допустимые в альбоме (send_media_group)
+INPUT_MEDIA = {
+    "photo": InputMediaPhoto,
+    "video": InputMediaVideo,
+    "document": InputMediaDocument,
+    "audio": InputMediaAudio,
+}
+
+downloaded_bytes_total = registry.counter(
+    "forwarder_media_relay_downloaded_bytes_total",
+    "Байты медиа, скачанные для ретрансляции",
+)
+uploads_total = registry.counter(
+    "forwarder_media_relay_uploads_total",
+    "Файлы, загруженные в Telegram при ретрансляции",
+)
+reused_total = registry.counter(
+    "forwarder_media_relay_reused_total",
+    "Отправки по уже известному file_id, без загрузки файла",
+)
+
+
+def relay_media(message):
+    """
+    Вид и объект медиа сообщения, если его можно ретранслировать
+    (иначе None, None).
+    """
+    kind = getattr(message.media, "value", message.media)
+    if kind not in SEND_KINDS:
+        return None, None
+    media = getattr(message, kind, None)
+    if media is None or not getattr(media, "file_unique_id", None):
+        return None, None
+    if (getattr(media, "file_size", 0) or 0) > settings.media_relay_max_file_size:
+        return None, None
+    return kind, media
+
+
+def _remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class MediaRelay:
+    """
+    Ретрансляция медиа, которое нельзя ни переслать, ни скопировать.
+
+    Файл скачивается частями (stream_media) в кэш на диске, где имя файла —
+    его file_unique_id, поэтому одно и то же медиа хранится один раз.
+    Загружается он тоже один раз на аккаунт: file_id из ответа Telegram
+    используется для остальных чатов назначения и повторов. Одновременные
+    скачивания и загрузки одного файла объединяются. Кэш ограничен по
+    объёму и вытесняет давно не использованные файлы (LRU).
+
+    Запись и удаление файлов выполняются в отдельном потоке, чтобы крупные
+    скачивания не останавливали цикл событий (и доставку во всех полосах).
+    Поток один, поэтому операции с файлами выполняются в порядке вызова:
+    удаление вытесненного файла не затрёт его новую копию.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, max_file_ids: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_file_ids = max_file_ids
+        self.files = OrderedDict()  # {file_unique_id: размер}, от давних к недавним
+        self.total_bytes = 0
+        self.file_ids = OrderedDict()  # {(аккаунт, file_unique_id): file_id}
+        self.downloads = {}  # {file_unique_id: задача скачивания}
+        self.uploads = {}  # {(аккаунт, file_unique_id): future завершения загрузки}
+        # Файлы, которые сейчас загружаются, вытеснять нельзя
+        self.pinned = Counter()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="media_relay")
+
+    def load(self):
+        """
+        Восстанавливает индекс кэша по файлам на диске (порядок LRU — по mtime).
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith(".part"):
+                # Недокачанный файл от прошлого запуска
+                os.remove(entry.path)
+                continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self.files[name] = size
+            self.total_bytes += size
+        _remove_files(self._evict())
+        logger.info(
+            "Загружен кэш медиа",
+            files=len(self.files),
+            bytes=self.total_bytes,
+            dir=self.cache_dir,
+        )
+
+    def _path(self, file_unique_id):
+        return os.path.join(self.cache_dir, file_unique_id)
+
+    async def _run_in_thread(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    def _evict(self):
+        """
+        Убирает из индекса давно не использованные файлы сверх лимита объёма.
+        Возвращает пути файлов, которые нужно удалить с диска.
+        """
+        evicted = []
+        for file_unique_id in list(self.files):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if self.pinned[file_unique_id]:
+                continue
+            self.total_bytes -= self.files.pop(file_unique_id)
+            evicted.append(self._path(file_unique_id))
+        return evicted
+
+    async def _download(self, client, message, file_unique_id):
+        path = self._path(file_unique_id)
+        tmp_path = path + ".part"
+        size = 0
+        try:
+            f = await self._run_in_thread(open, tmp_path, "wb")
+            try:
+                async for chunk in client.stream_media(message):
+                    await self._run_in_thread(f.write, chunk)
+                    size += len(chunk)
+            finally:
+                await self._run_in_thread(f.close)
+            await self._run_in_thread(os.replace, tmp_path, path)
+        except BaseException:
+            await self._run_in_thread(_remove_files, (tmp_path,))
+            raise
+        downloaded_bytes_total.inc(value=size)
+        self.files[file_unique_id] = size
+        self.total_bytes += size
+        evicted = self._evict()
+        if evicted:
+            await self._run_in_thread(_remove_files, evicted)
+
+    async def fetch(self, client, message, media) -> str:
+        """
+        Путь к файлу медиа в кэше; скачивает его, если файла ещё нет.
+        Вызывающий должен закрепить файл (pinned), пока пользуется им.
+        """
+        file_unique_id = media.file_unique_id
+        path = self._path(file_unique_id)
+        if file_unique_id in self.files:
+            self.files.move_to_end(file_unique_id)
+            await self._run_in_thread(os.utime, path)
+            return path
+
+        task = self.downloads.get(file_unique_id)
+        if task is None:
+            task = asyncio.create_task(self._download(client, message, file_unique_id))
+            self.downloads[file_unique_id] = task
+            task.add_done_callback(lambda _: self.downloads.pop(file_unique_id, None))
+        await asyncio.shield(task)
+        return path
+
+    async def _claim(self, key):
+        """
+        Возвращает известный file_id. Если его нет, дожидается загрузки того же
+        файла другой отправкой, а если никто не загружает — возвращает None:
+        загрузку выполняет вызывающий и потом обязан вызвать _release.
+        """
+        while True:
+            file_id = self.file_ids.get(key)
+            if file_id is not None:
+                self.file_ids.move_to_end(key)
+                return file_id
+            pending = self.uploads.get(key)
+            if pending is None:
+                self.uploads[key] = asyncio.get_running_loop().create_future()
+                return None
+            await asyncio.shield(pending)
+
+    def _release(self, key, file_id=None):
+        if file_id is not None:
+            self.file_ids[key] = file_id
+            self.file_ids.move_to_end(key)
+            if len(self.file_ids) > self.max_file_ids:
+                self.file_ids.popitem(last=False)
+            uploads_total.inc()
+        pending = self.uploads.pop(key, None)
+        if pending is not None and not pending.done():
+            pending.set_result(None)
+
+    async def send(self, client, message, dest_chat_id, caption: str) -> bool:
+        """
+        Отправляет медиа сообщения в чат назначения. Возвращает False,
+        если медиа этого вида ретранслировать нельзя.
+        """
+        kind, media = relay_media(message)
+        if media is None:
+            return False
+        key = (client.name, media.file_unique_id)
+        send_method = getattr(client, f"send_{kind}")
+        options = {"caption": caption} if SEND_KINDS[kind] else {}
+
+        # Вторая попытка — если сохранённый file_id перестал действовать
+        for _ in range(2):
+            file_id = await self._claim(key)
+            if file_id is not None:
+                try:
+                    await send_method(dest_chat_id, file_id, **options)
+                except BadRequest:
+                    self.file_ids.pop(key, None)
+                    continue
+                reused_total.inc()
+                return True
+
+            self.pinned[media.file_unique_id] += 1
+            try:
+                path = await self.fetch(client, message, media)
+                sent = await send_method(dest_chat_id, path, **options)
+            except BaseException:
+                self._release(key)
+                raise
+            finally:
+                self.pinned[media.file_unique_id] -= 1
+            self._release(key, getattr(getattr(sent, kind, None), "file_id", None))
+            return True
+        return False
+
+    async def send_group(self, client, messages, dest_chat_id, caption: str) -> bool:
+        """
+        Отправляет альбом одним send_media_group. Возвращает False, если
+        в альбоме нет медиа, которые можно ретранслировать.
+        """
+        items = []
+        for message in sorted(messages, key=lambda m: m.id):
+            kind, media = relay_media(message)
+            if kind in INPUT_MEDIA:
+                items.append((message, kind, media))
+        if not items:
+            return False
+
+        # Ключи захватываются в одном порядке, чтобы встречные отправки
+        # одного альбома не ждали друг друга
+        keys = sorted({(client.name, media.file_unique_id) for _, _, media in items})
+        for _ in range(2):
+            known, owned, pinned = {}, [], []
+            sent = None
+            try:
+                for key in keys:
+                    file_id = await self._claim(key)
+                    if file_id is None:
+                        owned.append(key)
+                    else:
+                        known[key] = file_id
+
+                input_media = []
+                for i, (message, kind, media) in enumerate(items):
+                    file = known.get((client.name, media.file_unique_id))
+                    if file is None:
+                        self.pinned[media.file_unique_id] += 1
+                        pinned.append(media.file_unique_id)
+                        file = await self.fetch(client, message, media)
+                    input_media.append(
+                        INPUT_MEDIA[kind](file, caption=caption if i == 0 else "")
+                    )
+                try:
+                    sent = await client.send_media_group(dest_chat_id, input_media)
+                except BadRequest:
+                    if not known:
+                        raise
+                    # Какой-то из сохранённых file_id перестал действовать
+                    for key in known:
+                        self.file_ids.pop(key, None)
+                    continue
+            finally:
+                for file_unique_id in pinned:
+                    self.pinned[file_unique_id] -= 1
+                uploaded = {}
+                for (_, kind, media), result in zip(items, sent or ()):
+                    uploaded[(client.name, media.file_unique_id)] = getattr(
+                        getattr(result, kind, None), "file_id", None
+                    )
+                for key in owned:
+                    self._release(key, uploaded.get(key))
+
+            reused_total.inc(value=len(known))
+            return True
+        return False
+
+
+# Глобальный ретранслятор медиа
+media_relay = MediaRelay(
+    MEDIA_RELAY_DIR, settings.media_relay_max_bytes, settings.media_relay_max_file_ids
+)
+
+registry.gauge(
+    "forwarder_media_relay_cache_bytes",
+    "Объём кэша медиа на диске (байты)",
+    lambda: media_relay.total_bytes,
+)
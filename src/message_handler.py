@@ -1,44 +1,158 @@
 # src/message_handler.py
 
-import asyncio
-import random
+import logging
+import time
 
 from pyrogram import Client
-from pyrogram.errors import FloodWait, MessageIdInvalid
+from pyrogram.errors import (
+    ChannelInvalid,
+    ChannelPrivate,
+    ChatWriteForbidden,
+    FloodWait,
+    MessageIdInvalid,
+    PeerIdInvalid,
+    UserBannedInChannel,
+)
 from pyrogram.types import Message
 
-
-# Глобальный буфер для медиагрупп {media_group_id: {"messages": [...], "task": Task}}
-media_groups_buffer = {}
+from .accounts import SenderAccount, SwitchAccount, account_pool
+from .batcher import message_batcher
+from .capabilities import capability_cache
+from .catch_up import catch_up_gate, catch_up_position
+from .config import settings
+from .dedup import DedupCache, dedup_cache
+from .delivery import DeliveryJob
+from .logger import get_logger
+from .media_groups import MediaGroupAssembler
+from .media_relay import media_relay
+from .metrics import (
+    delivery_latency_seconds,
+    fallbacks_total,
+    flood_wait_seconds_total,
+    forwards_total,
+    message_id_invalid_total,
+    registry,
+)
+from .provenance import provenance_cache
+from .rate_limiter import rate_limiter
+from .routing import (
+    confirm_destination,
+    get_routing_table,
+    is_confirmed,
+    is_quarantined,
+    quarantine_destination,
+)
+from .rules import route_deliveries
+
+
+logger = get_logger("message_handler")
+
+# Ошибки, означающие, что в чат назначения нельзя отправлять вовсе
+DESTINATION_ERRORS = (
+    ChannelInvalid,
+    ChannelPrivate,
+    ChatWriteForbidden,
+    PeerIdInvalid,
+    UserBannedInChannel,
+)
+
+
+def copy_method(message: Message) -> str:
+    """
+    Имя метода копирования для кэша возможностей: запреты чатов зависят
+    от вида медиа (например, GIF запрещены, а фото — нет).
+    """
+    if not message.media:
+        return "copy_message"
+    return f"copy_message:{getattr(message.media, 'value', message.media)}"
 
 
-async def fallback_copy(client: Client, message: Message, dest_chat_id, prefix: str):
+async def fallback_copy(
+    client: Client, message: Message, dest_chat_id, prefix: str, album=None
+):
     """
     Резервный метод копирования сообщения, если пересылка (forward) не удалась.
     Поддерживает одиночные сообщения и медиагруппы (copy_media_group).
+    Методы, заведомо не работающие на этом маршруте (по кэшу возможностей),
+    пропускаются. Если копирование невозможно и включена ретрансляция медиа,
+    медиа скачивается и отправляется заново (album — все сообщения альбома).
+
+    Returns:
+        str: сработавшая ветка — "media_group", "media", "text", "other",
+        "relay_media_group", "relay" (медиа ретранслировано),
+        "last_resort" (отправлен только текст) или "failed"
     """
+    route = (message.chat.id, dest_chat_id)
     try:
         # Если у сообщения есть media_group_id, пробуем копировать как альбом
-        if message.media_group_id is not None:
+        if message.media_group_id is not None and not capability_cache.is_doomed(
+            route, "copy_media_group"
+        ):
             try:
-                await client.copy_media_group(
+                sent = await client.copy_media_group(
                     chat_id=dest_chat_id,
                     from_chat_id=message.chat.id,
                     message_id=message.id,
                 )
-                print(f"[fallback_copy] Медиагруппа скопирована в {dest_chat_id}")
-                return
+                provenance_cache.record_sent(dest_chat_id, sent)
+                logger.info(
+                    "Медиагруппа скопирована (резервный метод)",
+                    key="fallback.media_group",
+                    source=message.chat.id,
+                    dest=dest_chat_id,
+                    media_group_id=message.media_group_id,
+                )
+                capability_cache.record_success(route, "copy_media_group")
+                return "media_group"
+            except FloodWait:
+                raise
             except Exception as e:
-                print(f"[fallback_copy] Ошибка при copy_media_group: {e}")
+                capability_cache.record_failure(route, "copy_media_group", e)
+                logger.warning(
+                    "Ошибка при copy_media_group",
+                    source=message.chat.id,
+                    dest=dest_chat_id,
+                    media_group_id=message.media_group_id,
+                    error=repr(e),
+                )
                 # Если copy_media_group не сработал, пробуем копировать по одному
 
+            if album and settings.media_relay_enabled:
+                try:
+                    if await media_relay.send_group(
+                        client, album, dest_chat_id, prefix + (message.caption or "")
+                    ):
+                        logger.info(
+                            "Медиагруппа ретранслирована через локальный кэш",
+                            key="fallback.relay_media_group",
+                            source=message.chat.id,
+                            dest=dest_chat_id,
+                            media_group_id=message.media_group_id,
+                        )
+                        return "relay_media_group"
+                except FloodWait:
+                    raise
+                except Exception as e:
+                    logger.warning(
+                        "Ошибка ретрансляции медиагруппы",
+                        source=message.chat.id,
+                        dest=dest_chat_id,
+                        media_group_id=message.media_group_id,
+                        error=repr(e),
+                    )
+
         # Если это одиночное сообщение (или copy_media_group не получилось)
         # Для сообщений с медиа используем caption, для текстовых - текст
         # напрямую отправляем
+        method = copy_method(message)
+        if not message.text and capability_cache.is_doomed(route, method):
+            # Копирование на этом маршруте не работает — сразу к последнему варианту
+            return await send_last_resort(client, message, dest_chat_id, prefix)
         if message.media:
             # Медиа-сообщение
+            branch = "media"
             new_caption = prefix + (message.caption or "")
-            await client.copy_message(
+            sent = await client.copy_message(
                 chat_id=dest_chat_id,
                 from_chat_id=message.chat.id,
                 message_id=message.id,
@@ -46,243 +160,466 @@ async def fallback_copy(client: Client, message: Message, dest_chat_id, prefix:
             )
         elif message.text:
             # Текстовое сообщение - используем send_message вместо copy
+            branch = "text"
             new_text = prefix + message.text
-            await client.send_message(chat_id=dest_chat_id, text=new_text)
+            sent = await client.send_message(chat_id=dest_chat_id, text=new_text)
         else:
             # Другие типы сообщений
-            await client.copy_message(
+            branch = "other"
+            sent = await client.copy_message(
                 chat_id=dest_chat_id,
                 from_chat_id=message.chat.id,
                 message_id=message.id,
             )
-
-        print(
-            f"[fallback_copy] Сообщение(я) скопировано в {dest_chat_id} (резервный метод)."
+        provenance_cache.record_sent(dest_chat_id, sent)
+
+        logger.info(
+            "Сообщение скопировано (резервный метод)",
+            key="fallback.copy",
+            source=message.chat.id,
+            dest=dest_chat_id,
+            message_id=message.id,
+            branch=branch,
         )
+        capability_cache.record_success(route, "send_message" if branch == "text" else method)
+        return branch
 
+    except FloodWait:
+        # Ограничение скорости — не повод отправлять урезанную копию:
+        # повтор планирует движок доставки
+        raise
     except Exception as e:
-        print(f"[fallback_copy] Не удалось скопировать сообщение в {dest_chat_id}: {e}")
-        # Добавляем более подробный вывод ошибки для отладки
-        print(
-            f"[fallback_copy] Тип сообщения: {'media' if message.media else 'text'}, "
-            f"media_group_id: {message.media_group_id}, "
-            f"text: {bool(message.text)}, caption: {bool(message.caption)}"
+        if not message.text:
+            capability_cache.record_failure(route, copy_method(message), e)
+        # Подробности о сообщении помогают при отладке
+        logger.warning(
+            "Не удалось скопировать сообщение",
+            source=message.chat.id,
+            dest=dest_chat_id,
+            message_id=message.id,
+            error=repr(e),
+            kind="media" if message.media else "text",
+            media_group_id=message.media_group_id,
+            has_text=bool(message.text),
+            has_caption=bool(message.caption),
         )
 
-        # Еще один запасной вариант - просто отправить текст
+        # Еще один запасной вариант - ретрансляция медиа или просто текст
+        return await send_last_resort(client, message, dest_chat_id, prefix)
+
+
+async def send_last_resort(client: Client, message: Message, dest_chat_id, prefix: str):
+    """
+    Последний вариант резервного копирования: ретранслирует медиа через
+    локальный кэш (если включено), иначе отправляет только текст.
+    """
+    if message.media and settings.media_relay_enabled:
         try:
-            content = (
-                message.text or message.caption or "Содержимое сообщения недоступно"
+            if await media_relay.send(
+                client, message, dest_chat_id, prefix + (message.caption or "")
+            ):
+                logger.info(
+                    "Медиа ретранслировано через локальный кэш",
+                    key="fallback.relay",
+                    source=message.chat.id,
+                    dest=dest_chat_id,
+                    message_id=message.id,
+                )
+                return "relay"
+        except FloodWait:
+            raise
+        except Exception as e:
+            logger.warning(
+                "Ошибка ретрансляции медиа",
+                source=message.chat.id,
+                dest=dest_chat_id,
+                message_id=message.id,
+                error=repr(e),
             )
-            await client.send_message(
-                chat_id=dest_chat_id, text=f"{prefix}\n\n{content}"
+    return await send_text_only(client, message, dest_chat_id, prefix)
+
+
+async def send_text_only(client: Client, message: Message, dest_chat_id, prefix: str):
+    """
+    Последний вариант резервного копирования: отправляет только текст сообщения.
+    """
+    try:
+        content = message.text or message.caption or "Содержимое сообщения недоступно"
+        sent = await client.send_message(chat_id=dest_chat_id, text=f"{prefix}\n\n{content}")
+        provenance_cache.record_sent(dest_chat_id, sent)
+        logger.info(
+            "Последняя попытка: отправлен только текст",
+            key="fallback.text",
+            source=message.chat.id,
+            dest=dest_chat_id,
+            message_id=message.id,
+        )
+        return "last_resort"
+    except FloodWait:
+        raise
+    except Exception as final_e:
+        logger.error(
+            "Окончательная ошибка резервного копирования",
+            source=message.chat.id,
+            dest=dest_chat_id,
+            message_id=message.id,
+            error=repr(final_e),
+        )
+        return "failed"
+
+
+async def deliver_job(client: Client, job: DeliveryJob, account: SenderAccount = None):
+    """
+    Доставляет одно задание в один чат назначения:
+    - альбом пересылается «одним блоком» (forward_messages),
+    - одиночное сообщение пересылается так же, через forward_messages,
+    - при FloodWait ограничитель скорости замедляется, а FloodWait пробрасывается
+      дальше, чтобы движок доставки отложил повтор,
+    - если чат назначения недоступен отправляющему аккаунту, а в пуле есть
+      другие, пробрасывается SwitchAccount,
+    - если пересылка недоступна, используем fallback-копирование.
+    """
+    dest_chat_id = job.dest_chat_id
+    source_chat_id = job.source_chat_id
+    limiter = account.rate_limiter if account is not None else rate_limiter
+
+    if is_quarantined(dest_chat_id):
+        logger.info(
+            "Чат назначения в карантине, задание пропущено",
+            key="deliver.quarantined",
+            source=source_chat_id,
+            dest=dest_chat_id,
+        )
+        return
+
+    if job.media_group_id:
+        kind = "media_group"
+    elif len(job.message_ids) > 1:
+        kind = "batch"
+    else:
+        kind = "single"
+
+    route = (source_chat_id, dest_chat_id)
+    if capability_cache.is_doomed(route, "forward"):
+        # Пересылка на этом маршруте недавно отказала (например, исходный чат
+        # защищён от пересылки) — сразу копируем, не тратя вызов API
+        if logger.is_enabled(logging.DEBUG):
+            logger.debug(
+                "Пересылка пропущена по кэшу возможностей",
+                key="deliver.forward_skipped",
+                source=source_chat_id,
+                dest=dest_chat_id,
+                message_ids=job.message_ids,
+                **capability_cache.describe(route),
             )
-            print(
-                f"[fallback_copy] Последняя попытка: текст отправлен в {dest_chat_id}"
+        await fallback_job(client, job, limiter)
+        return
+
+    try:
+        await client.forward_messages(
+            chat_id=dest_chat_id,
+            from_chat_id=source_chat_id,
+            message_ids=job.message_ids,
+        )
+        limiter.on_success(dest_chat_id)
+        confirm_destination(dest_chat_id)
+        capability_cache.record_success(route, "forward")
+        forwards_total.inc(route, len(job.message_ids))
+        latency = job_latency(job)
+        if latency is not None:
+            delivery_latency_seconds.observe(route, latency)
+        if logger.is_enabled(logging.INFO):
+            logger.info(
+                "Сообщения пересланы",
+                key="deliver.sent",
+                kind=kind,
+                source=source_chat_id,
+                dest=dest_chat_id,
+                message_ids=job.message_ids,
+                media_group_id=job.media_group_id,
+                latency=latency,
             )
-        except Exception as final_e:
-            print(
-                f"[fallback_copy] Окончательная ошибка при отправке в {dest_chat_id}: {final_e}"
+    except FloodWait as fw:
+        logger.warning(
+            "FloodWait при пересылке",
+            key="deliver.flood_wait",
+            kind=kind,
+            source=source_chat_id,
+            dest=dest_chat_id,
+            wait=fw.value,
+        )
+        # Ограничитель запоминает FloodWait, а повтор планирует движок доставки.
+        # Резервный метод из-за ограничения скорости не используем.
+        limiter.on_flood_wait(dest_chat_id, fw.value)
+        flood_wait_seconds_total.inc(route, fw.value)
+        raise
+    except MessageIdInvalid:
+        message_id_invalid_total.inc(route)
+        logger.warning(
+            "MESSAGE_ID_INVALID: сообщения удалены или недоступны",
+            key="deliver.message_id_invalid",
+            kind=kind,
+            source=source_chat_id,
+            dest=dest_chat_id,
+            message_ids=job.message_ids,
+        )
+    except Exception as e:
+        if (
+            isinstance(e, DESTINATION_ERRORS)
+            and account is not None
+            and account_pool.exclude(account, dest_chat_id)
+        ):
+            # Чат недоступен этому аккаунту — повторяем с другого
+            raise SwitchAccount() from e
+        if isinstance(e, DESTINATION_ERRORS) and not is_confirmed(dest_chat_id):
+            # Первая же отправка в непроверенный чат не удалась — исключаем его сразу,
+            # не дожидаясь фоновой проверки чатов
+            logger.warning(
+                "Чат назначения недоступен, помещён в карантин",
+                dest=dest_chat_id,
+                error=repr(e),
             )
+            quarantine_destination(dest_chat_id)
+            return
+
+        capability_cache.record_failure(route, "forward", e)
+        logger.warning(
+            "Ошибка при пересылке, резервный метод",
+            key="deliver.fallback",
+            kind=kind,
+            source=source_chat_id,
+            dest=dest_chat_id,
+            message_ids=job.message_ids,
+            error=repr(e),
+        )
+        await fallback_job(client, job, limiter)
 
 
-async def process_media_group_with_delay(
-    client: Client,
-    mg_id: str,
-    source_chat_id: int,
-    chat_info: dict,
-    prefix: str,
-    delay: float = 1.0,
-):
+async def fallback_job(client: Client, job: DeliveryJob, limiter=rate_limiter):
     """
-    Отложенная пересылка медиагруппы: ждём небольшую паузу, затем отправляем
-    весь альбом «одним блоком» (forward_messages) во все чаты из FORWARDING_CONFIG.
+    Копирует сообщения задания резервным методом: по одному «якорному»
+    сообщению на альбом и каждое одиночное. FloodWait пробрасывается
+    движку доставки, как и при пересылке.
     """
-    from .app import FORWARDING_CONFIG  # ваш глобальный конфиг
+    route = (job.source_chat_id, job.dest_chat_id)
+    messages = await load_job_messages(client, job)
+    albums = {}
+    for message in messages:
+        if message.media_group_id:
+            albums.setdefault(message.media_group_id, []).append(message)
+    copied_groups = set()
+    for message in messages:
+        if message.media_group_id:
+            if message.media_group_id in copied_groups:
+                continue
+            copied_groups.add(message.media_group_id)
+        try:
+            branch = await fallback_copy(
+                client,
+                message,
+                job.dest_chat_id,
+                job.prefix,
+                album=albums.get(message.media_group_id),
+            )
+        except FloodWait as fw:
+            logger.warning(
+                "FloodWait при резервном копировании",
+                key="fallback.flood_wait",
+                source=job.source_chat_id,
+                dest=job.dest_chat_id,
+                message_id=message.id,
+                wait=fw.value,
+            )
+            limiter.on_flood_wait(job.dest_chat_id, fw.value)
+            flood_wait_seconds_total.inc(route, fw.value)
+            raise
+        fallbacks_total.inc(route + (branch,))
+        if branch != "failed" and message.date is not None:
+            delivery_latency_seconds.observe(route, time.time() - message.date.timestamp())
 
-    await asyncio.sleep(delay)
 
-    # Забираем накопленные сообщения из буфера
-    group_data = media_groups_buffer.pop(mg_id, None)
-    if not group_data:
-        return  # Кто-то уже забрал или очистил
+def job_latency(job: DeliveryJob):
+    """
+    Задержка доставки в секундах от публикации первого сообщения задания
+    (None, если объекты сообщений не загружены).
+    """
+    if not job.messages or job.messages[0].date is None:
+        return None
+    return max(0.0, round(time.time() - job.messages[0].date.timestamp(), 3))
 
-    messages = group_data["messages"]
-    if not messages:
-        return
 
-    # Сортируем по ID, чтобы сохранить исходный порядок
-    messages.sort(key=lambda m: m.id)
+async def load_job_messages(client: Client, job: DeliveryJob):
+    """
+    Возвращает объекты сообщений задания. Для заданий, восстановленных
+    из outbox, загружает их из исходного чата.
+    """
+    if job.messages is None:
+        try:
+            messages = await client.get_messages(job.source_chat_id, job.message_ids)
+        except Exception as e:
+            logger.warning(
+                "Не удалось загрузить сообщения",
+                source=job.source_chat_id,
+                message_ids=job.message_ids,
+                error=repr(e),
+            )
+            return []
+        job.messages = [m for m in messages if not m.empty]
+    return job.messages
 
-    # Все ID сообщений в группе
-    message_ids = [m.id for m in messages]
 
+async def enqueue_deliveries(source_chat_id: int, messages: list, media_group_id=None):
+    """
+    Ставит в очереди доставки по одному заданию на каждый чат назначения
+    из таблицы маршрутизации (через объединитель одиночных сообщений в пачки).
+    Сообщения, не прошедшие правила маршрута, в его чат не ставятся.
+    """
     # Определяем, в какие чаты нужно пересылать
-    if source_chat_id not in FORWARDING_CONFIG:
+    route = get_routing_table().get(source_chat_id)
+    if route is None:
         # Не настроена пересылка
         return
-    dest_chat_ids = set(FORWARDING_CONFIG[source_chat_id])
-
-    # Пересылаем альбом в каждый чат-получатель
-    first_forwarded = False
-    for dest_chat_id in dest_chat_ids:
-        # Добавляем задержку 1-3 секунды между отправками, но не перед первой
-        if first_forwarded:
-            delay_seconds = random.randint(1, 3)
-            print(
-                f"Ожидание {delay_seconds} секунд перед пересылкой медиагруппы {mg_id} в {dest_chat_id}..."
-            )
-            await asyncio.sleep(delay_seconds)
 
-        try:
-            await client.forward_messages(
-                chat_id=dest_chat_id,
-                from_chat_id=source_chat_id,
-                message_ids=message_ids,
-            )
-            print(f"Медиагруппа {mg_id} переслана одним блоком в {dest_chat_id}.")
-            first_forwarded = True
-        except FloodWait as fw:
-            print(
-                f"FloodWait при отправке медиагруппы {mg_id} -> {dest_chat_id}: ждём {fw.value} секунд."
-            )
-            await asyncio.sleep(fw.value)
-            try:
-                await client.forward_messages(
-                    chat_id=dest_chat_id,
-                    from_chat_id=source_chat_id,
-                    message_ids=message_ids,
-                )
-                print(
-                    f"Медиагруппа {mg_id} переслана в {dest_chat_id} (после FloodWait)."
-                )
-                first_forwarded = True
-            except Exception as e:
-                print(
-                    f"Ошибка после FloodWait (медиагруппа {mg_id} -> {dest_chat_id}): {e}, резервный метод."
-                )
-                # Берём «якорное» сообщение, чтобы fallback_copy понимать что копировать
-                anchor_message = messages[0]
-                await fallback_copy(client, anchor_message, dest_chat_id, prefix)
-        except MessageIdInvalid:
-            print(
-                f"[MediaGroup] MESSAGE_ID_INVALID для {mg_id}, сообщение удалено или недоступно."
-            )
-        except Exception as e:
-            print(
-                f"Ошибка при пересылке медиагруппы {mg_id} -> {dest_chat_id}: {e}, резервный метод."
+    message_ids = [m.id for m in messages]
+    jobs = []
+    for dest_chat_id, selected in route_deliveries(route, messages, media_group_id):
+        # Запоминаем до отправки: эхо может прийти раньше ответа Telegram
+        provenance_cache.record(selected, (dest_chat_id,))
+        jobs.append(
+            DeliveryJob(
+                source_chat_id=source_chat_id,
+                dest_chat_id=dest_chat_id,
+                message_ids=(
+                    message_ids if selected is messages else [m.id for m in selected]
+                ),
+                prefix=route.prefix,
+                media_group_id=media_group_id,
+                messages=selected,
             )
-            anchor_message = messages[0]
-            await fallback_copy(client, anchor_message, dest_chat_id, prefix)
+        )
+    # Задания во все чаты назначения записываются в outbox одной фиксацией
+    await message_batcher.submit_many(jobs)
 
+    # Запоминаем последнее поставленное на доставку сообщение (для догонялки)
+    catch_up_position.record(source_chat_id, max(message_ids))
 
-async def forward_message(client: Client, message: Message, chat_info=None):
+
+async def enqueue_history(client: Client, source_chat_id: int, messages: list):
     """
-    Обработчик входящих сообщений с поддержкой:
-    - медиагрупп (отправка альбомом),
-    - FloodWait,
-    - fallback-копирования (если forward не доступен),
-    - множественных чатов назначения из FORWARDING_CONFIG.
-    - задержки 1-3 секунды между отправками (не для первой отправки)
+    Ставит на доставку пачку сообщений, пропущенных пока бот был выключен
+    (одним вызовом forward_messages на каждый чат назначения).
     """
-    from .app import FORWARDING_CONFIG  # Ваш глобальный конфиг с пересылками
+    messages = [
+        m
+        for m in messages
+        if not m.empty
+        and not m.service
+        and not (m.from_user and m.from_user.id == client.me.id)
+        and not provenance_cache.is_echo(m)
+        and not dedup_cache.check_and_add(DedupCache.message_key(m))
+    ]
+    if not messages:
+        return
 
+    # Если пачка — это один альбом, отправляем её как медиагруппу
+    mg_ids = {m.media_group_id for m in messages}
+    media_group_id = mg_ids.pop() if len(mg_ids) == 1 else None
+
+    await enqueue_deliveries(source_chat_id, messages, media_group_id=media_group_id)
+
+
+async def forward_message(client: Client, message: Message):
+    """
+    Обработчик входящих сообщений. Сам ничего не отправляет, а только
+    ставит задания в очереди движка доставки (по одному на чат назначения):
+    - медиагруппы собираются MediaGroupAssembler и отправляются альбомом,
+    - одиночные сообщения ставятся в очереди сразу.
+    Доставка (FloodWait, fallback-копирование) выполняется в deliver_job,
+    паузы между отправками задаёт ограничитель скорости.
+    """
     source_chat_id = message.chat.id
-    print(f"Получено сообщение из чата {source_chat_id}")
+    logger.debug("Получено сообщение", source=source_chat_id, message_id=message.id)
 
     # Игнорируем собственные сообщения бота (если бот работает от аккаунта, а не Bot API)
     if message.from_user and message.from_user.id == client.me.id:
-        print(f"Сообщение в {source_chat_id} проигнорировано (собственное сообщение).")
+        logger.debug(
+            "Собственное сообщение проигнорировано",
+            source=source_chat_id,
+            message_id=message.id,
+        )
         return
 
     # Проверяем, настроена ли пересылка из этого чата
-    if source_chat_id not in FORWARDING_CONFIG:
+    if source_chat_id not in get_routing_table():
         return
 
-    # Для fallback-копирования формируем префикс
-    source_chat_info = ""
-    if chat_info and source_chat_id in chat_info:
-        # например, chat_info[123123] = {"username": "some_channel", "type": "channel"}
-        if "username" in chat_info[source_chat_id]:
-            source_chat_info = f"@{chat_info[source_chat_id]['username']}"
-        elif "type" in chat_info[source_chat_id]:
-            source_chat_info = f"{chat_info[source_chat_id]['type']} {source_chat_id}"
-
-    if not source_chat_info:
-        source_chat_info = f"Чат {source_chat_id}"
+    # В каналах from_user пуст, поэтому собственные пересылки узнаём по
+    # происхождению: эхо уже ретранслированного сообщения (петля маршрутов)
+    if provenance_cache.is_echo(message):
+        logger.warning(
+            "Сообщение уже ретранслировано ботом, петля маршрутов",
+            key="forward.loop",
+            source=source_chat_id,
+            message_id=message.id,
+        )
+        return
 
-    prefix = f"📨 Переслано из: {source_chat_info}\n\n"
+    # Пропускаем обновления, которые уже обрабатывали (повторная доставка после переподключения)
+    if dedup_cache.check_and_add(DedupCache.message_key(message)):
+        logger.debug(
+            "Дубликат сообщения пропущен",
+            key="forward.duplicate",
+            source=source_chat_id,
+            message_id=message.id,
+        )
+        return
 
     # Если у сообщения есть media_group_id — обрабатываем как часть альбома
     if message.media_group_id:
-        mg_id = message.media_group_id
-
-        # Если в буфере ещё нет этой группы - создаём
-        if mg_id not in media_groups_buffer:
-            media_groups_buffer[mg_id] = {"messages": [], "task": None}
-
-        media_groups_buffer[mg_id]["messages"].append(message)
-
-        # Если нет запущенной задачи на отправку альбома, создаём её
-        if media_groups_buffer[mg_id]["task"] is None:
-            media_groups_buffer[mg_id]["task"] = asyncio.create_task(
-                process_media_group_with_delay(
-                    client=client,
-                    mg_id=mg_id,
-                    source_chat_id=source_chat_id,
-                    chat_info=chat_info,
-                    prefix=prefix,
-                )
-            )
-
-        # Возвращаемся сразу, т.к. отправка будет через задачу
+        # Сборщик сам отправит альбом, когда он будет собран
+        media_group_assembler.add(message)
         return
 
-    # Иначе — одиночное сообщение (без media_group_id). Пересылаем сразу в каждый чат
-    dest_chat_ids = set(FORWARDING_CONFIG[source_chat_id])
-    first_forwarded = False
-    for dest_chat_id in dest_chat_ids:
-        # Добавляем задержку 1-3 секунды между отправками, но не перед первой
-        if first_forwarded:
-            delay_seconds = random.randint(1, 3)
-            print(
-                f"Ожидание {delay_seconds} секунд перед пересылкой сообщения в {dest_chat_id}..."
-            )
-            await asyncio.sleep(delay_seconds)
-
-        try:
-            await message.forward(dest_chat_id)
-            print(f"Сообщение из {source_chat_id} переслано в {dest_chat_id}")
-            first_forwarded = True
-        except FloodWait as fw:
-            print(f"FloodWait: ожидание {fw.value} секунд (одиночное сообщение)")
-            await asyncio.sleep(fw.value)
-            try:
-                await message.forward(dest_chat_id)
-                print(
-                    f"Сообщение из {source_chat_id} переслано в {dest_chat_id} (после FloodWait)"
-                )
-                first_forwarded = True
-            except Exception as e:
-                print(
-                    f"Ошибка после FloodWait (одиночное сообщение): {e}, резервный метод"
-                )
-                await fallback_copy(client, message, dest_chat_id, prefix)
-        except MessageIdInvalid:
-            print(f"[Single] MESSAGE_ID_INVALID для сообщения {message.id}, удалено?")
-        except Exception as e:
-            print(
-                f"Ошибка при пересылке одиночного сообщения в {dest_chat_id}: {e}, резервный метод"
-            )
-            await fallback_copy(client, message, dest_chat_id, prefix)
+    # Иначе — одиночное сообщение (без media_group_id). Ставим в очереди всех чатов назначения
+    await enqueue_deliveries(source_chat_id, [message])
 
 
-def create_handler(chat_info_data):
+def create_handler():
     """
-    Создает функцию-обработчик сообщений с доступом к информации о чатах
+    Создает функцию-обработчик сообщений
     """
 
     async def handler(client, message):
-        await forward_message(client, message, chat_info_data)
+        # Пока чат догоняет пропущенные сообщения, новые откладываются
+        if catch_up_gate.hold(message):
+            return
+        await forward_message(client, message)
 
     return handler
+
+
+# Глобальный сборщик медиагрупп: собранные альбомы ставятся в очереди доставки
+media_group_assembler = MediaGroupAssembler(on_flush=enqueue_deliveries)
+
+registry.gauge(
+    "forwarder_media_group_buffer",
+    "Медиагруппы, ожидающие сборки альбома",
+    lambda: media_group_assembler.in_flight,
+)
+registry.gauge(
+    "forwarder_media_group_idle_gap_seconds",
+    "Текущая пауза ожидания следующей части альбома (секунды)",
+    lambda: round(media_group_assembler.idle_gap(), 3),
+)
+
+
+def create_sender():
+    """
+    Создает функцию-отправитель для движка доставки: задание отправляется
+    клиентом выбранного движком аккаунта
+    """
+
+    async def sender(job: DeliveryJob, account: SenderAccount):
+        await deliver_job(account.client, job, account)
+
+    return sender
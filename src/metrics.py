@@ -0,0 +1,284 @@
+# src/metrics.py
+
+import asyncio
+import bisect
+
+from .config import settings
+from .logger import get_logger
+
+
+logger = get_logger("metrics")
+
+# Границы корзин гистограммы задержки доставки (секунды)
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)
+
+
+def _format_labels(labelnames, labels):
+    if not labelnames:
+        return ""
+    pairs = ",".join(
+        f'{name}="{str(value)}"' for name, value in zip(labelnames, labels)
+    )
+    return "{" + pairs + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class Counter:
+    """
+    Монотонный счётчик с метками. Обновление — одно сложение в словаре.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.values = {}  # {labels: значение}
+
+    def inc(self, labels=(), value=1):
+        self.values[labels] = self.values.get(labels, 0) + value
+
+    def collect(self):
+        for labels, value in self.values.items():
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными корзинами. Наблюдение — поиск корзины
+    (bisect) и три сложения; накопленные суммы считаются только при выдаче.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self.series = {}  # {labels: [счётчики корзин..., +Inf, сумма]}
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def collect(self):
+        for labels, series in self.series.items():
+            total = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                total += count
+                yield (
+                    f"{self.name}_bucket",
+                    _format_labels(self.labelnames + ("le",), labels + (_format_value(float(bound)),)),
+                    total,
+                )
+            label_text = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum", label_text, round(series[-1], 6)
+            yield f"{self.name}_count", label_text, total
+
+
+class Gauge:
+    """
+    Показатель, значение которого считывается функцией в момент запроса
+    метрик, поэтому на горячем пути он ничего не стоит.
+    Функция возвращает число или словарь {labels: значение}.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, read, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.read = read
+
+    def collect(self):
+        value = self.read()
+        if not isinstance(value, dict):
+            value = {(): value}
+        for labels, v in value.items():
+            yield self.name, _format_labels(self.labelnames, labels), v
+
+
+class MetricsRegistry:
+    """
+    Набор метрик, отдаваемых в текстовом формате Prometheus.
+    """
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self.register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name, help_text, read, labelnames=()):
+        return self.register(Gauge(name, help_text, read, labelnames))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                for name, labels, value in metric.collect():
+                    lines.append(f"{name}{labels} {_format_value(value)}")
+            except Exception as e:
+                logger.error("Ошибка чтения метрики", metric=metric.name, error=repr(e))
+        lines.append("")
+        return "\n".join(lines)
+
+
+# Глобальный реестр метрик
+registry = MetricsRegistry()
+
+ROUTE_LABELS = ("source", "dest")
+
+forwards_total = registry.counter(
+    "forwarder_forwards_total",
+    "Сообщения, пересланные через forward_messages",
+    ROUTE_LABELS,
+)
+fallbacks_total = registry.counter(
+    "forwarder_fallbacks_total",
+    "Резервные копирования по ветке fallback_copy",
+    ROUTE_LABELS + ("branch",),
+)
+message_id_invalid_total = registry.counter(
+    "forwarder_message_id_invalid_total",
+    "Ошибки MESSAGE_ID_INVALID (исходные сообщения удалены)",
+    ROUTE_LABELS,
+)
+flood_wait_seconds_total = registry.counter(
+    "forwarder_flood_wait_seconds_total",
+    "Суммарное время FloodWait, запрошенное Telegram (секунды)",
+    ROUTE_LABELS,
+)
+delivery_latency_seconds = registry.histogram(
+    "forwarder_delivery_latency_seconds",
+    "Задержка от публикации сообщения до подтверждённой доставки (секунды)",
+    ROUTE_LABELS,
+)
+
+
+class LoopLagMonitor:
+    """
+    Измеряет задержку цикла событий: насколько позже запланированного
+    просыпается периодическая задача.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lag = max(0.0, loop.time() - expected)
+            self.max_lag = max(self.max_lag, self.lag)
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+
+# Глобальный монитор задержки цикла событий
+loop_lag_monitor = LoopLagMonitor(settings.metrics_lag_interval)
+
+registry.gauge(
+    "forwarder_event_loop_lag_seconds",
+    "Задержка цикла событий при последнем измерении (секунды)",
+    lambda: round(loop_lag_monitor.lag, 6),
+)
+registry.gauge(
+    "forwarder_event_loop_lag_max_seconds",
+    "Максимальная задержка цикла событий с момента запуска (секунды)",
+    lambda: round(loop_lag_monitor.max_lag, 6),
+)
+
+
+class MetricsServer:
+    """
+    Минимальный HTTP-сервер в том же цикле событий: отдаёт метрики
+    по GET /metrics в текстовом формате Prometheus.
+    render() — функция или корутина, возвращающая текст метрик.
+    """
+
+    def __init__(self, host: str, port: int, render=None):
+        self.host = host
+        self.port = port
+        self.render = render or registry.render
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info("Метрики доступны по HTTP", host=self.host, port=self.port)
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            # Заголовки запроса не нужны, но их надо дочитать
+            while True:
+                line = await asyncio.wait_for(reader.readline(), 5)
+                if line in (b"\r\n", b"\n", b""):
+                    break
+
+            parts = request_line.decode("latin-1").split()
+            path = parts[1].split("?", 1)[0] if len(parts) > 1 else ""
+            if parts and parts[0] == "GET" and path in ("/metrics", "/"):
+                status = "200 OK"
+                body = self.render()
+                if asyncio.iscoroutine(body):
+                    body = await body
+                body = body.encode()
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            else:
+                status = "404 Not Found"
+                body = b"not found\n"
+                content_type = "text/plain; charset=utf-8"
+
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
@@ -0,0 +1,256 @@
+# src/outbox.py
+
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import settings
+from .logger import get_logger
+
+
+logger = get_logger("outbox")
+
+
+# Файл базы исходящих доставок (лежит рядом с forward_config.json)
+OUTBOX_FILE = os.path.join(
+    os.path.dirname(settings.bot_chats_config_file), settings.outbox_file
+)
+
+
+class Outbox:
+    """
+    Надёжная очередь исходящих доставок (SQLite в режиме WAL).
+    Каждая доставка (исходный чат, ID сообщений, чат назначения) записывается
+    в базу до первой попытки отправки и удаляется после её завершения.
+    После перезапуска незавершённые доставки воспроизводятся заново
+    (семантика «хотя бы один раз»).
+
+    Записи накапливаются и фиксируются пачками (group commit) в отдельном
+    потоке, поэтому запись на диск не блокирует цикл событий и выдерживает
+    тысячи постановок в секунду.
+    """
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self.conn = None
+        # Все операции с базой выполняются в одном потоке
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="outbox")
+        self.pending_adds = []  # [(rows, future)] future получает ID записей rows
+        self.pending_rows = 0
+        self.pending_done = []  # [outbox_id]
+        self.pending_last_ids = {}  # {source_chat_id: last_message_id}
+        self.wakeup = None
+        self.stopping = False
+        self.task = None
+
+    def _open(self):
+        self.conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                source_chat_id INTEGER NOT NULL,
+                dest_chat_id INTEGER NOT NULL,
+                message_ids TEXT NOT NULL,
+                media_group_id TEXT,
+                prefix TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                lane TEXT
+            )
+            """
+        )
+        # Базы прежних версий: полоса доставки не сохранялась
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(outbox)")}
+        if "lane" not in columns:
+            self.conn.execute("ALTER TABLE outbox ADD COLUMN lane TEXT")
+        # Последнее сообщение каждого исходного чата, поставленное на доставку
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS source_state (
+                source_chat_id INTEGER PRIMARY KEY,
+                last_message_id INTEGER NOT NULL
+            )
+            """
+        )
+        self.conn.commit()
+
+    def _commit(self, rows, done_ids, last_ids):
+        """
+        Записывает пачку новых доставок, удаляет завершённые и обновляет
+        последние ID исходных чатов одной транзакцией.
+        Возвращает ID новых записей в порядке rows.
+        """
+        ids = []
+        with self.conn:
+            for row in rows:
+                cursor = self.conn.execute(
+                    "INSERT INTO outbox (source_chat_id, dest_chat_id, message_ids, "
+                    "media_group_id, prefix, created_at, lane) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    row,
+                )
+                ids.append(cursor.lastrowid)
+            if done_ids:
+                self.conn.executemany(
+                    "DELETE FROM outbox WHERE id = ?", [(i,) for i in done_ids]
+                )
+            if last_ids:
+                self.conn.executemany(
+                    "INSERT INTO source_state (source_chat_id, last_message_id) VALUES (?, ?) "
+                    "ON CONFLICT(source_chat_id) DO UPDATE SET "
+                    "last_message_id = MAX(last_message_id, excluded.last_message_id)",
+                    list(last_ids.items()),
+                )
+        return ids
+
+    def _load_pending(self):
+        return self.conn.execute(
+            "SELECT id, source_chat_id, dest_chat_id, message_ids, media_group_id, prefix, "
+            "lane FROM outbox ORDER BY id"
+        ).fetchall()
+
+    def _load_last_ids(self):
+        return dict(
+            self.conn.execute(
+                "SELECT source_chat_id, last_message_id FROM source_state"
+            ).fetchall()
+        )
+
+    async def _run_in_thread(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def start(self):
+        """
+        Открывает базу и запускает фоновую фиксацию пачек.
+        Возвращает незавершённые доставки, оставшиеся с прошлого запуска.
+        """
+        await self._run_in_thread(self._open)
+        self.wakeup = asyncio.Event()
+        self.stopping = False
+        self.task = asyncio.create_task(self._flusher())
+        rows = await self._run_in_thread(self._load_pending)
+        return [
+            {
+                "outbox_id": row[0],
+                "source_chat_id": row[1],
+                "dest_chat_id": row[2],
+                "message_ids": json.loads(row[3]),
+                "media_group_id": row[4],
+                "prefix": row[5],
+                "lane": row[6],
+            }
+            for row in rows
+        ]
+
+    async def add(self, job):
+        """
+        Записывает доставку в базу и возвращает её ID после фиксации на диске.
+        """
+        return (await self.add_many([job]))[0]
+
+    async def add_many(self, jobs):
+        """
+        Записывает несколько доставок (например, одно сообщение во все чаты
+        назначения) одной фиксацией и возвращает их ID в порядке jobs.
+        """
+        now = time.time()
+        rows = [
+            (
+                job.source_chat_id,
+                job.dest_chat_id,
+                json.dumps(job.message_ids),
+                job.media_group_id,
+                job.prefix,
+                now,
+                job.lane,
+            )
+            for job in jobs
+        ]
+        future = asyncio.get_running_loop().create_future()
+        self.pending_adds.append((rows, future))
+        self.pending_rows += len(rows)
+        if self.pending_rows >= settings.outbox_batch_size:
+            self.wakeup.set()
+        return await future
+
+    async def last_message_ids(self):
+        """
+        Возвращает {source_chat_id: ID последнего сообщения, поставленного на доставку}.
+        """
+        return await self._run_in_thread(self._load_last_ids)
+
+    def record_last_message_id(self, source_chat_id, message_id):
+        """
+        Запоминает последнее сообщение исходного чата, поставленное на доставку
+        (сохраняется при следующей фиксации).
+        """
+        if message_id > self.pending_last_ids.get(source_chat_id, 0):
+            self.pending_last_ids[source_chat_id] = message_id
+
+    def done(self, outbox_id):
+        """
+        Отмечает доставку завершённой (запись удаляется при следующей фиксации).
+        """
+        if outbox_id is not None:
+            self.pending_done.append(outbox_id)
+
+    async def _flush(self):
+        adds, self.pending_adds = self.pending_adds, []
+        self.pending_rows = 0
+        done_ids, self.pending_done = self.pending_done, []
+        last_ids, self.pending_last_ids = self.pending_last_ids, {}
+        if not adds and not done_ids and not last_ids:
+            return
+        try:
+            ids = await self._run_in_thread(
+                self._commit, [row for rows, _ in adds for row in rows], done_ids, last_ids
+            )
+        except Exception as e:
+            for _, future in adds:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        start = 0
+        for rows, future in adds:
+            if not future.done():
+                future.set_result(ids[start : start + len(rows)])
+            start += len(rows)
+
+    async def _flusher(self):
+        while not self.stopping:
+            try:
+                await asyncio.wait_for(
+                    self.wakeup.wait(), settings.outbox_flush_interval
+                )
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            try:
+                await self._flush()
+            except Exception as e:
+                logger.error("Ошибка записи outbox", file=self.db_file, error=repr(e))
+
+    async def stop(self):
+        """
+        Фиксирует всё накопленное и закрывает базу.
+        """
+        if self.task is not None:
+            # Не отменяем задачу: прерванная фиксация оставила бы пачку,
+            # уже забранную из очереди, без ответа ожидающим add_many
+            self.stopping = True
+            self.wakeup.set()
+            await self.task
+            self.task = None
+        if self.conn is not None:
+            await self._flush()
+            await self._run_in_thread(self.conn.close)
+            self.conn = None
+
+
+# Глобальная очередь исходящих доставок
+outbox = Outbox(OUTBOX_FILE)
@@ -0,0 +1,111 @@
+# src/provenance.py
+
+import time
+from collections import OrderedDict
+
+from .config import settings
+from .metrics import registry
+
+
+loop_dropped_total = registry.counter(
+    "forwarder_loop_dropped_total",
+    "Сообщения, отброшенные как уже ретранслированные этим ботом (петля маршрутов)",
+    ("source",),
+)
+
+
+def origin_key(message):
+    """
+    Происхождение сообщения: (ID исходного чата, ID сообщения в нём).
+    У пересланного сообщения это оригинал (Telegram сохраняет его при
+    повторных пересылках), у остальных — само сообщение.
+    """
+    forward_chat = getattr(message, "forward_from_chat", None)
+    forward_message_id = getattr(message, "forward_from_message_id", None)
+    if forward_chat is not None and forward_message_id:
+        return (forward_chat.id, forward_message_id)
+    return (message.chat.id, message.id)
+
+
+class ProvenanceCache:
+    """
+    Защита от петель маршрутизации (A→B и B→A, в том числе через разные
+    аккаунты): запоминает, какие оригиналы и в какие чаты бот уже
+    ретранслировал. Сообщение, пришедшее в чат, куда бот сам отправил
+    тот же оригинал, — эхо собственной пересылки, и оно отбрасывается.
+
+    Копии (резервный метод) не несут заголовка пересылки, поэтому для них
+    запоминаются сами отправленные сообщения.
+
+    LRU с TTL поверх OrderedDict, как DedupCache: {происхождение:
+    (время, множество чатов назначения)}.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+
+    def _expire(self, now: float):
+        while self.entries:
+            key, (relayed_at, _) = next(iter(self.entries.items()))
+            if now - relayed_at < self.ttl:
+                break
+            del self.entries[key]
+
+    def _add(self, key, dest_chat_ids, now):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.entries[key] = (now, set(dest_chat_ids))
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        else:
+            entry[1].update(dest_chat_ids)
+            self.entries[key] = (now, entry[1])
+            self.entries.move_to_end(key)
+
+    def record(self, messages, dest_chat_ids):
+        """
+        Запоминает, что сообщения поставлены на доставку в dest_chat_ids.
+        """
+        if not dest_chat_ids:
+            return
+        now = time.time()
+        self._expire(now)
+        for message in messages:
+            self._add(origin_key(message), dest_chat_ids, now)
+
+    def record_sent(self, dest_chat_id, sent):
+        """
+        Запоминает сообщения, отправленные копированием (sent — сообщение
+        или список сообщений из ответа Telegram).
+        """
+        if sent is None:
+            return
+        now = time.time()
+        for message in sent if isinstance(sent, list) else (sent,):
+            message_id = getattr(message, "id", None)
+            if message_id:
+                self._add((dest_chat_id, message_id), (dest_chat_id,), now)
+
+    def is_echo(self, message) -> bool:
+        """
+        True, если сообщение — эхо пересылки, уже выполненной этим ботом.
+        """
+        entry = self.entries.get(origin_key(message))
+        if entry is None or message.chat.id not in entry[1]:
+            return False
+        if time.time() - entry[0] >= self.ttl:
+            return False
+        loop_dropped_total.inc((message.chat.id,))
+        return True
+
+
+# Глобальный кэш происхождения ретранслированных сообщений
+provenance_cache = ProvenanceCache(settings.provenance_max_entries, settings.provenance_ttl)
+
+registry.gauge(
+    "forwarder_provenance_cache_entries",
+    "Оригиналы сообщений в кэше защиты от петель",
+    lambda: len(provenance_cache.entries),
+)
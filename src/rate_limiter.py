@@ -0,0 +1,251 @@
+# src/rate_limiter.py
+
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from .config import settings
+from .logger import get_logger
+
+
+logger = get_logger("rate_limiter")
+
+
+# Файл с выученными скоростями отправки (лежит рядом с forward_config.json)
+RATE_LIMITS_FILE = os.path.join(
+    os.path.dirname(settings.bot_chats_config_file), settings.rate_limits_file
+)
+
+
+class TokenBucket:
+    """
+    Адаптивное «ведро токенов».
+    Скорость пополнения уменьшается при каждом FloodWait и медленно
+    восстанавливается до базовой после успешных отправок.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.base_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        # До этого момента отправки запрещены (последний FloodWait)
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.rate
+        )
+        self.updated = now
+
+    def reserve(self) -> float:
+        """
+        Забирает один токен и возвращает, сколько секунд нужно подождать
+        перед отправкой (0, если токен доступен сразу).
+        """
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+        return max(wait, self.blocked_until - now)
+
+    def on_flood_wait(self, seconds: float, decrease: float, block: bool = True):
+        """
+        Учитывает FloodWait: уменьшает скорость и (опционально) блокирует
+        отправку на указанное время.
+        """
+        now = time.monotonic()
+        self._refill(now)
+        self.rate = max(settings.rate_limit_min_rate, self.rate * decrease)
+        if block:
+            self.tokens = min(self.tokens, 0)
+            self.blocked_until = max(self.blocked_until, now + seconds)
+
+    def on_success(self):
+        """
+        Медленно восстанавливает скорость после успешной отправки.
+        """
+        if self.rate < self.base_rate:
+            self.rate = min(
+                self.base_rate,
+                self.rate + self.base_rate * settings.rate_limit_recovery,
+            )
+
+
+class RateLimiter:
+    """
+    Ограничитель скорости отправки: отдельное ведро для каждого чата
+    назначения и общее ведро для аккаунта. Выученные скорости сохраняются
+    в файл, чтобы после перезапуска не начинать с агрессивной отправки.
+    """
+
+    def __init__(self, state_file: str):
+        self.state_file = state_file
+        self.account = TokenBucket(
+            settings.rate_limit_account, settings.rate_limit_account_burst
+        )
+        self.destinations = {}  # {dest_chat_id: TokenBucket}
+        self.learned_rates = {}  # {dest_chat_id: rate} из файла состояния
+        self.dirty = False
+        self.save_task = None
+
+    def _bucket(self, dest_chat_id):
+        bucket = self.destinations.get(dest_chat_id)
+        if bucket is None:
+            bucket = TokenBucket(
+                settings.rate_limit_destination, settings.rate_limit_destination_burst
+            )
+            if dest_chat_id in self.learned_rates:
+                bucket.rate = min(bucket.base_rate, self.learned_rates[dest_chat_id])
+            self.destinations[dest_chat_id] = bucket
+        return bucket
+
+    async def acquire(self, dest_chat_id):
+        """
+        Ожидает, пока отправка в чат назначения станет разрешена
+        и по ведру чата, и по общему ведру аккаунта.
+        """
+        wait = self._bucket(dest_chat_id).reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        wait = self.account.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def on_flood_wait(self, dest_chat_id, seconds: float):
+        """
+        Учитывает FloodWait: чат назначения блокируется на время ожидания
+        и замедляется, общая скорость аккаунта снижается мягче.
+        """
+        self._bucket(dest_chat_id).on_flood_wait(
+            seconds, settings.rate_limit_decrease
+        )
+        self.account.on_flood_wait(
+            seconds, settings.rate_limit_account_decrease, block=False
+        )
+        self.dirty = True
+
+    def on_success(self, dest_chat_id):
+        bucket = self._bucket(dest_chat_id)
+        if bucket.rate < bucket.base_rate or self.account.rate < self.account.base_rate:
+            bucket.on_success()
+            self.account.on_success()
+            self.dirty = True
+
+    def load(self):
+        """
+        Загружает выученные скорости из файла состояния.
+        """
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except json.JSONDecodeError as e:
+            logger.warning(
+                "Файл скоростей отправки повреждён, используются базовые",
+                file=self.state_file,
+                error=repr(e),
+            )
+            return
+
+        if "account" in state:
+            self.account.rate = min(self.account.base_rate, state["account"])
+        self.learned_rates = {
+            int(k): v for k, v in state.get("destinations", {}).items()
+        }
+        for dest_chat_id, bucket in self.destinations.items():
+            if dest_chat_id in self.learned_rates:
+                bucket.rate = min(bucket.base_rate, self.learned_rates[dest_chat_id])
+        logger.info(
+            "Загружены скорости отправки",
+            destinations=len(self.learned_rates),
+            file=self.state_file,
+        )
+
+    def _snapshot(self):
+        """
+        Замедленные скорости для сохранения (восстановленные до базовой не храним).
+        """
+        for dest_chat_id, bucket in self.destinations.items():
+            self.learned_rates[dest_chat_id] = bucket.rate
+        self.dirty = False
+        return {
+            "account": self.account.rate,
+            "destinations": {
+                str(dest_chat_id): rate
+                for dest_chat_id, rate in self.learned_rates.items()
+                if rate < settings.rate_limit_destination
+            },
+        }
+
+    def _write(self, state):
+        # Запись во временный файл и атомарная замена: сбой во время записи
+        # не оставляет обрезанный файл, а прежние скорости сохраняются
+        fd, tmp_file = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self.state_file)),
+            prefix=os.path.basename(self.state_file) + ".",
+            suffix=".tmp",
+        )
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(state, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            # mkstemp создаёт файл с правами 0600 — сохраняем права прежнего
+            try:
+                mode = os.stat(self.state_file).st_mode & 0o777
+            except FileNotFoundError:
+                mode = 0o644
+            os.chmod(tmp_file, mode)
+            os.replace(tmp_file, self.state_file)
+        except BaseException:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+
+    def save(self):
+        """
+        Сохраняет замедленные скорости (при остановке, в цикле событий).
+        """
+        try:
+            self._write(self._snapshot())
+        except BaseException:
+            self.dirty = True
+            raise
+
+    async def _save_periodically(self):
+        while True:
+            await asyncio.sleep(settings.rate_limit_save_interval)
+            if self.dirty:
+                # Снимок состояния — в цикле событий, запись на диск — в потоке
+                state = self._snapshot()
+                try:
+                    await asyncio.to_thread(self._write, state)
+                except OSError as e:
+                    self.dirty = True
+                    logger.error(
+                        "Не удалось сохранить скорости отправки",
+                        file=self.state_file,
+                        error=repr(e),
+                    )
+
+    def start(self):
+        self.load()
+        if self.save_task is None:
+            self.save_task = asyncio.create_task(self._save_periodically())
+
+    async def stop(self):
+        if self.save_task is not None:
+            self.save_task.cancel()
+            await asyncio.gather(self.save_task, return_exceptions=True)
+            self.save_task = None
+        if self.dirty:
+            self.save()
+
+
+# Глобальный ограничитель скорости для аккаунта
+rate_limiter = RateLimiter(RATE_LIMITS_FILE)
@@ -0,0 +1,72 @@
+# src/retry_queue.py
+
+import asyncio
+import heapq
+import itertools
+import time
+
+from .logger import get_logger
+
+
+logger = get_logger("retry_queue")
+
+
+class RetryScheduler:
+    """
+    «Парковка» для отправок, упёршихся в FloodWait.
+    Задания хранятся в куче таймеров и возвращаются в работу в момент
+    now + задержка, не блокируя остальную доставку. Один фоновый таймер
+    обслуживает всю кучу.
+    """
+
+    def __init__(self):
+        self.heap = []  # [(due_time, seq, job, callback)]
+        self.seq = itertools.count()
+        self.wakeup = None
+        self.task = None
+
+    def park(self, job, delay: float, callback):
+        """
+        Откладывает задание на delay секунд, затем вызывает callback(job).
+        """
+        due_time = time.monotonic() + delay
+        heapq.heappush(self.heap, (due_time, next(self.seq), job, callback))
+        if self.task is None:
+            self.wakeup = asyncio.Event()
+            self.task = asyncio.create_task(self._run())
+        # Будим таймер, если новое задание должно сработать раньше текущего
+        self.wakeup.set()
+
+    async def _run(self):
+        while True:
+            self.wakeup.clear()
+            if not self.heap:
+                await self.wakeup.wait()
+                continue
+
+            timeout = self.heap[0][0] - time.monotonic()
+            if timeout > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, _, job, callback = heapq.heappop(self.heap)
+            try:
+                callback(job)
+            except Exception as e:
+                logger.error("Ошибка при возврате задания в очередь", error=repr(e))
+
+    def __len__(self):
+        return len(self.heap)
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+
+# Глобальная «парковка» отложенных отправок
+retry_scheduler = RetryScheduler()
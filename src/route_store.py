@@ -0,0 +1,466 @@
+# src/route_store.py
+
+import argparse
+import hashlib
+from array import array
+import json
+import os
+import sqlite3
+import tempfile
+
+from .config import settings
+
+
+# Файл базы маршрутов (лежит рядом с forward_config.json)
+ROUTE_STORE_FILE = os.path.join(
+    os.path.dirname(settings.bot_chats_config_file), settings.route_store_file
+)
+
+# Разделы конфигурации, которые задаются вручную (хранятся как есть, в JSON)
+SECTION_NAMES = ("ROUTE_WEIGHTS", "ROUTE_RULES")
+
+
+def _pack_ids(chat_ids) -> bytes:
+    # Список ID чатов хранится массивом int64: разбирается без JSON
+    return array("q", chat_ids).tobytes()
+
+
+def _unpack_ids(data) -> list:
+    ids = array("q")
+    ids.frombytes(data)
+    return ids.tolist()
+
+
+def _chat_info_entry(chat_type, username):
+    # Тот же вид записи, что и в CHAT_INFO файла конфигурации
+    if username:
+        return {"username": username, "type": chat_type}
+    return {"type": chat_type}
+
+
+def _file_digest(path):
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+class RouteStore:
+    """
+    Хранилище маршрутов пересылки в SQLite (режим WAL).
+
+    У каждого исходного чата одна строка со списком чатов назначения
+    (запуск читает по строке на источник), а таблица routes хранит те же
+    маршруты по строке на пару с индексами в обе стороны: источники чата
+    назначения находятся поиском по индексу. Изменения (новая
+    конфигурация, удаление недоступных чатов, обновление информации
+    о чатах) применяются одной транзакцией и затрагивают только
+    изменившиеся строки, поэтому запуск больше не перезаписывает всю
+    конфигурацию. Информация о чатах загружается только для чатов,
+    которые есть в маршрутах.
+
+    forward_config.json остаётся форматом импорта и экспорта: файл
+    импортируется, только если изменился с последней синхронизации
+    (сравнивается хеш содержимого), а экспортируется атомарно (запись во
+    временный файл и os.replace), только когда изменились маршруты.
+    """
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self.conn = None
+
+    def _connection(self):
+        if self.conn is None:
+            # Рабочие процессы супервизора делят одну базу: ждём блокировку
+            self.conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(
+                """
+                -- Чаты назначения источника (массив int64, в порядке конфигурации);
+                -- position — место в SOURCE_CHAT_IDS (NULL, если источника там нет)
+                CREATE TABLE IF NOT EXISTS sources (
+                    source_chat_id INTEGER PRIMARY KEY,
+                    position INTEGER,
+                    dest_chat_ids BLOB NOT NULL
+                );
+                -- Те же маршруты по строке на пару — для поиска в обе стороны
+                CREATE TABLE IF NOT EXISTS routes (
+                    source_chat_id INTEGER NOT NULL,
+                    dest_chat_id INTEGER NOT NULL,
+                    PRIMARY KEY (source_chat_id, dest_chat_id)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS routes_by_dest
+                    ON routes (dest_chat_id, source_chat_id);
+                -- Информация о чатах (chat_info): тип и username
+                CREATE TABLE IF NOT EXISTS chats (
+                    chat_id INTEGER PRIMARY KEY,
+                    type TEXT,
+                    username TEXT
+                );
+                CREATE TABLE IF NOT EXISTS sections (
+                    name TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS meta (
+                    name TEXT PRIMARY KEY,
+                    value TEXT
+                );
+                """
+            )
+        return self.conn
+
+    def _transaction(self):
+        """
+        Начинает транзакцию с блокировкой записи (BEGIN IMMEDIATE): чтение
+        текущего состояния и изменения видят одну и ту же версию базы.
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        return conn
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    # --- Чтение ---
+
+    def is_empty(self) -> bool:
+        return self._connection().execute("SELECT 1 FROM sources LIMIT 1").fetchone() is None
+
+    def load(self):
+        """
+        Загружает конфигурацию пересылки: по строке на исходный чат
+        и информацию только о чатах из маршрутов.
+
+        Returns:
+            tuple: (SOURCE_CHAT_IDS, FORWARDING_CONFIG, chat_info)
+        """
+        conn = self._connection()
+        rows = conn.execute(
+            "SELECT source_chat_id, position, dest_chat_ids FROM sources "
+            "ORDER BY position IS NULL, position, source_chat_id"
+        ).fetchall()
+        source_ids = [source_id for source_id, position, _ in rows if position is not None]
+        forwarding_config = {}
+        for source_id, _, dest_chat_ids in rows:
+            dest_ids = _unpack_ids(dest_chat_ids)
+            if dest_ids:
+                forwarding_config[source_id] = dest_ids
+        # Участие чата в маршрутах проверяется в SQLite поиском по ключам
+        # sources и routes и по индексу routes_by_dest
+        chat_info = {
+            chat_id: _chat_info_entry(chat_type, username)
+            for chat_id, chat_type, username in conn.execute(
+                "SELECT chat_id, type, username FROM chats AS c WHERE "
+                "EXISTS (SELECT 1 FROM routes WHERE dest_chat_id = c.chat_id) "
+                "OR EXISTS (SELECT 1 FROM routes WHERE source_chat_id = c.chat_id) "
+                "OR EXISTS (SELECT 1 FROM sources WHERE source_chat_id = c.chat_id "
+                "AND position IS NOT NULL)"
+            )
+        }
+        return source_ids, forwarding_config, chat_info
+
+    def destinations(self, source_chat_id):
+        row = self._connection().execute(
+            "SELECT dest_chat_ids FROM sources WHERE source_chat_id = ?", (source_chat_id,)
+        ).fetchone()
+        return _unpack_ids(row[0]) if row else []
+
+    def sources_of(self, dest_chat_id):
+        """
+        Исходные чаты, пересылающие в чат назначения (поиск по индексу routes_by_dest).
+        """
+        return [
+            row[0]
+            for row in self._connection().execute(
+                "SELECT source_chat_id FROM routes WHERE dest_chat_id = ?",
+                (dest_chat_id,),
+            )
+        ]
+
+    def section(self, name):
+        row = self._connection().execute(
+            "SELECT value FROM sections WHERE name = ?", (name,)
+        ).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    # --- Изменения (каждый метод — одна транзакция) ---
+
+    def _write_source(self, conn, source_id, position, dest_ids, old_dest_ids):
+        """
+        Записывает строку источника и меняет только затронутые пары в routes.
+        """
+        if position is None and not dest_ids:
+            conn.execute("DELETE FROM sources WHERE source_chat_id = ?", (source_id,))
+        else:
+            conn.execute(
+                "INSERT OR REPLACE INTO sources (source_chat_id, position, dest_chat_ids) "
+                "VALUES (?, ?, ?)",
+                (source_id, position, _pack_ids(dest_ids)),
+            )
+        old, new = set(old_dest_ids), set(dest_ids)
+        conn.executemany(
+            "DELETE FROM routes WHERE source_chat_id = ? AND dest_chat_id = ?",
+            [(source_id, d) for d in old - new],
+        )
+        conn.executemany(
+            "INSERT INTO routes (source_chat_id, dest_chat_id) VALUES (?, ?)",
+            [(source_id, d) for d in new - old],
+        )
+
+    def _replace_rows(self, conn, source_ids, forwarding_config):
+        current = {
+            source_id: (position, _unpack_ids(dest_chat_ids))
+            for source_id, position, dest_chat_ids in conn.execute(
+                "SELECT source_chat_id, position, dest_chat_ids FROM sources"
+            )
+        }
+        positions = {source_id: i for i, source_id in enumerate(dict.fromkeys(source_ids))}
+        changes = 0
+        for source_id in current.keys() | positions.keys() | forwarding_config.keys():
+            position = positions.get(source_id)
+            dest_ids = list(dict.fromkeys(forwarding_config.get(source_id, ())))
+            old = current.get(source_id, (None, []))
+            if old != (position, dest_ids):
+                self._write_source(conn, source_id, position, dest_ids, old[1])
+                changes += 1
+        return changes
+
+    def _upsert_chat_info(self, conn, chat_info):
+        if not chat_info:
+            return 0
+        current = {
+            chat_id: (chat_type, username)
+            for chat_id, chat_type, username in conn.execute(
+                "SELECT chat_id, type, username FROM chats"
+            )
+        }
+        changed = []
+        for chat_id, info in chat_info.items():
+            row = (info.get("type"), info.get("username"))
+            if current.get(int(chat_id)) != row:
+                changed.append((int(chat_id),) + row)
+        conn.executemany(
+            "INSERT OR REPLACE INTO chats (chat_id, type, username) VALUES (?, ?, ?)", changed
+        )
+        return len(changed)
+
+    def _replace_sections(self, conn, sections):
+        changes = 0
+        for name in SECTION_NAMES:
+            value = sections.get(name)
+            row = conn.execute("SELECT value FROM sections WHERE name = ?", (name,)).fetchone()
+            encoded = json.dumps(value, ensure_ascii=False, sort_keys=True) if value else None
+            if (row[0] if row else None) == encoded:
+                continue
+            if encoded is None:
+                conn.execute("DELETE FROM sections WHERE name = ?", (name,))
+            else:
+                conn.execute(
+                    "INSERT OR REPLACE INTO sections (name, value) VALUES (?, ?)", (name, encoded)
+                )
+            changes += 1
+        return changes
+
+    def replace(self, source_ids, forwarding_config, chat_info=None, sections=None) -> int:
+        """
+        Заменяет конфигурацию новой, изменяя только отличающиеся строки.
+        Разделы (ROUTE_WEIGHTS, ROUTE_RULES) меняются, только если переданы.
+        Возвращает число изменённых строк.
+        """
+        conn = self._transaction()
+        try:
+            changes = self._replace_rows(conn, source_ids, forwarding_config)
+            changes += self._upsert_chat_info(conn, chat_info)
+            if sections is not None:
+                changes += self._replace_sections(conn, sections)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return changes
+
+    def remove_chats(self, chat_ids, chat_info=None) -> int:
+        """
+        Удаляет чаты из маршрутов (как исходные, так и чаты назначения)
+        и обновляет информацию о чатах. Затронутые источники находятся по
+        индексу routes_by_dest, остальные маршруты не перезаписываются,
+        поэтому рабочие процессы разных шард могут вызывать это одновременно.
+        """
+        chat_ids = set(chat_ids)
+        conn = self._transaction()
+        try:
+            affected = set()
+            for chat_id in chat_ids:
+                affected.update(
+                    row[0]
+                    for row in conn.execute(
+                        "SELECT source_chat_id FROM routes WHERE dest_chat_id = ?", (chat_id,)
+                    )
+                )
+            affected.update(chat_ids)
+            changes = 0
+            for source_id in affected:
+                row = conn.execute(
+                    "SELECT position, dest_chat_ids FROM sources WHERE source_chat_id = ?",
+                    (source_id,),
+                ).fetchone()
+                if row is None:
+                    continue
+                position, old_dest_ids = row[0], _unpack_ids(row[1])
+                if source_id in chat_ids:
+                    position, dest_ids = None, []
+                else:
+                    dest_ids = [d for d in old_dest_ids if d not in chat_ids]
+                self._write_source(conn, source_id, position, dest_ids, old_dest_ids)
+                changes += 1
+            changes += self._upsert_chat_info(conn, chat_info)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return changes
+
+    def clear(self):
+        conn = self._transaction()
+        try:
+            for table in ("sources", "routes", "chats", "sections", "meta"):
+                conn.execute(f"DELETE FROM {table}")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    # --- Импорт и экспорт JSON ---
+
+    def _synced_digest(self, path):
+        row = self._connection().execute(
+            "SELECT value FROM meta WHERE name = ?", ("digest:" + os.path.abspath(path),)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _set_synced_digest(self, path, digest):
+        # Хеш запоминается для каждого файла: выгрузка в резервную копию
+        # не влияет на синхронизацию с forward_config.json
+        self._connection().execute(
+            "INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)",
+            ("digest:" + os.path.abspath(path), digest),
+        )
+
+    def import_json(self, path) -> int:
+        """
+        Импортирует конфигурацию из файла в формате forward_config.json.
+        Ошибки формата — ValueError (json.JSONDecodeError — его подкласс).
+        """
+        with open(path, "rb") as f:
+            data = f.read()
+        config = json.loads(data)
+        if not isinstance(config, dict):
+            raise ValueError("конфигурация должна быть объектом JSON")
+        source_ids = [int(s) for s in config.get("SOURCE_CHAT_IDS", [])]
+        forwarding_config = {
+            int(s): [int(d) for d in dest_ids]
+            for s, dest_ids in config.get("FORWARDING_CONFIG", {}).items()
+        }
+        chat_info = {int(k): v for k, v in (config.get("CHAT_INFO") or {}).items()}
+        changes = self.replace(
+            source_ids,
+            forwarding_config,
+            chat_info,
+            {name: config.get(name) for name in SECTION_NAMES},
+        )
+        self._set_synced_digest(path, hashlib.sha256(data).hexdigest())
+        return changes
+
+    def export_json(self, path):
+        """
+        Атомарно записывает конфигурацию в файл в формате forward_config.json.
+        """
+        source_ids, forwarding_config, chat_info = self.load()
+        config = {"SOURCE_CHAT_IDS": source_ids, "FORWARDING_CONFIG": forwarding_config}
+        if chat_info:
+            config["CHAT_INFO"] = chat_info
+        for name in SECTION_NAMES:
+            section = self.section(name)
+            if section:
+                config[name] = section
+        data = json.dumps(config, indent=4, ensure_ascii=False).encode()
+
+        # Временный файл уникален: базу делят рабочие процессы супервизора,
+        # и они могут выгружать конфигурацию одновременно
+        fd, tmp_file = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(path)),
+            prefix=os.path.basename(path) + ".",
+            suffix=".tmp",
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            # mkstemp создаёт файл с правами 0600, а файл конфигурации
+            # правят вручную — сохраняем права прежнего файла
+            try:
+                mode = os.stat(path).st_mode & 0o777
+            except FileNotFoundError:
+                mode = 0o644
+            os.chmod(tmp_file, mode)
+            os.replace(tmp_file, path)
+        except BaseException:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+        self._set_synced_digest(path, hashlib.sha256(data).hexdigest())
+
+    def sync_from_json(self, path) -> bool:
+        """
+        Подхватывает ручные изменения forward_config.json: импортирует файл,
+        если его содержимое отличается от последнего импорта или экспорта.
+        База — основное хранилище маршрутов, поэтому пропавший файл (случайное
+        удаление, не тот том) ничего не стирает: он выгружается из базы заново.
+        Очистить базу можно только явно: python -m src.route_store clear.
+
+        Returns:
+            bool: изменилась ли база
+        """
+        digest = _file_digest(path)
+        if digest is None:
+            if not self.is_empty():
+                self.export_json(path)
+            return False
+        if digest == self._synced_digest(path):
+            return False
+        return self.import_json(path) > 0
+
+# Глобальное хранилище маршрутов
+route_store = RouteStore(ROUTE_STORE_FILE)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Импорт, экспорт и очистка базы маршрутов (формат forward_config.json)"
+    )
+    parser.add_argument("command", choices=("import", "export", "clear"))
+    parser.add_argument("path", nargs="?", default=settings.bot_chats_config_file)
+    args = parser.parse_args()
+
+    if args.command == "clear":
+        # Вместе с базой удаляется и файл, иначе при запуске он импортируется снова
+        route_store.clear()
+        print("База маршрутов очищена")
+        if os.path.exists(args.path):
+            os.remove(args.path)
+            print(f"Файл {args.path} удалён")
+    elif args.command == "import":
+        changes = route_store.import_json(args.path)
+        print(f"Импортировано из {args.path}, изменено строк: {changes}")
+    else:
+        route_store.export_json(args.path)
+        print(f"Конфигурация выгружена в {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+# src/routing.py
+
+from .logger import get_logger
+from .rules import compile_rules
+
+
+logger = get_logger("routing")
+
+
+class RouteEntry:
+    """
+    Маршрут одного исходного чата: кортеж чатов назначения,
+    заранее сформированный префикс, информация о чате и скомпилированные
+    правила маршрутов (SourceRules, None — пересылать всё).
+    """
+
+    __slots__ = ("source_chat_id", "dest_chat_ids", "prefix", "chat_info", "rules")
+
+    def __init__(self, source_chat_id, dest_chat_ids, prefix, chat_info, rules=None):
+        self.source_chat_id = source_chat_id
+        self.dest_chat_ids = dest_chat_ids
+        self.prefix = prefix
+        self.chat_info = chat_info
+        self.rules = rules
+
+
+def build_prefix(source_chat_id, chat_info=None):
+    """
+    Формирует префикс «📨 Переслано из: ...» для fallback-копирования
+    """
+    source_chat_info = ""
+    if chat_info and source_chat_id in chat_info:
+        # например, chat_info[123123] = {"username": "some_channel", "type": "channel"}
+        if "username" in chat_info[source_chat_id]:
+            source_chat_info = f"@{chat_info[source_chat_id]['username']}"
+        elif "type" in chat_info[source_chat_id]:
+            source_chat_info = f"{chat_info[source_chat_id]['type']} {source_chat_id}"
+
+    if not source_chat_info:
+        source_chat_info = f"Чат {source_chat_id}"
+
+    return f"📨 Переслано из: {source_chat_info}\n\n"
+
+
+def find_cycles(forwarding_config):
+    """
+    Ищет петли в графе маршрутов {источник: [назначения]} (A→B→A,
+    в том числе чат, пересылающий сам в себя). Ищутся компоненты сильной
+    связности (алгоритм Тарьяна без рекурсии); для каждой возвращается
+    один пример петли.
+
+    Returns:
+        list: петли в виде списков ID чатов [A, B, ..., A]
+    """
+    graph = {source: list(dict.fromkeys(dests)) for source, dests in forwarding_config.items()}
+    index = {}  # {чат: порядковый номер обхода}
+    lowlink = {}
+    on_stack = set()
+    stack = []
+    components = []
+
+    for root in graph:
+        if root in index:
+            continue
+        work = [(root, iter(graph.get(root, ())))]
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, successors = work[-1]
+            for succ in successors:
+                if succ not in index:
+                    index[succ] = lowlink[succ] = len(index)
+                    stack.append(succ)
+                    on_stack.add(succ)
+                    work.append((succ, iter(graph.get(succ, ()))))
+                    break
+                if succ in on_stack:
+                    lowlink[node] = min(lowlink[node], index[succ])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    if len(component) > 1 or node in graph.get(node, ()):
+                        components.append(component)
+
+    cycles = []
+    for component in components:
+        members = set(component)
+        start = min(component)
+        # Кратчайший путь по компоненте от start обратно к start
+        previous = {}
+        frontier = [start]
+        while start not in previous:
+            next_frontier = []
+            for node in frontier:
+                for succ in graph.get(node, ()):
+                    if succ in members and succ not in previous:
+                        previous[succ] = node
+                        next_frontier.append(succ)
+            frontier = next_frontier
+        path = [start]
+        node = previous[start]
+        while node != start:
+            path.append(node)
+            node = previous[node]
+        path.append(start)
+        cycles.append(path[::-1])
+    return cycles
+
+
+def report_cycles(forwarding_config):
+    """
+    Проверяет конфигурацию на петли маршрутов и сообщает о каждой.
+    Пересылка не останавливается: эхо собственных пересылок отбрасывает
+    кэш происхождения (provenance_cache), но петля тратит лимиты отправки.
+    """
+    cycles = find_cycles(forwarding_config)
+    for cycle in cycles:
+        logger.error(
+            "Петля в маршрутах пересылки",
+            key="config.cycle",
+            chats=" → ".join(str(chat_id) for chat_id in cycle),
+        )
+    return cycles
+
+
+class RoutingTable:
+    """
+    Неизменяемая таблица маршрутизации, собираемая один раз из
+    FORWARDING_CONFIG и chat_info. На каждое обновление приходится
+    один поиск в словаре вместо сборки множества и префикса.
+    При изменении конфигурации таблица не меняется, а целиком
+    заменяется новой (set_routing_table).
+    Веса маршрутов ({(источник, назначение): вес}) задают долю чата
+    назначения, которую получает источник при честной очереди доставки.
+    Правила маршрутов ({(источник, назначение): правило} из ROUTE_RULES)
+    компилируются здесь же, по одному набору на исходный чат.
+    """
+
+    __slots__ = ("routes", "weights", "rules")
+
+    def __init__(self, forwarding_config, chat_info=None, weights=None, rules=None):
+        chat_info = chat_info or {}
+        self.weights = dict(weights or {})
+        self.rules = dict(rules or {})
+        compiled = compile_rules(self.rules)
+        self.routes = {
+            source_chat_id: RouteEntry(
+                source_chat_id,
+                # Убираем повторы, сохраняя порядок чатов назначения
+                tuple(dict.fromkeys(dest_chat_ids)),
+                build_prefix(source_chat_id, chat_info),
+                chat_info.get(source_chat_id),
+                compiled.get(source_chat_id),
+            )
+            for source_chat_id, dest_chat_ids in forwarding_config.items()
+            if dest_chat_ids
+        }
+
+    def get(self, source_chat_id):
+        return self.routes.get(source_chat_id)
+
+    def weight(self, source_chat_id, dest_chat_id):
+        return self.weights.get((source_chat_id, dest_chat_id), 1.0)
+
+    def __contains__(self, source_chat_id):
+        return source_chat_id in self.routes
+
+    def __len__(self):
+        return len(self.routes)
+
+    @property
+    def source_chat_ids(self):
+        return list(self.routes)
+
+    def without_destinations(self, dest_chat_ids):
+        """
+        Возвращает новую таблицу без указанных чатов назначения
+        (источники, у которых не осталось назначений, удаляются).
+        """
+        table = RoutingTable.__new__(RoutingTable)
+        table.routes = {}
+        table.weights = self.weights
+        table.rules = self.rules
+        for source_chat_id, route in self.routes.items():
+            dests = tuple(d for d in route.dest_chat_ids if d not in dest_chat_ids)
+            if dests:
+                table.routes[source_chat_id] = RouteEntry(
+                    source_chat_id, dests, route.prefix, route.chat_info, route.rules
+                )
+        return table
+
+
+# Текущая таблица маршрутизации (заменяется целиком)
+_routing_table = RoutingTable({})
+
+
+def get_routing_table():
+    return _routing_table
+
+
+def set_routing_table(table: RoutingTable):
+    """
+    Атомарно заменяет текущую таблицу маршрутизации.
+    """
+    global _routing_table
+    _routing_table = table.without_destinations(_quarantined) if _quarantined else table
+
+
+# Чаты назначения, в которые уже была успешная отправка
+_confirmed = set()
+# Чаты назначения, исключённые из маршрутизации после неудачной первой отправки
+_quarantined = set()
+
+
+def confirm_destination(dest_chat_id):
+    _confirmed.add(dest_chat_id)
+
+
+def is_confirmed(dest_chat_id):
+    return dest_chat_id in _confirmed
+
+
+def is_quarantined(dest_chat_id):
+    return dest_chat_id in _quarantined
+
+
+def quarantine_destination(dest_chat_id):
+    """
+    Исключает чат назначения из маршрутизации (без ожидания проверки чатов).
+    """
+    global _routing_table
+    _quarantined.add(dest_chat_id)
+    _routing_table = _routing_table.without_destinations({dest_chat_id})
+
+
+def quarantined_destinations():
+    return set(_quarantined)
+
+
+def release_quarantine(dest_chat_ids):
+    """
+    Возвращает чаты в маршрутизацию (вступит в силу при следующей set_routing_table).
+    """
+    _quarantined.difference_update(dest_chat_ids)
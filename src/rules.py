@@ -0,0 +1,310 @@
+# src/rules.py
+
+import re
+
+from .metrics import ROUTE_LABELS, registry
+
+
+# Поля правила маршрута в ROUTE_RULES
+RULE_LIST_FIELDS = (
+    "keywords",
+    "exclude_keywords",
+    "regex",
+    "exclude_regex",
+    "hashtags",
+    "exclude_hashtags",
+    "media",
+    "exclude_media",
+)
+RULE_FIELDS = RULE_LIST_FIELDS + ("forwarded",)
+
+# Символ, не входящий в слово: на нём может закончиться более короткое ключевое слово
+NON_WORD_CHAR = re.compile(r"\W")
+
+filtered_total = registry.counter(
+    "forwarder_rules_filtered_total",
+    "Сообщения, не отправленные в чат назначения по правилам маршрута",
+    ROUTE_LABELS,
+)
+
+
+def _normalize_keyword(keyword) -> str:
+    # Ключевые слова сравниваются без учёта регистра, любые пробелы — как один
+    return " ".join(str(keyword).lower().split())
+
+
+def _normalize_hashtag(hashtag) -> str:
+    tag = _normalize_keyword(hashtag).lstrip("#")
+    return f"#{tag}" if tag else ""
+
+
+def normalize_rule(raw) -> dict:
+    """
+    Проверяет правило маршрута и приводит его к единому виду
+    (нормализованное правило можно сравнивать при перезагрузке конфигурации).
+    Неизвестные поля и некорректные регулярные выражения — ValueError.
+    """
+    if not isinstance(raw, dict):
+        raise ValueError("правило должно быть объектом")
+    unknown = set(raw) - set(RULE_FIELDS)
+    if unknown:
+        raise ValueError(f"неизвестные поля: {', '.join(sorted(unknown))}")
+
+    rule = {}
+    for field in RULE_LIST_FIELDS:
+        values = raw.get(field) or []
+        if isinstance(values, str):
+            values = [values]
+        if field in ("regex", "exclude_regex"):
+            for pattern in values:
+                try:
+                    re.compile(pattern)
+                except (re.error, TypeError) as e:
+                    raise ValueError(f"некорректное регулярное выражение {pattern!r}: {e}")
+            values = [str(v) for v in values]
+        elif field in ("hashtags", "exclude_hashtags"):
+            values = [_normalize_hashtag(v) for v in values]
+        else:
+            values = [_normalize_keyword(v) for v in values]
+        values = list(dict.fromkeys(v for v in values if v))
+        if values:
+            rule[field] = values
+
+    forwarded = raw.get("forwarded")
+    if forwarded is not None:
+        if not isinstance(forwarded, bool):
+            raise ValueError("forwarded должно быть true или false")
+        rule["forwarded"] = forwarded
+    return rule
+
+
+def _trie_pattern(words) -> str:
+    """
+    Регулярное выражение-префиксное дерево для набора слов: общие начала
+    слов проверяются один раз, поэтому поиск почти не зависит от числа слов.
+    Из двух слов с общим началом первым пробуется более длинное.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    # Обход без рекурсии: длинные ключевые фразы не упираются в предел стека
+    def render(node):
+        stack = [(node, None)]
+        results = {}
+        while stack:
+            current, branches = stack.pop()
+            if branches is None:
+                # Сначала собираем выражения потомков, затем самого узла
+                branches = [(ch, sub) for ch, sub in sorted(current.items()) if ch]
+                stack.append((current, branches))
+                stack.extend((sub, None) for _, sub in branches)
+                continue
+            parts = [
+                (r"\s+" if ch == " " else re.escape(ch)) + results.pop(id(sub))
+                for ch, sub in branches
+            ]
+            if not parts:
+                body = ""
+            elif len(parts) == 1:
+                body = parts[0]
+            else:
+                body = "(?:" + "|".join(parts) + ")"
+            if "" in current and body:
+                body = f"(?:{body})?"
+            results[id(current)] = body
+        return results[id(node)]
+
+    return render(trie)
+
+
+def message_kind(message) -> str:
+    """
+    Вид сообщения для правил media/exclude_media: text, photo, video и т.д.
+    """
+    if not message.media:
+        return "text"
+    return str(getattr(message.media, "value", message.media))
+
+
+def is_forward(message) -> bool:
+    return bool(
+        getattr(message, "forward_date", None)
+        or getattr(message, "forward_from", None)
+        or getattr(message, "forward_from_chat", None)
+        or getattr(message, "forward_sender_name", None)
+    )
+
+
+class RouteFilter:
+    """
+    Условия одного маршрута, не связанные с текстом (вид медиа, пересланное
+    ли сообщение), и его бит в масках совпадений SourceRules.
+    """
+
+    __slots__ = ("dest_chat_id", "bit", "has_include", "media", "exclude_media", "forwarded")
+
+    def __init__(self, dest_chat_id, bit, rule):
+        self.dest_chat_id = dest_chat_id
+        self.bit = bit
+        self.has_include = any(
+            field in rule for field in ("keywords", "hashtags", "regex")
+        )
+        self.media = frozenset(rule.get("media", ()))
+        self.exclude_media = frozenset(rule.get("exclude_media", ()))
+        self.forwarded = rule.get("forwarded")
+
+
+class SourceRules:
+    """
+    Правила всех маршрутов одного исходного чата, скомпилированные при
+    загрузке конфигурации.
+
+    Ключевые слова и хэштеги всех маршрутов собраны в одно регулярное
+    выражение-префиксное дерево: один проход по тексту находит все
+    встретившиеся слова (целиком, без учёта регистра), а словарь
+    {слово: маски маршрутов} сразу даёт, каким маршрутам они важны.
+    Регулярные выражения маршрутов объединены в одно; по отдельности они
+    проверяются, только если объединённое что-то нашло.
+
+    Правило проходит, если не совпало ни одно исключающее условие и
+    (если заданы keywords/hashtags/regex) совпало хотя бы одно из них.
+    """
+
+    def __init__(self, source_chat_id, rules: dict):
+        self.source_chat_id = source_chat_id
+        self.filters = []
+        self.keywords = {}  # {слово: [маска include, маска exclude]}
+        patterns = {}  # {регулярное выражение: [маска include, маска exclude]}
+
+        for index, (dest_chat_id, rule) in enumerate(rules.items()):
+            bit = 1 << index
+            self.filters.append(RouteFilter(dest_chat_id, bit, rule))
+            for field, table in (
+                ("keywords", self.keywords),
+                ("hashtags", self.keywords),
+                ("regex", patterns),
+            ):
+                for value in rule.get(field, ()):
+                    table.setdefault(value, [0, 0])[0] |= bit
+                for value in rule.get("exclude_" + field, ()):
+                    table.setdefault(value, [0, 0])[1] |= bit
+
+        self.keyword_regex = None
+        if self.keywords:
+            # Опережающая проверка находит слова, начинающиеся в каждой позиции
+            # (в том числе перекрывающиеся), а не только непересекающиеся
+            self.keyword_regex = re.compile(
+                r"(?<!\w)(?=(" + _trie_pattern(self.keywords) + r")(?!\w))"
+            )
+
+        # Регулярные выражения — как их написал пользователь: без учёта
+        # регистра они работают только с флагом (?i)
+        self.patterns = [(re.compile(pattern), masks) for pattern, masks in patterns.items()]
+        self.pattern_regex = None
+        if patterns:
+            try:
+                self.pattern_regex = re.compile(
+                    "|".join(f"(?:{pattern})" for pattern in patterns)
+                )
+            except re.error:
+                # Выражения с глобальными флагами или одинаковыми именами групп
+                # не объединяются — тогда они проверяются по отдельности
+                self.pattern_regex = None
+
+    def _match_keywords(self, text):
+        include = exclude = 0
+        keywords = self.keywords
+        for match in self.keyword_regex.finditer(text):
+            found = match.group(1)
+            if NON_WORD_CHAR.search(found) is None:
+                words = (found,)
+            else:
+                found = " ".join(found.split())
+                # Более короткие ключевые слова и фразы, которыми начинается
+                # найденная: в "foo-bar" целиком встречается и "foo"
+                words = [
+                    found[:i]
+                    for i in range(1, len(found))
+                    if not (found[i].isalnum() or found[i] == "_")
+                ]
+                words.append(found)
+            for word in words:
+                masks = keywords.get(word)
+                if masks is not None:
+                    include |= masks[0]
+                    exclude |= masks[1]
+        return include, exclude
+
+    def blocked(self, messages) -> set:
+        """
+        Чаты назначения, в которые сообщение (или альбом) не отправляется.
+        """
+        text = "\n".join(m.text or m.caption or "" for m in messages)
+        include = exclude = 0
+        if text:
+            if self.keyword_regex is not None:
+                include, exclude = self._match_keywords(text.lower())
+            if self.patterns and (
+                self.pattern_regex is None or self.pattern_regex.search(text)
+            ):
+                for regex, masks in self.patterns:
+                    if regex.search(text):
+                        include |= masks[0]
+                        exclude |= masks[1]
+
+        kinds = {message_kind(m) for m in messages}
+        forwarded = any(is_forward(m) for m in messages)
+        blocked = set()
+        for f in self.filters:
+            if (
+                exclude & f.bit
+                or (f.has_include and not include & f.bit)
+                or (f.media and not kinds & f.media)
+                or kinds & f.exclude_media
+                or (f.forwarded is not None and f.forwarded != forwarded)
+            ):
+                blocked.add(f.dest_chat_id)
+        return blocked
+
+
+def compile_rules(route_rules: dict) -> dict:
+    """
+    Компилирует правила маршрутов {(источник, назначение): правило}
+    в {источник: SourceRules}.
+    """
+    by_source = {}
+    for (source_chat_id, dest_chat_id), rule in route_rules.items():
+        if rule:
+            by_source.setdefault(source_chat_id, {})[dest_chat_id] = rule
+    return {
+        source_chat_id: SourceRules(source_chat_id, rules)
+        for source_chat_id, rules in by_source.items()
+    }
+
+
+def route_deliveries(route, messages: list, media_group_id=None):
+    """
+    Раскладывает сообщения по чатам назначения маршрута с учётом его правил.
+    Альбом проверяется целиком, остальные сообщения — по одному.
+
+    Returns:
+        list: [(dest_chat_id, сообщения)] для непустых отправок
+    """
+    rules = route.rules
+    if rules is None:
+        return [(dest_chat_id, messages) for dest_chat_id in route.dest_chat_ids]
+
+    units = [messages] if media_group_id else [[m] for m in messages]
+    per_dest = {dest_chat_id: [] for dest_chat_id in route.dest_chat_ids}
+    for unit in units:
+        blocked = rules.blocked(unit)
+        for dest_chat_id, selected in per_dest.items():
+            if dest_chat_id in blocked:
+                filtered_total.inc((route.source_chat_id, dest_chat_id), len(unit))
+            else:
+                selected.extend(unit)
+    return [(dest_chat_id, selected) for dest_chat_id, selected in per_dest.items() if selected]
@@ -0,0 +1,42 @@
+# src/runtime.py
+
+import asyncio
+
+from .config import settings
+
+
+PERFORMANCE_PROFILE = "performance"
+
+
+def is_performance_profile() -> bool:
+    return settings.runtime_profile == PERFORMANCE_PROFILE
+
+
+def uses_uvloop() -> bool:
+    """
+    True, если текущий цикл событий — uvloop.
+    """
+    return type(asyncio.get_running_loop()).__module__.startswith("uvloop")
+
+
+def install_uvloop() -> bool:
+    """
+    Включает uvloop, если выбран профиль performance и пакет установлен.
+    """
+    if not is_performance_profile():
+        return False
+    try:
+        import uvloop
+    except ImportError:
+        print("uvloop не установлен, используется стандартный цикл событий")
+        return False
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
+
+
+def run(main):
+    """
+    Запускает корутину main() в новом цикле событий выбранного профиля.
+    """
+    install_uvloop()
+    asyncio.run(main())
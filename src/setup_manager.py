@@ -1,14 +1,8 @@
 # src/setup_manager.py
 
-import json
-
 from pyrogram.enums import ChatType
 
-from .config import settings
-
-
-# Файл с конфигурацией пересылки бота
-CONFIG_FILE = settings.bot_chats_config_file
+from .config_manager import save_config
 
 
 async def interactive_setup(app):
@@ -131,19 +125,12 @@ async def interactive_setup(app):
         print(f"Из: {source_name} -> В: {', '.join(dest_names)}")
 
     # Сохраняем конфигурацию в файл для последующего использования
-    save_config = (
+    answer = (
         input("\nСохранить конфигурацию для будущих запусков? (да/нет): ")
         .lower()
         .strip()
     )
-    if save_config in ["да", "д", "yes", "y"]:
-        config = {
-            "SOURCE_CHAT_IDS": SOURCE_CHAT_IDS,
-            "FORWARDING_CONFIG": FORWARDING_CONFIG,
-        }
-
-        with open(CONFIG_FILE, "w", encoding="utf-8") as f:
-            json.dump(config, f, indent=4, ensure_ascii=False)
-        print(f"Конфигурация сохранена в файл {CONFIG_FILE}")
+    if answer in ["да", "д", "yes", "y"]:
+        save_config(SOURCE_CHAT_IDS, FORWARDING_CONFIG)
 
     return SOURCE_CHAT_IDS, FORWARDING_CONFIG
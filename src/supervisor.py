@@ -0,0 +1,279 @@
+# src/supervisor.py
+
+import asyncio
+import os
+import signal
+import sys
+import time
+import zlib
+
+from .config import settings
+from .config_manager import load_saved_config
+from .config_watcher import ConfigWatcher
+from .logger import get_logger, setup_logging, stop_logging
+from .metrics import MetricsRegistry, MetricsServer
+from .routing import report_cycles
+
+
+logger = get_logger("supervisor")
+
+# Скрипт запуска бота (рабочие процессы запускаются им же)
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+
+def shard_of(source_chat_id, shard_count):
+    """
+    Номер шарды исходного чата. Не зависит от порядка чатов в конфигурации
+    и одинаков во всех процессах (в отличие от hash()).
+    """
+    return zlib.crc32(str(source_chat_id).encode()) % shard_count
+
+
+def shard_sources(source_ids, forwarding_config):
+    """
+    Оставляет в конфигурации только исходные чаты своей шарды
+    (в обычном режиме возвращает её без изменений).
+    """
+    if settings.shard_count <= 1:
+        return source_ids, forwarding_config
+    source_ids = [
+        s for s in source_ids if shard_of(s, settings.shard_count) == settings.shard_index
+    ]
+    return source_ids, {s: forwarding_config[s] for s in source_ids if s in forwarding_config}
+
+
+def _add_shard_label(line: str, shard: int) -> str:
+    """
+    Добавляет метку shard к строке с образцом метрики Prometheus.
+    """
+    name_end = line.find("{")
+    if name_end != -1:
+        return f'{line[:name_end + 1]}shard="{shard}",{line[name_end + 1:]}'
+    name, _, value = line.partition(" ")
+    return f'{name}{{shard="{shard}"}} {value}'
+
+
+async def _scrape(port: int, timeout: float = 5):
+    """
+    Забирает метрики рабочего процесса с его локального эндпоинта.
+    """
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection("127.0.0.1", port), timeout
+    )
+    try:
+        writer.write(b"GET /metrics HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n")
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    _, _, body = response.partition(b"\r\n\r\n")
+    return body.decode()
+
+
+class Worker:
+    """
+    Рабочий процесс одной шарды: свой файл сессии, свои файлы состояния
+    и своё подмножество исходных чатов.
+    """
+
+    def __init__(self, index: int, count: int):
+        self.index = index
+        self.count = count
+        self.process = None
+        self.restarts = 0
+        self.task = None
+
+    @property
+    def metrics_port(self):
+        # Рабочие процессы отдают метрики на соседних портах только локально
+        return settings.metrics_port + 1 + self.index if settings.metrics_port else 0
+
+    def environment(self):
+        env = dict(os.environ)
+        env.update(
+            {
+                "WORKER_PROCESSES": "0",
+                "SHARD_INDEX": str(self.index),
+                "SHARD_COUNT": str(self.count),
+                "METRICS_PORT": str(self.metrics_port),
+                "METRICS_HOST": "127.0.0.1",
+            }
+        )
+        return env
+
+    async def run(self, stopping: asyncio.Event):
+        """
+        Запускает процесс и перезапускает его после падения
+        (с растущей паузой, если он падает сразу после старта).
+        """
+        delay = settings.worker_restart_delay
+        while not stopping.is_set():
+            started = time.monotonic()
+            self.process = await asyncio.create_subprocess_exec(
+                sys.executable, MAIN_SCRIPT, env=self.environment()
+            )
+            logger.info("Рабочий процесс запущен", shard=self.index, pid=self.process.pid)
+            code = await self.process.wait()
+            if stopping.is_set():
+                break
+
+            self.restarts += 1
+            if time.monotonic() - started > settings.worker_restart_max_delay:
+                delay = settings.worker_restart_delay
+            logger.error(
+                "Рабочий процесс завершился, перезапуск",
+                shard=self.index,
+                code=code,
+                delay=delay,
+            )
+            try:
+                await asyncio.wait_for(stopping.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            delay = min(delay * 2, settings.worker_restart_max_delay)
+
+    def send_signal(self, signum):
+        if self.process is not None and self.process.returncode is None:
+            self.process.send_signal(signum)
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.returncode is None
+
+
+class Supervisor:
+    """
+    Делит исходные чаты между N рабочими процессами (по CRC32 ID чата),
+    перезапускает упавшие процессы, не трогая остальные, рассылает им
+    изменения конфигурации (SIGHUP) и собирает их метрики в один эндпоинт.
+    """
+
+    def __init__(self, count: int):
+        self.workers = [Worker(i, count) for i in range(count)]
+        self.stopping = asyncio.Event()
+        self.registry = MetricsRegistry()
+        self.registry.gauge(
+            "forwarder_supervisor_worker_up",
+            "Рабочий процесс шарды запущен (1/0)",
+            lambda: {(w.index,): int(w.alive) for w in self.workers},
+            ("shard",),
+        )
+        self.registry.gauge(
+            "forwarder_supervisor_worker_restarts",
+            "Перезапуски рабочего процесса шарды",
+            lambda: {(w.index,): w.restarts for w in self.workers},
+            ("shard",),
+        )
+
+    async def distribute_config(self):
+        """
+        Передаёт изменение конфигурации всем рабочим процессам:
+        каждый перечитывает файл и берёт свою часть исходных чатов.
+        Петли маршрутов проверяются здесь, по полной конфигурации
+        (рабочий процесс видит только свою шарду).
+        """
+        has_config, _, forwarding_config, _ = load_saved_config()
+        if has_config:
+            report_cycles(forwarding_config)
+        for worker in self.workers:
+            worker.send_signal(signal.SIGHUP)
+        logger.info(
+            "Изменение конфигурации передано рабочим процессам", workers=len(self.workers)
+        )
+
+    async def render_metrics(self):
+        """
+        Метрики супервизора и всех рабочих процессов (с меткой shard).
+        Образцы одной метрики из разных процессов идут подряд под общими
+        строками HELP/TYPE, как того требует формат Prometheus.
+        """
+        results = await asyncio.gather(
+            *(_scrape(w.metrics_port) for w in self.workers), return_exceptions=True
+        )
+        families = {}  # {имя метрики: [строки HELP/TYPE, образцы...]}
+        for worker, text in zip(self.workers, results):
+            if isinstance(text, Exception):
+                continue
+            family = None
+            for line in text.splitlines():
+                if line.startswith("# HELP ") or line.startswith("# TYPE "):
+                    name = line.split(" ", 3)[2]
+                    family = families.setdefault(name, [])
+                    if line not in family:
+                        family.append(line)
+                elif line and family is not None:
+                    family.append(_add_shard_label(line, worker.index))
+        lines = [self.registry.render().rstrip("\n")]
+        for family in families.values():
+            lines.extend(family)
+        lines.append("")
+        return "\n".join(lines)
+
+    def stop(self):
+        self.stopping.set()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, self.stop)
+
+        config_watcher = ConfigWatcher(settings.bot_chats_config_file, self.distribute_config)
+        config_watcher.start()
+
+        metrics_server = None
+        if settings.metrics_port:
+            metrics_server = MetricsServer(
+                settings.metrics_host, settings.metrics_port, render=self.render_metrics
+            )
+            await metrics_server.start()
+
+        for worker in self.workers:
+            worker.task = asyncio.create_task(worker.run(self.stopping))
+
+        await self.stopping.wait()
+        logger.info("Остановка рабочих процессов")
+
+        for worker in self.workers:
+            worker.send_signal(signal.SIGTERM)
+        _, pending = await asyncio.wait(
+            [w.task for w in self.workers], timeout=settings.worker_stop_timeout
+        )
+        for worker in self.workers:
+            if worker.alive:
+                logger.warning(
+                    "Рабочий процесс не остановился, завершаем принудительно",
+                    shard=worker.index,
+                )
+                worker.process.kill()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+        await config_watcher.stop()
+        if metrics_server is not None:
+            await metrics_server.stop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.remove_signal_handler(signum)
+
+
+async def run_supervisor():
+    """
+    Точка входа режима супервизора (WORKER_PROCESSES > 1).
+    """
+    setup_logging()
+    has_config, source_ids, forwarding_config, _ = load_saved_config()
+    if not has_config:
+        print(
+            "Режим супервизора требует готовой конфигурации пересылки: "
+            "сначала запустите бота в обычном режиме (WORKER_PROCESSES=0)."
+        )
+        stop_logging()
+        return
+
+    count = settings.worker_processes
+    shard_sizes = [0] * count
+    for source_id in source_ids:
+        shard_sizes[shard_of(source_id, count)] += 1
+    logger.info("Запуск в режиме супервизора", workers=count, sources_per_shard=shard_sizes)
+    report_cycles(forwarding_config)
+
+    await Supervisor(count).run()
+    stop_logging()
@@ -1,4 +1,4 @@
 #!/bin/bash
 
-# Запускаем приложение
-python /app/main.py
+# Запускаем приложение (exec — чтобы SIGTERM от docker stop получил сам бот)
+exec python /app/main.py